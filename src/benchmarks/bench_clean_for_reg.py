@@ -0,0 +1,69 @@
+# Benchmark of the vectorised clean_for_reg against the original row-wise version
+# Run from the src directory with: python -m benchmarks.bench_clean_for_reg
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+
+# Timing
+import time
+
+# The custom package
+from macro_utils import functions as rent
+
+
+## The original implementation, kept here as the baseline
+def clean_for_reg_rowwise(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df["price_per_bed"] = df.apply(
+        lambda row: row["price_per_bed"] * 52 / 12 if row["priceFrequency"] == "weekly" else row["price_per_bed"],
+        axis=1
+    )
+    reg_data = df[df["priceFrequency"].isin(["monthly", "weekly"])]
+    reg_data = reg_data[pd.to_numeric(reg_data["travel_time"], errors="coerce").between(60, 5400)]
+    reg_data = reg_data[pd.to_numeric(reg_data["bathrooms"], errors="coerce").between(1, 6)]
+    reg_data = reg_data[pd.to_numeric(reg_data["price_per_bed"], errors="coerce").between(100, 10000)]
+    return reg_data
+
+
+## Make a random property table of a given size
+def make_properties(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "bathrooms": rng.integers(0, 8, n),
+        "travel_time": rng.uniform(0, 7000, n),
+        "price_per_bed": rng.uniform(50, 3000, n),
+        "priceFrequency": rng.choice(["monthly", "weekly", "yearly"], n, p=[0.7, 0.25, 0.05]),
+        "displayAddress": rng.choice(["Flat A, London", "Flat B, London"], n),
+    })
+
+
+## Time a function, taking the best of a few repeats
+def best_time(func, df: pd.DataFrame, repeats: int = 3) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(df)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(sizes=(10_000, 100_000, 1_000_000)):
+    for n in sizes:
+        df = make_properties(n)
+        # check that both versions give the same answer
+        expected = clean_for_reg_rowwise(df)
+        result = rent.clean_for_reg(df)
+        pd.testing.assert_frame_equal(result, expected)
+
+        rowwise = best_time(clean_for_reg_rowwise, df, repeats=1)
+        vectorised = best_time(rent.clean_for_reg, df)
+        print(f"{n:>9,} rows: row-wise {rowwise:8.3f}s  vectorised {vectorised:8.4f}s  "
+              f"speedup {rowwise / vectorised:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Import-time check for the package: measures how long `import macro_utils.functions`
+# takes in a fresh interpreter (python -X importtime) and fails if it is over budget
+# Run from the src directory with: python -m benchmarks.import_time
+# (the same budgets are checked by tests/test_import_time.py under pytest)
+
+
+# IMPORT PACKAGES
+# Running a fresh interpreter
+import subprocess
+import sys
+import os
+import re
+
+
+# BUDGETS (milliseconds of cumulative import time, best of a few runs)
+BUDGETS_MS = {
+    "macro_utils": 50,
+    "macro_utils.functions": 150,
+}
+
+
+## Cumulative import time of each module, in milliseconds, from one fresh interpreter
+def import_times(module: str) -> dict:
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=src_dir, check=True,
+    )
+    # lines look like "import time:   self [us] | cumulative | imported package"
+    times = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|\s+(.+)$", line)
+        if match:
+            times[match.group(3).strip()] = int(match.group(2)) / 1000
+    return times
+
+
+## Best cumulative import time of a module over a few runs
+def best_import_time(module: str, repeats: int = 3) -> float:
+    return min(import_times(module)[module] for _ in range(repeats))
+
+
+def main(budgets: dict = BUDGETS_MS) -> int:
+    failed = 0
+    for module, budget in budgets.items():
+        elapsed = best_import_time(module)
+        status = "ok" if elapsed <= budget else "OVER BUDGET"
+        print(f"{module:<25} {elapsed:8.1f} ms  (budget {budget} ms)  {status}")
+        failed += elapsed > budget
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
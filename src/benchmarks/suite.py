@@ -0,0 +1,331 @@
+# Benchmark suite for the macro_utils hot paths, on seeded synthetic data (benchmarks.synthetic)
+#
+# Run from the src directory with, e.g.:
+#   python -m benchmarks.suite                                   # default sizes, results to benchmarks/results/
+#   python -m benchmarks.suite --sizes 10000 1000000 --only clean_for_reg find_underpriced
+#   python -m benchmarks.suite --save-baseline                   # record this run as the baseline
+#   python -m benchmarks.suite --baseline benchmarks/results/baseline.json --threshold 0.25
+#
+# Each result is the best of --repeats runs. Against a baseline, a benchmark more than
+# --threshold slower (default 25%) counts as a regression and the run exits with status 1.
+# The Postgres write benchmarks run against BENCH_POSTGRES_DSN (e.g. a local docker
+# postgres) and are recorded as skipped when it isn't set.
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+
+# Timing and recording results
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+# The mock HTTP server
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# File and System Operations
+import os
+import sys
+
+# The custom package
+from macro_utils import functions as rent
+from macro_utils import sql_queries as sqlq
+from macro_utils import growth
+
+# The synthetic data
+from benchmarks import synthetic
+
+
+# DIRECTORY SETUP
+current_dir = os.path.dirname(os.path.abspath(__file__))
+results_folder_path = os.path.join(current_dir, "results")
+baseline_file_path = os.path.join(results_folder_path, "baseline.json")
+
+## Default settings
+SIZES = [10_000, 100_000]
+REPEATS = 3
+THRESHOLD = 0.25
+# listings per page and pages per location served by the mock search API
+MOCK_RESULT_COUNT = 1000
+
+
+# TIMING
+
+## Best wall time of a function over a few runs, with a fresh setup before each
+def measure(func, setup=None, repeats: int = REPEATS) -> float:
+    times = []
+    for _ in range(repeats):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# THE MOCK SEARCH API
+
+## Serves pre-encoded rightmove-style search pages from a local HTTP server
+class MockSearchServer:
+    """
+    A threaded HTTP server on localhost answering /api/_search with pages of synthetic
+    listings (RESULTS_PER_PAGE per page, MOCK_RESULT_COUNT results per location).
+    Use as a context manager; `url` is the server's base url.
+    """
+
+    def __init__(self, result_count: int = MOCK_RESULT_COUNT, seed: int = 0):
+        listings = synthetic.make_raw_listings(result_count, seed)
+        for i, listing in enumerate(listings):
+            listing["id"] = i  # unique ids, so the crawler keeps every listing
+        per_page = rent.RESULTS_PER_PAGE
+        # encode every page once, so the server isn't what's being measured
+        self.pages = {
+            offset: json.dumps({
+                "resultCount": f"{result_count:,}",
+                "properties": listings[offset:offset + per_page],
+            }, default=str).encode()
+            for offset in range(0, result_count, per_page)
+        }
+        pages = self.pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                body = pages.get(int(query.get("index", ["0"])[0]), b'{"properties": []}')
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+## Point the crawler at the mock server for the duration of a block
+@contextlib.contextmanager
+def mock_search_api(server: MockSearchServer):
+    original = rent.make_search_url
+    rent.make_search_url = lambda location_id, offset: original(location_id, offset).replace(
+        "https://www.rightmove.co.uk", server.url)
+    try:
+        yield
+    finally:
+        rent.make_search_url = original
+
+
+## Scrape the mock API for a few locations, with a fresh client (and event loop) each run
+def scrape_mock(n_locations: int, total_results: int = MOCK_RESULT_COUNT):
+    async def crawl():
+        rent.client = rent.httpx.AsyncClient()
+        try:
+            limiter = rent.RateLimiter(rate=10_000, burst=10_000, max_concurrency=16)
+            seen = [set() for _ in range(n_locations)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                await asyncio.gather(*[
+                    rent.scrape_search(f"REGION^{i}", total_results, limiter, seen_ids=seen[i])
+                    for i in range(n_locations)
+                ])
+        finally:
+            await rent.client.aclose()
+            del rent.client
+    asyncio.run(crawl())
+
+
+# THE BENCHMARKS
+
+## SQL write paths against one engine
+def sql_benchmarks(engine, clean: pd.DataFrame, repeats: int, tag: str) -> dict:
+    # a narrower table keeps the comparison about the write path rather than string handling
+    rows = clean[["id", "bedrooms", "bathrooms", "latitude", "longitude", "priceAmount",
+                  "price_per_bed", "travel_time", "predicted_price_per_bed"]]
+    half = len(rows) // 2
+
+    def fresh_table():
+        with engine.begin() as conn:
+            conn.execute(sqlq.text("DROP TABLE IF EXISTS bench_properties"))
+        return ()
+
+    def loaded_table():
+        fresh_table()
+        sqlq.make_table(rows.iloc[:half], "bench_properties", engine, bulk=True)
+        sqlq.ensure_unique_index(engine, "bench_properties")
+        return ()
+
+    results = {
+        f"{tag}_make_table_bulk": measure(lambda: sqlq.make_table(rows, "bench_properties", engine, bulk=True),
+                                          fresh_table, repeats),
+        # half of the rows already exist in each of these
+        f"{tag}_insert_new_rows": measure(lambda: sqlq.insert_new_rows(rows, "bench_properties", engine),
+                                          loaded_table, repeats),
+        f"{tag}_bulk_upsert": measure(lambda: sqlq.bulk_upsert(rows[["id", "predicted_price_per_bed"]],
+                                                               "bench_properties", engine, only_null=True),
+                                      loaded_table, repeats),
+    }
+    fresh_table()
+    return results
+
+
+def run_size(n: int, repeats: int, postgres_dsn: str = None, only=None) -> dict:
+    """Runs every benchmark at size n. Returns benchmark name -> seconds (None if skipped)."""
+    frame = synthetic.make_listings_frame(n)
+    filtered = rent.filter_df(frame)
+    clean = synthetic.make_clean_listings(n)
+    panel = synthetic.make_macro_panel(n_countries=max(10, n // 100), n_years=100)
+
+    def quiet(func):
+        # find_underpriced and the scraper print as they go
+        def run(*args):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return func(*args)
+        return run
+
+    cases = {
+        "filter_df": lambda: rent.filter_df(frame),
+        "clean_column_names": lambda: rent.clean_column_names(filtered),
+        "clean_for_reg": lambda: rent.clean_for_reg(clean),
+        "create_payload": lambda: rent.create_payload(clean),
+        "find_underpriced": quiet(lambda: rent.find_underpriced(clean, 1200)),
+        "find_underpriced_top10": quiet(lambda: rent.find_underpriced(clean, 1200, k=10)),
+        "df_to_create_table_sql": lambda: sqlq.df_to_create_table_sql(clean, "bench", cache=None),
+        "growth_accounting": lambda: growth.growth_accounting(growth.pwt_panel(panel)),
+    }
+    results = {}
+    for name, func in cases.items():
+        if only is None or name in only:
+            results[name] = measure(func, repeats=repeats)
+
+    if only is None or any(name.startswith("sqlite") for name in only):
+        with tempfile.TemporaryDirectory() as folder:
+            engine = sqlq.get_sql_engine(os.path.join(folder, "bench.db"))
+            results.update(sql_benchmarks(engine, clean, repeats, "sqlite"))
+            engine.dispose()
+    if only is None or any(name.startswith("postgres") for name in only):
+        if postgres_dsn:
+            results.update(sql_benchmarks(sqlq.get_engine(postgres_dsn), clean, repeats, "postgres"))
+        else:
+            results.update({f"postgres_{name}": None for name in ("make_table_bulk", "insert_new_rows", "bulk_upsert")})
+    return results
+
+
+def run_fixed(repeats: int, only=None) -> dict:
+    """Benchmarks that don't scale with the row count (the crawler against the mock API)."""
+    if only is not None and "scrape_search" not in only:
+        return {}
+    with MockSearchServer() as server, mock_search_api(server):
+        return {"scrape_search": measure(lambda: scrape_mock(n_locations=4), repeats=repeats)}
+
+
+# RECORDING AND COMPARING RESULTS
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=current_dir).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+## Compare two runs' results; returns the regressions
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get("results", {}).get(key)
+        if before is None or result["seconds"] is None or before["seconds"] is None:
+            continue
+        change = result["seconds"] / before["seconds"] - 1
+        result["baseline_seconds"] = before["seconds"]
+        result["change"] = change
+        if change > threshold:
+            result["status"] = "regression"
+            regressions.append(key)
+        elif change < -threshold:
+            result["status"] = "improvement"
+        else:
+            result["status"] = "unchanged"
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the macro_utils hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=SIZES, help="row counts to run at")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--only", nargs="*", default=None, help="benchmark names to run")
+    parser.add_argument("--output", default=None, help="results file (default: results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=baseline_file_path, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="slowdown counted as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="also save this run as the baseline")
+    parser.add_argument("--postgres-dsn", default=os.environ.get("BENCH_POSTGRES_DSN"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = {}
+    for name, seconds in run_fixed(args.repeats, args.only).items():
+        results[name] = {"seconds": seconds, "rows": None}
+    for n in args.sizes:
+        for name, seconds in run_size(n, args.repeats, args.postgres_dsn, args.only).items():
+            results[f"{name}@{n}"] = {
+                "seconds": seconds,
+                "rows": n,
+                "rows_per_sec": n / seconds if seconds else None,
+            }
+
+    regressions = []
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    # Print a table and save the machine-readable results
+    for key, result in results.items():
+        seconds = "skipped" if result["seconds"] is None else f"{result['seconds']:9.4f}s"
+        change = f"{result['change']:+7.1%} {result['status']}" if "change" in result else ""
+        print(f"{key:<36} {seconds:>10}  {change}")
+    report = {"environment": environment(), "threshold": args.threshold, "results": results, "regressions": regressions}
+    os.makedirs(results_folder_path, exist_ok=True)
+    output = args.output or os.path.join(results_folder_path, f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    paths = [output] + ([baseline_file_path] if args.save_baseline else [])
+    for path in paths:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(f"Results saved to {', '.join(paths)}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Seeded synthetic data for the benchmarks: rightmove-style listings (raw nested dicts,
+# the flattened frame pd.json_normalize would give, and the cleaned, modelled table) and
+# a PWT-style country x year macro panel. Every generator is vectorised, so 1M rows take
+# seconds, and the same seed always gives the same data
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import List
+
+
+# THE VALUES THE LISTINGS ARE DRAWN FROM
+SUBTYPES = ["Flat", "Apartment", "Terraced", "Semi-Detached", "Detached", "Studio", "Maisonette", "House Share"]
+UPDATE_REASONS = ["new", "price_reduced", "price_increased"]
+FREQUENCIES = ["monthly", "weekly", "yearly"]
+FREQUENCY_PROBS = [0.75, 0.22, 0.03]
+STREETS = ["High Street", "Station Road", "Church Lane", "Victoria Road", "Green Lane", "Park Road", "Mill Lane"]
+AREAS = ["London", "Hackney, London", "Camden, London", "Islington, London", "Lambeth, London", "Croydon"]
+
+
+## Flattened listings, as pd.json_normalize gives them (the input of filter_df)
+def make_listings_frame(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    n listings with every BASE_COLS column (dotted names, plain object/float dtypes as
+    scraped) plus a few extra nested fields that filter_df drops. About 1% of the ids are
+    repeated, as overlapping search pages would give.
+    """
+    rng = np.random.default_rng(seed)
+    ids = 100_000_000 + rng.permutation(n)
+    # overlapping pages repeat a few listings
+    repeats = rng.random(n) < 0.01
+    ids[repeats] = ids[rng.integers(0, n, repeats.sum())]
+
+    bedrooms = rng.choice([0, 1, 2, 3, 4, 5], n, p=[0.05, 0.3, 0.35, 0.2, 0.07, 0.03])
+    frequency = rng.choice(FREQUENCIES, n, p=FREQUENCY_PROBS)
+    monthly_rent = np.round(rng.lognormal(7.2, 0.4, n) * np.maximum(bedrooms, 1) ** 0.7)
+    amount = np.where(frequency == "weekly", np.round(monthly_rent * 12 / 52),
+                      np.where(frequency == "yearly", monthly_rent * 12, monthly_rent))
+    # strings are drawn from small vocabularies by index, which is much faster than
+    # formatting a million of them
+    day_strings = pd.date_range("2024-01-01", periods=365 * 24, freq="h").strftime("%Y-%m-%dT%H:%M:%SZ").to_numpy()
+    date_strings = day_strings[rng.integers(0, len(day_strings), n)]
+    addresses = np.array([f"{number} {street}, {area}" for number in range(1, 300) for street in STREETS for area in AREAS])
+    sizes = np.array([""] + [f"{size} sq. m." for size in range(30, 150)])
+
+    return pd.DataFrame({
+        "id": ids,
+        "bedrooms": bedrooms,
+        "bathrooms": rng.choice([0, 1, 2, 3, 4], n, p=[0.02, 0.6, 0.3, 0.06, 0.02]).astype("float64"),
+        "numberOfImages": rng.integers(0, 40, n),
+        "displayAddress": addresses[rng.integers(0, len(addresses), n)],
+        "location.latitude": rng.uniform(51.3, 51.7, n),
+        "location.longitude": rng.uniform(-0.5, 0.3, n),
+        "propertySubType": rng.choice(SUBTYPES, n),
+        "listingUpdate.listingUpdateReason": rng.choice(UPDATE_REASONS, n),
+        "listingUpdate.listingUpdateDate": date_strings,
+        "price.amount": amount,
+        "price.frequency": frequency,
+        "price.currencyCode": "GBP",
+        "premiumListing": rng.random(n) < 0.1,
+        "featuredProperty": rng.random(n) < 0.05,
+        "transactionType": "rent",
+        "students": rng.random(n) < 0.02,
+        "displaySize": sizes[np.where(rng.random(n) < 0.3, rng.integers(1, len(sizes), n), 0)],
+        "propertyUrl": ("/properties/" + pd.Series(ids).astype(str)).to_numpy(dtype=object),
+        "firstVisibleDate": date_strings,
+        "addedOrReduced": np.where(rng.random(n) < 0.5, "Added on 01/01/2024", "Reduced on 01/02/2024"),
+        "propertyTypeFullDescription": np.array([f"{beds} bedroom flat" for beds in range(6)])[bedrooms],
+        "customer.branchDisplayName": rng.choice(["Foxtons", "Savills", "Knight Frank", "Hamptons"], n),
+        "productLabel.productLabelText": rng.choice(["", "Online Viewing", "Furnished"], n),
+    })
+
+
+## Raw nested listings, as the rightmove search API returns them (the input of normalise_listings)
+def make_raw_listings(n: int, seed: int = 0) -> List[dict]:
+    flat = make_listings_frame(n, seed)
+    records = flat.to_dict(orient="records")
+    nested = []
+    for record in records:
+        # undo the flattening: "a.b" -> {"a": {"b": ...}}
+        listing = {}
+        for key, value in record.items():
+            if "." in key:
+                outer, inner = key.split(".", 1)
+                listing.setdefault(outer, {})[inner] = value
+            else:
+                listing[key] = value
+        nested.append(listing)
+    return nested
+
+
+## Cleaned listings with travel times and model predictions (the input of clean_for_reg,
+## find_underpriced and the SQL writers)
+def make_clean_listings(n: int, seed: int = 0) -> pd.DataFrame:
+    """The filter_df -> clean_column_names table, with travel_time, distance and predictions added."""
+    rng = np.random.default_rng(seed + 1)
+    df = make_listings_frame(n, seed).drop_duplicates(subset="id").drop(
+        columns=["price.currencyCode", "customer.branchDisplayName", "productLabel.productLabelText"])
+    df = df.rename(columns=lambda col: col.split(".", 1)[1] if "." in col else col)
+    df = df.rename(columns={"amount": "priceAmount", "frequency": "priceFrequency"})
+    n_unique = len(df)
+    df["price_per_bed"] = df["priceAmount"] / df["bedrooms"].replace(0, np.nan)
+    df["travel_time"] = np.where(rng.random(n_unique) < 0.03, np.nan, rng.uniform(300, 6000, n_unique))
+    df["distance"] = df["travel_time"] * rng.uniform(3, 8, n_unique)
+    df["predicted_price_per_bed"] = df["price_per_bed"] * rng.normal(1.0, 0.15, n_unique)
+    return df.reset_index(drop=True)
+
+
+## PWT-style long panel (the input of growth.pwt_panel)
+def make_macro_panel(n_countries: int = 180, n_years: int = 70, seed: int = 0) -> pd.DataFrame:
+    """
+    n_countries x n_years rows of countrycode, country, year and the PWT variables, each
+    country on its own balanced-growth path with noise and a few missing observations.
+    """
+    rng = np.random.default_rng(seed)
+    years = np.arange(2024 - n_years, 2024)
+    t = np.arange(n_years)[None, :]
+    shape = (n_countries, n_years)
+
+    def path(level, growth, noise):
+        start = rng.lognormal(level, 1.0, (n_countries, 1))
+        rate = rng.normal(growth, growth / 2 + 0.005, (n_countries, 1))
+        return start * np.exp(rate * t + rng.normal(0, noise, shape).cumsum(axis=1))
+
+    pop = path(2.0, 0.015, 0.002)
+    emp = pop * rng.uniform(0.35, 0.55, (n_countries, 1))
+    data = {
+        "rgdpna": path(11.0, 0.03, 0.01),
+        "rnna": path(12.0, 0.035, 0.005),
+        "rtfpna": path(0.0, 0.008, 0.01),
+        "emp": emp,
+        "avh": 2000 * np.exp(-0.003 * t) * rng.uniform(0.8, 1.1, (n_countries, 1)),
+        "pop": pop,
+        "delta": rng.uniform(0.03, 0.05, shape),
+    }
+    data["rgdpo"] = data["rgdpna"] * rng.normal(1.0, 0.02, shape)
+    # knock out ~2% of the observations, as in the real data
+    for values in data.values():
+        values[rng.random(shape) < 0.02] = np.nan
+
+    codes = np.array([f"C{i:04d}" for i in range(n_countries)])
+    frame = {
+        "countrycode": np.repeat(codes, n_years),
+        "country": np.repeat(np.char.add("Country ", codes), n_years),
+        "year": np.tile(years, n_countries),
+    }
+    frame.update({name: values.ravel() for name, values in data.items()})
+    return pd.DataFrame(frame)
@@ -0,0 +1,28 @@
+# The macro_utils package
+# Submodules are imported on first access (e.g. macro_utils.growth), so importing
+# the package itself doesn't pull in pandas, httpx or sqlalchemy
+import importlib
+
+SUBMODULES = [
+    "commute_cache",
+    "comparables",
+    "cpi",
+    "forecast_runner",
+    "functions",
+    "growth",
+    "http_cache",
+    "instrumentation",
+    "lazy",
+    "loaders",
+    "parquet_store",
+    "pipeline",
+    "ranking",
+    "rent_model",
+    "sql_queries",
+]
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,157 @@
+# This module stores a persistent cache of commute times, so that properties
+# close to ones already resolved do not need another (paid) TravelTime query
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import Optional, Tuple
+
+# Storage
+import sqlite3
+
+# Timing
+import time
+
+
+# THE CACHE
+
+class CommuteCache:
+    """
+    SQLite-backed cache of travel times and distances from an origin to grid cells.
+
+    Each property is snapped to a grid cell by rounding its latitude and longitude to
+    `precision` decimal places (3 decimals is roughly 110m north-south and 70m east-west
+    in London), and the cache is keyed by origin, transport mode, arrival period and cell.
+    Unreachable cells are cached too (with null travel time), so they are not re-queried.
+
+    Typical use:
+        hits, misses = cache.lookup(df)
+        ... query the API for `misses` only ...
+        cache.store(results_for_misses)
+    """
+
+    def __init__(self, path: str = ":memory:", origin: Tuple[float, float] = (51.513, -0.088),
+                 transportation_type: str = "public_transport", arrival_time_period: str = "weekday_morning",
+                 precision: int = 3, max_age: Optional[float] = None):
+        self.path = path
+        self.origin = f"{origin[0]:.6f},{origin[1]:.6f}"
+        self.transportation_type = transportation_type
+        self.arrival_time_period = arrival_time_period
+        self.precision = precision
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # Open the database and make sure the table exists
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS commute_times (
+                origin TEXT,
+                transportation_type TEXT,
+                arrival_time_period TEXT,
+                precision INTEGER,
+                cell_lat INTEGER,
+                cell_lng INTEGER,
+                travel_time REAL,
+                distance REAL,
+                stored_at REAL,
+                PRIMARY KEY (origin, transportation_type, arrival_time_period, precision, cell_lat, cell_lng)
+            )
+        """)
+        self.conn.commit()
+
+    def key(self) -> tuple:
+        # the part of the primary key that is fixed for this cache
+        return (self.origin, self.transportation_type, self.arrival_time_period, self.precision)
+
+    def check(self, origin: Tuple[float, float], transportation_type: str, arrival_time_period: str):
+        """Raises ValueError unless this cache holds commute times for the given query settings."""
+        wanted = (f"{origin[0]:.6f},{origin[1]:.6f}", transportation_type, arrival_time_period)
+        held = (self.origin, self.transportation_type, self.arrival_time_period)
+        if wanted != held:
+            raise ValueError(f"CommuteCache holds (origin, transportation_type, arrival_time_period) = {held}, "
+                             f"but the query is for {wanted}")
+
+    def cells(self, df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Snaps the latitude and longitude columns to integer grid cell coordinates."""
+        scale = 10 ** self.precision
+        cell_lat = np.round(df["latitude"].to_numpy(dtype="float64") * scale).astype("int64")
+        cell_lng = np.round(df["longitude"].to_numpy(dtype="float64") * scale).astype("int64")
+        return cell_lat, cell_lng
+
+    def lookup(self, df: pd.DataFrame, record: bool = True) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Splits `df` into the rows whose cell is cached (returned with travel_time and distance
+        filled in) and the rows that still need to be sent to the API.
+        Set record=False to leave the hit/miss statistics unchanged.
+        """
+        cell_lat, cell_lng = self.cells(df)
+        # Load the requested cells into a temporary table and join against the cache
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (cell_lat INTEGER, cell_lng INTEGER)")
+        self.conn.execute("DELETE FROM wanted")
+        unique_cells = set(zip(cell_lat.tolist(), cell_lng.tolist()))
+        self.conn.executemany("INSERT INTO wanted VALUES (?, ?)", unique_cells)
+        min_stored = time.time() - self.max_age if self.max_age is not None else -np.inf
+        rows = self.conn.execute("""
+            SELECT c.cell_lat, c.cell_lng, c.travel_time, c.distance
+            FROM commute_times c
+            JOIN wanted w ON c.cell_lat = w.cell_lat AND c.cell_lng = w.cell_lng
+            WHERE c.origin = ? AND c.transportation_type = ? AND c.arrival_time_period = ?
+              AND c.precision = ? AND c.stored_at >= ?
+        """, self.key() + (min_stored,)).fetchall()
+
+        # Match every row of df to its cached cell (if any)
+        cached = pd.DataFrame(rows, columns=["cell_lat", "cell_lng", "travel_time", "distance"])
+        index = pd.MultiIndex.from_arrays([cached["cell_lat"], cached["cell_lng"]])
+        position = index.get_indexer(pd.MultiIndex.from_arrays([cell_lat, cell_lng])) if len(cached) else np.full(len(df), -1)
+        found = position >= 0
+
+        hits = df[found].copy()
+        hits["travel_time"] = cached["travel_time"].to_numpy()[position[found]]
+        hits["distance"] = cached["distance"].to_numpy()[position[found]]
+        misses = df[~found]
+        if record:
+            self.hits += int(found.sum())
+            self.misses += int((~found).sum())
+        return hits, misses
+
+    def store(self, df: pd.DataFrame):
+        """Caches the travel_time and distance of each row of `df` against its grid cell."""
+        cell_lat, cell_lng = self.cells(df)
+        travel_time = df["travel_time"].astype("float64").to_numpy()
+        distance = df["distance"].astype("float64").to_numpy()
+        now = time.time()
+        rows = [
+            self.key() + (lat, lng, None if np.isnan(t) else t, None if np.isnan(d) else d, now)
+            for lat, lng, t, d in zip(cell_lat.tolist(), cell_lng.tolist(), travel_time.tolist(), distance.tolist())
+        ]
+        self.conn.executemany("INSERT OR REPLACE INTO commute_times VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def invalidate(self, older_than: Optional[float] = None) -> int:
+        """
+        Deletes the cached cells stored more than `older_than` seconds ago (or every cell of
+        this origin, mode and period if not given). Returns the number of cells removed.
+        """
+        cutoff = time.time() - older_than if older_than is not None else np.inf
+        cursor = self.conn.execute("""
+            DELETE FROM commute_times
+            WHERE origin = ? AND transportation_type = ? AND arrival_time_period = ?
+              AND precision = ? AND stored_at < ?
+        """, self.key() + (cutoff,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        n = self.conn.execute("""
+            SELECT COUNT(*) FROM commute_times
+            WHERE origin = ? AND transportation_type = ? AND arrival_time_period = ? AND precision = ?
+        """, self.key()).fetchone()[0]
+        total = self.hits + self.misses
+        return {"cells": n, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        self.conn.close()
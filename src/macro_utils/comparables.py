@@ -0,0 +1,206 @@
+# This module estimates what each listing "should" cost from its comparables: the nearest
+# listings (by great-circle distance) with the same number of bedrooms and a similar
+# commute. The listings are held in one ball tree per bedroom count, so a whole batch of
+# listings is scored with tree queries rather than a scan over every pair of listings
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+import warnings
+
+# Nearest-neighbour search
+from sklearn.neighbors import BallTree
+
+
+# DEFAULT SETTINGS
+EARTH_RADIUS_KM = 6371.0
+K_COMPARABLES = 10
+# neighbours fetched per wanted comparable, to leave room for those with a different commute
+OVERSAMPLE = 4
+# at most this many seconds' difference in travel time for a comparable (None for any)
+TRAVEL_TOLERANCE = 900
+# rebuild a tree once the listings added since it was built reach this share of it
+REBUILD_FRACTION = 0.1
+
+
+class BedroomGroup:
+    """
+    The listings with one bedroom count: a ball tree over most of them, plus a small tree
+    over the listings added since, which is folded into the main tree once it grows.
+    """
+
+    def __init__(self):
+        self.rows = np.empty(0, dtype="int64")
+        self.tree = None
+        self.new_rows = np.empty(0, dtype="int64")
+        self.new_tree = None
+
+    def add(self, rows: np.ndarray, coords: np.ndarray, active: np.ndarray, rebuild_fraction: float):
+        self.new_rows = np.concatenate([self.new_rows, rows])
+        if len(self.new_rows) > rebuild_fraction * len(self.rows):
+            # fold the new listings into the main tree, dropping replaced listings
+            self.rows = np.concatenate([self.rows, self.new_rows])
+            self.rows = self.rows[active[self.rows]]
+            self.tree = BallTree(coords[self.rows], metric="haversine")
+            self.new_rows = np.empty(0, dtype="int64")
+            self.new_tree = None
+        else:
+            self.new_tree = BallTree(coords[self.new_rows], metric="haversine")
+
+    def query(self, points: np.ndarray, k: int):
+        """The k nearest rows to each point (as row positions) and their distances, nearest first."""
+        results = []
+        for tree, rows in ((self.tree, self.rows), (self.new_tree, self.new_rows)):
+            if tree is not None and len(rows):
+                distance, ind = tree.query(points, k=min(k, len(rows)), breadth_first=True)
+                results.append((distance, rows[ind]))
+        if len(results) == 1:
+            return results[0]
+        # merge the two trees' neighbours by distance
+        distance = np.concatenate([r[0] for r in results], axis=1)
+        rows = np.concatenate([r[1] for r in results], axis=1)
+        order = np.argsort(distance, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distance, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+
+class ComparablesIndex:
+    """
+    Index of listings for comparable-listing rent estimates.
+
+    A listing's comparables are the k nearest other listings with the same number of
+    bedrooms whose travel time is within `travel_tolerance` seconds of its own. The
+    estimate is the median of their rent per bedroom.
+
+    Only the nearest k * oversample listings are checked for a similar commute, so with a
+    strict tolerance a listing can get fewer than k comparables (or none) even though more
+    exist further away; raise `oversample` to look further.
+
+    New listings can be added at any time with add(); a listing whose id is already
+    indexed replaces the old entry.
+
+    Columns used (as named by clean_column_names): id, latitude, longitude, bedrooms,
+    travel_time and price_per_bed.
+    """
+
+    def __init__(self, df: pd.DataFrame = None, k: int = K_COMPARABLES, oversample: int = OVERSAMPLE,
+                 travel_tolerance: float = TRAVEL_TOLERANCE, rebuild_fraction: float = REBUILD_FRACTION,
+                 price_col: str = "price_per_bed"):
+        self.k = k
+        self.oversample = oversample
+        self.travel_tolerance = travel_tolerance
+        self.rebuild_fraction = rebuild_fraction
+        self.price_col = price_col
+
+        # one entry per indexed listing (replaced listings stay, marked inactive)
+        self.ids = np.empty(0, dtype="int64")
+        self.coords = np.empty((0, 2))
+        self.bedrooms = np.empty(0, dtype="int64")
+        self.travel_time = np.empty(0)
+        self.price = np.empty(0)
+        self.active = np.empty(0, dtype=bool)
+        self.position = {}  # id -> row
+        self.groups = {}  # bedrooms -> BedroomGroup
+        if df is not None:
+            self.add(df)
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def columns(self, df: pd.DataFrame):
+        """The arrays the index works with, for the rows of df that can be placed."""
+        coords = np.radians(df[["latitude", "longitude"]].to_numpy(dtype="float64", na_value=np.nan))
+        bedrooms = df["bedrooms"].to_numpy(dtype="float64", na_value=np.nan)
+        travel_time = df["travel_time"].to_numpy(dtype="float64", na_value=np.nan)
+        usable = ~np.isnan(coords).any(axis=1) & ~np.isnan(bedrooms)
+        return coords, bedrooms, travel_time, usable
+
+    def add(self, df: pd.DataFrame) -> "ComparablesIndex":
+        """Adds (or replaces) listings; rows without coordinates, bedrooms or a rent are left out."""
+        coords, bedrooms, travel_time, usable = self.columns(df)
+        price = df[self.price_col].to_numpy(dtype="float64", na_value=np.nan)
+        usable &= ~np.isnan(price)
+        ids = df["id"].to_numpy(dtype="int64", na_value=-1)[usable]
+        # keep the last of any repeated ids in this batch
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        ids = ids[keep]
+
+        # retire the listings being replaced
+        replaced = [self.position[i] for i in ids.tolist() if i in self.position]
+        self.active[replaced] = False
+
+        start = len(self.ids)
+        self.ids = np.concatenate([self.ids, ids])
+        self.coords = np.concatenate([self.coords, coords[usable][keep]])
+        self.bedrooms = np.concatenate([self.bedrooms, bedrooms[usable][keep].astype("int64")])
+        self.travel_time = np.concatenate([self.travel_time, travel_time[usable][keep]])
+        self.price = np.concatenate([self.price, price[usable][keep]])
+        self.active = np.concatenate([self.active, np.ones(len(ids), dtype=bool)])
+        rows = np.arange(start, len(self.ids))
+        self.position.update(zip(ids.tolist(), rows.tolist()))
+
+        # add the new rows to their bedroom groups' trees
+        for beds in np.unique(self.bedrooms[rows]):
+            group = self.groups.setdefault(int(beds), BedroomGroup())
+            group.add(rows[self.bedrooms[rows] == beds], self.coords, self.active, self.rebuild_fraction)
+        return self
+
+    def query(self, df: pd.DataFrame, k: int = None, exclude_self: bool = True) -> pd.DataFrame:
+        """
+        Finds the comparables of every listing in df in one batch per bedroom count.
+
+        Returns a DataFrame on df's index with
+        - comparable_price_per_bed: median rent per bedroom of the comparables,
+        - n_comparables: how many were found (at most k, and possibly fewer when the travel
+          time filter rejects most of the nearest k * oversample listings),
+        - comparable_distance_km: distance to the furthest comparable used.
+        """
+        k = self.k if k is None else k
+        coords, bedrooms, travel_time, usable = self.columns(df)
+        ids = df["id"].to_numpy(dtype="int64", na_value=-1) if "id" in df else np.full(len(df), -1)
+        median = np.full(len(df), np.nan)
+        count = np.zeros(len(df), dtype="int64")
+        furthest = np.full(len(df), np.nan)
+
+        for beds, group in self.groups.items():
+            which = np.flatnonzero(usable & (bedrooms == beds))
+            if len(which) == 0:
+                continue
+            n_neighbours = k * self.oversample + int(exclude_self)
+            distance, rows = group.query(coords[which], n_neighbours)
+
+            # usable comparables: still listed, not the listing itself, and a similar commute
+            valid = self.active[rows]
+            if exclude_self:
+                valid &= self.ids[rows] != ids[which, None]
+            if self.travel_tolerance is not None:
+                gap = np.abs(self.travel_time[rows] - travel_time[which, None])
+                # listings without a travel time are compared on location alone
+                valid &= ~(gap > self.travel_tolerance)
+            # the nearest k of them
+            valid &= np.cumsum(valid, axis=1) <= k
+
+            with warnings.catch_warnings():
+                # listings without any comparables give all-NaN rows
+                warnings.simplefilter("ignore", RuntimeWarning)
+                median[which] = np.nanmedian(np.where(valid, self.price[rows], np.nan), axis=1)
+                furthest[which] = np.nanmax(np.where(valid, distance, np.nan), axis=1) * EARTH_RADIUS_KM
+            count[which] = valid.sum(axis=1)
+
+        return pd.DataFrame({
+            "comparable_price_per_bed": median,
+            "n_comparables": count,
+            "comparable_distance_km": furthest,
+        }, index=df.index)
+
+    def score(self, df: pd.DataFrame, k: int = None) -> pd.DataFrame:
+        """
+        df with the query() columns added, plus comparable_savings (comparable minus actual
+        rent per bedroom). The result can be ranked with ranking.UnderpricedIndex using
+        predicted_col="comparable_price_per_bed".
+        """
+        scored = df.join(self.query(df, k))
+        scored["comparable_savings"] = scored["comparable_price_per_bed"] - df[self.price_col].astype("float64")
+        return scored
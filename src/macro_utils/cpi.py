@@ -0,0 +1,138 @@
+# This module computes CPI changes, weighted contributions and re-aggregated indices
+# for every series at once, holding the CPI data as a series x month NumPy matrix
+# and the weights as vectors aligned to its rows
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import Dict, List
+
+
+# DEFAULT SETTINGS
+HORIZONS = [1, 3, 6, 12]  # months over which changes are computed
+
+
+class CPIMatrix:
+    """
+    CPI index levels as a (series x months) matrix.
+
+    Attributes:
+        series: array of the series names (rows), e.g. the series_short_name values.
+        dates: array of the month-end dates (columns), consecutive.
+        values: (series x months) float array of index levels, NaN where missing.
+    """
+
+    def __init__(self, series: np.ndarray, dates: pd.DatetimeIndex, values: np.ndarray):
+        self.series = series
+        self.dates = dates
+        self.values = values
+
+    @classmethod
+    def from_frame(cls, cpi: pd.DataFrame, series_col: str = "series_short_name", date_col: str = "date",
+                   value_col: str = "value") -> "CPIMatrix":
+        """Scatters a long CPI frame (one row per series and month) into the matrix."""
+        series_codes, series = pd.factorize(cpi[series_col], sort=True)
+        # Number the months consecutively (year * 12 + month) to index the columns
+        dates = pd.to_datetime(cpi[date_col])
+        month_numbers = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()
+        first = month_numbers.min()
+        month_codes = month_numbers - first
+        dates = pd.date_range(dates.min() + pd.offsets.MonthEnd(0), periods=month_codes.max() + 1,
+                              freq=pd.offsets.MonthEnd())
+
+        values = np.full((len(series), len(dates)), np.nan)
+        values[series_codes, month_codes] = cpi[value_col].to_numpy(dtype="float64")
+        return cls(np.asarray(series), dates, values)
+
+    def align_weights(self, weights: pd.DataFrame, series_col: str = "series_short_name",
+                      weight_col: str = "weight") -> np.ndarray:
+        """Returns the weights as a vector in the row order of the matrix (NaN if missing)."""
+        return weights.set_index(series_col)[weight_col].reindex(self.series).to_numpy(dtype="float64")
+
+
+# CHANGES AND CONTRIBUTIONS
+
+## Percentage changes over each horizon for every series at once
+def pct_changes(values: np.ndarray, horizons: List[int] = HORIZONS) -> np.ndarray:
+    """
+    Returns a (horizons x series x months) array of percentage changes over each horizon,
+    100 * (value_t / value_{t-h} - 1), NaN where the earlier month is not available.
+    """
+    changes = np.full((len(horizons),) + values.shape, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for i, h in enumerate(horizons):
+            changes[i, :, h:] = 100 * (values[:, h:] / values[:, :-h] - 1)
+    return changes
+
+
+## Weighted contributions and re-aggregated changes under one or many weight sets
+def contributions(changes: np.ndarray, weights: np.ndarray, members: np.ndarray = None) -> Dict[str, np.ndarray]:
+    """
+    Computes the weighted contribution of each series and the re-aggregated change.
+
+    Args:
+        changes: (horizons x series x months) array from pct_changes.
+        weights: (series,) vector, or (weight sets x series) matrix to evaluate many
+            reweighting scenarios in one batched operation.
+        members: optional boolean (series,) mask of the series making up the aggregate
+            (e.g. the core components); all series with a weight by default.
+
+    Returns:
+        dict with
+        - "contribution": weights * changes, shape ([weight sets x] horizons x series x months)
+        - "aggregate": sum of the contributions over the members divided by their total
+          weight, shape ([weight sets x] horizons x months)
+    """
+    weights = np.asarray(weights, dtype="float64")
+    single = weights.ndim == 1
+    W = np.atleast_2d(weights)
+    if members is not None:
+        W = np.where(members, W, 0.0)
+    W = np.nan_to_num(W)
+
+    # contributions for every weight set, horizon, series and month
+    contribution = W[:, None, :, None] * changes[None]
+    # missing changes shouldn't count towards the total weight either
+    available = ~np.isnan(changes)
+    total = np.einsum("ks,hsm->khm", W, available.astype("float64"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        aggregate = np.einsum("ks,hsm->khm", W, np.nan_to_num(changes)) / total
+
+    if single:
+        return {"contribution": contribution[0], "aggregate": aggregate[0]}
+    return {"contribution": contribution, "aggregate": aggregate}
+
+
+## Re-aggregated index level, rebased to 100 in a base month
+def aggregate_index(values: np.ndarray, weights: np.ndarray, base: int = 0) -> np.ndarray:
+    """
+    Fixed-weight (Laspeyres-style) aggregate of the series, each rebased to 100 in month
+    `base`. Accepts one weight vector or a (weight sets x series) matrix.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rebased = 100 * values / values[:, [base]]
+    W = np.nan_to_num(np.atleast_2d(np.asarray(weights, dtype="float64")))
+    index = (W @ np.nan_to_num(rebased)) / (W @ (~np.isnan(rebased)).astype("float64"))
+    return index[0] if np.ndim(weights) == 1 else index
+
+
+# OUTPUT FOR PLOTTING
+
+## Long frame of the changes and contributions for one horizon
+def to_long(matrix: CPIMatrix, changes: np.ndarray, contribution: np.ndarray, horizon: int,
+            horizons: List[int] = HORIZONS) -> pd.DataFrame:
+    """
+    Builds the long (date, series, variable, level) frame used for plotting, for one horizon,
+    straight from the arrays rather than melting a wide frame.
+    """
+    i = horizons.index(horizon)
+    n_series, n_months = matrix.values.shape
+    name = f"{horizon}_month_pct_change"
+    return pd.DataFrame({
+        "date": np.tile(np.tile(matrix.dates, n_series), 2),
+        "series_short_name": np.tile(np.repeat(matrix.series, n_months), 2),
+        "variable": np.repeat([name, f"{name}_wgt_contrib"], n_series * n_months),
+        "level": np.concatenate([changes[i].ravel(), contribution[i].ravel()]),
+    }).dropna(subset=["level"])
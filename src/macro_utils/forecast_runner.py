@@ -0,0 +1,185 @@
+# This module runs growth forecasts over a grid of countries x scenarios x horizons,
+# spreading the countries over a pool of worker processes that read the panel
+# from shared memory, and streaming each finished batch into a database table
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import Dict, List
+
+# Parallelism
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import os
+
+# The custom package
+from . import growth
+from . import sql_queries as sqlq
+
+
+# THE VARIABLES EACH WORKER NEEDS FROM THE PANEL
+PANEL_VARIABLES = ["rgdpna", "rnna", "L", "rtfpna", "delta"]
+
+# the arrays a worker process attached to when it started (name -> array)
+WORKER_ARRAYS = {}
+WORKER_BLOCKS = []
+
+
+# SHARED MEMORY
+
+## Copy arrays into shared memory blocks
+def share_arrays(arrays: Dict[str, np.ndarray]):
+    """
+    Copies each array into its own shared memory block. Returns the blocks (which the
+    caller must close and unlink) and a picklable spec the workers use to attach to them.
+    """
+    blocks, spec = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+## Attach a worker process to the shared arrays (runs once per worker)
+def attach_arrays(spec: dict):
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        WORKER_BLOCKS.append(block)
+        WORKER_ARRAYS[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+# THE WORK FOR ONE BATCH OF COUNTRIES
+
+## Fit and project a batch of countries under every scenario
+def fit_and_project(rows: np.ndarray, scenarios: Dict[str, Dict[str, float]], horizons: List[int],
+                    window: int = 20, alpha: float = growth.ALPHA, arrays: Dict[str, np.ndarray] = None) -> dict:
+    """
+    For the countries in `rows` (indices into the panel arrays):
+    - estimates s, n, g and delta over the last `window` years (growth.estimate_parameters),
+    - fits a linear trend to the Cobb-Douglas normalising constant p = Y / (A K^alpha L^(1 - alpha))
+      over the same window, as in the NB04 model,
+    - projects output (growth.project_solow) up to max(horizons) years on from each country's
+      last year with capital, TFP and labour all observed, under each scenario's shocks.
+
+    Returns plain arrays: the projected output levels (scenario x country x horizon), and each
+    country's starting column in the panel (-1 for a country without a complete year).
+    """
+    arrays = WORKER_ARRAYS if arrays is None else arrays
+    Y, K, L, A, delta = (arrays[name][rows] for name in PANEL_VARIABLES)
+    panel = growth.Panel(rows, np.arange(Y.shape[1]), {"rgdpna": Y, "rnna": K, "L": L, "rtfpna": A, "delta": delta})
+    params = growth.estimate_parameters(panel, window)
+
+    # Fit the trend in p for every country at once (least squares with NaNs left out)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = (Y / (A * K ** alpha * L ** (1 - alpha)))[:, -window:]
+        t = np.arange(window, dtype="float64")
+        valid = ~np.isnan(p)
+        count = valid.sum(axis=1)
+        t_mean = np.where(valid, t, 0).sum(axis=1) / count
+        p_mean = np.where(valid, p, 0).sum(axis=1) / count
+        t_dev = np.where(valid, t - t_mean[:, None], 0)
+        slope = (t_dev * np.where(valid, p - p_mean[:, None], 0)).sum(axis=1) / (t_dev ** 2).sum(axis=1)
+    intercept = p_mean - slope * t_mean
+
+    # Start each country from the last year in which its capital, TFP and labour are all
+    # observed, with p at its trend value for that year
+    base = growth.last_complete(K, A, L)
+    found = base >= 0
+    at_base = np.where(found, base, 0)
+    K0, A0, L0 = (np.where(found, x[np.arange(len(rows)), at_base], np.nan) for x in (K, A, L))
+    level = intercept + slope * (base - (Y.shape[1] - window))
+
+    # Project every scenario (a leading axis on the shocked parameters) for every country at once
+    shocked = {
+        name: np.stack([values + shocks.get(name, 0.0) for shocks in scenarios.values()])
+        for name, values in params.items()
+    }
+    projection = growth.project_solow(K0, A0, L0, shocked["s"], shocked["n"], shocked["g"], shocked["delta"],
+                                      max(horizons), alpha, level, level_trend=slope)
+    return {"rows": rows, "base": base, "levels": projection["Y"][..., np.asarray(horizons)]}
+
+
+# THE RUNNER
+
+## Turn a batch result into ts_data-style long rows
+def batch_to_frame(result: dict, panel: growth.Panel, scenario_names: List[str], horizons: List[int]) -> pd.DataFrame:
+    n_scenarios, n_countries, n_horizons = result["levels"].shape
+    # each country's projection is counted from its own starting year (null if it has none)
+    base = np.asarray(result["base"])
+    base_year = np.where(base >= 0, np.asarray(panel.years)[np.maximum(base, 0)], np.nan)
+    horizon_col = np.tile(np.asarray(horizons), n_scenarios * n_countries)
+    year = np.tile(np.repeat(base_year, n_horizons), n_scenarios) + horizon_col
+    return pd.DataFrame({
+        "country": np.tile(np.repeat(panel.countries[result["rows"]], n_horizons), n_scenarios),
+        "scenario": np.repeat(np.asarray(scenario_names), n_countries * n_horizons),
+        "horizon": horizon_col,
+        "year": pd.array(year, dtype="Int64"),
+        "level": result["levels"].ravel(),
+    })
+
+
+## Run every country x scenario x horizon cell
+def run_forecasts(panel: growth.Panel, scenarios: Dict[str, Dict[str, float]] = None, horizons: List[int] = (1, 5, 10),
+                  window: int = 20, alpha: float = growth.ALPHA, workers: int = None, batch_size: int = 16,
+                  engine=None, table: str = "forecast_data"):
+    """
+    Fits and projects every country in `panel` under each scenario (a dict of additive shocks
+    to s, n, g and delta, e.g. {"tariffs": {"g": -0.005}}) for each horizon.
+
+    The panel arrays are placed in shared memory once, and batches of `batch_size` countries
+    are sent to a pool of `workers` processes (os.cpu_count() by default; 0 runs in-process).
+    If an engine is given, each finished batch is appended to `table` as it arrives, as
+    country, scenario, horizon, year, level rows, and the number of rows written is returned;
+    otherwise all of the rows are returned as one DataFrame. `year` is the country's starting
+    year plus the horizon.
+    """
+    scenarios = {"baseline": {}, **(scenarios or {})}
+    scenario_names = list(scenarios)
+    horizons = list(horizons)
+    if not horizons or min(horizons) < 1:
+        raise ValueError(f"horizons must be whole years of at least 1, got {horizons}")
+    batches = [np.arange(start, min(start + batch_size, len(panel.countries)))
+               for start in range(0, len(panel.countries), batch_size)]
+
+    frames, written = [], 0
+
+    def collect(result):
+        # write each batch as soon as it is done (or keep it to return at the end)
+        nonlocal written
+        frame = batch_to_frame(result, panel, scenario_names, horizons)
+        if engine is not None:
+            sqlq.make_table(frame, table, engine, bulk=True)
+            written += len(frame)
+        else:
+            frames.append(frame)
+
+    arrays = {name: panel[name] for name in PANEL_VARIABLES}
+    workers = os.cpu_count() if workers is None else workers
+    if workers == 0:
+        for rows in batches:
+            collect(fit_and_project(rows, scenarios, horizons, window, alpha, arrays))
+    else:
+        blocks, spec = share_arrays(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=attach_arrays, initargs=(spec,)) as pool:
+                futures = [pool.submit(fit_and_project, rows, scenarios, horizons, window, alpha) for rows in batches]
+                for future in as_completed(futures):
+                    collect(future.result())
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    if engine is not None:
+        return written
+    if not frames:
+        # no countries: an empty frame with the usual columns
+        empty = {"rows": np.empty(0, dtype="int64"), "base": np.empty(0, dtype="int64"),
+                 "levels": np.empty((len(scenarios), 0, len(horizons)))}
+        return batch_to_frame(empty, panel, scenario_names, horizons)
+    return pd.concat(frames, ignore_index=True).sort_values(["scenario", "country", "horizon"], ignore_index=True)
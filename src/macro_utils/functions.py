@@ -5,31 +5,69 @@
 
 
 # IMPORT PACKAGES
+# Annotations are not evaluated at import time, so they can name lazily-imported types
+from __future__ import annotations
+
+# Heavy dependencies are only imported when first used (see lazy.py), so importing this
+# module stays cheap for scripts and worker processes that only need part of it
+from .lazy import lazy_import
+
+# Timings and counters for the hot paths (off unless instrumentation.enable() is called)
+from . import instrumentation as instr
+
 # Web - Scraping and API Requests
-import requests
-from httpx import AsyncClient, Response
-from parsel import Selector
-import parsel
-import jmespath
+httpx = lazy_import("httpx")
+requests = lazy_import("requests")
+parsel = lazy_import("parsel")
+jmespath = lazy_import("jmespath")
 import asyncio
+import contextlib
 from urllib.parse import urlencode
 
 # Data Manipulation and Analysis
-import pandas as pd
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
 from pprint import pprint 
 import json
-from typing import List
+from typing import List, TYPE_CHECKING
 from typing import TypedDict
 
 # Database Connection
-from sqlalchemy import create_engine
+sqlq = lazy_import(__package__ + ".sql_queries")
 
-# url displays
-from IPython.display import display, Markdown
+# Caching of commute times (only needed for annotations here)
+if TYPE_CHECKING:
+    from .commute_cache import CommuteCache
 
 # File and System Operations
 import os
 import sys
+import time
+import random
+import importlib
+import importlib.util
+
+## Names that used to be imported eagerly from other packages, now resolved on first access
+LAZY_NAMES = {
+    "AsyncClient": ("httpx", "AsyncClient"),
+    "Response": ("httpx", "Response"),
+    "Selector": ("parsel", "Selector"),
+    "create_engine": ("sqlalchemy", "create_engine"),
+    "display": ("IPython.display", "display"),
+    "Markdown": ("IPython.display", "Markdown"),
+}
+
+
+def __getattr__(name):
+    # Resolve the lazily imported names (and the HTTP client) on first access
+    if name == "client":
+        return get_client()
+    if name in LAZY_NAMES:
+        module, attr = LAZY_NAMES[name]
+        value = getattr(importlib.import_module(module), attr)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # DIRECTORY SETUP
 
@@ -46,13 +84,50 @@ credentials_file_path = os.path.join(current_dir, '..', '..', "credentials.json"
 data_folder_path = os.path.join(current_dir, '..', '..', "data")
 
 # REQUESTS SETUP
-# 1. establish HTTP client with browser-like headers to avoid being blocked
-client = AsyncClient(headers={
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)", # mimic browser use (baseline)
-    "Accept": "application/json",  # Accept json apis
-    "Referer": "https://www.rightmove.co.uk/",  # Helps mimic browser use
-})
-
+# 1. HTTP client with browser-like headers to avoid being blocked,
+# created on first use (assigning functions.client replaces it)
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared HTTP client, creating it on first use."""
+    global client
+    if "client" not in globals():
+        client = httpx.AsyncClient(headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)", # mimic browser use (baseline)
+            "Accept": "application/json",  # Accept json apis
+            "Referer": "https://www.rightmove.co.uk/",  # Helps mimic browser use
+        })
+    return client
+
+# 2. optional on-disk response cache (see enable_response_cache), shared by all requests
+response_cache = None
+
+
+### Function to turn on the response cache
+def enable_response_cache(path: str = None, **kwargs):
+    """
+    Routes every request made by this module through a persistent ResponseCache
+    (stored in the data folder by default), so repeated typeahead and search calls
+    are served from disk. Extra keyword arguments (ttls, max_bytes, ...) go to ResponseCache.
+    Pass path=False to turn the cache off again.
+    """
+    global response_cache
+    if response_cache is not None:
+        response_cache.close()
+        response_cache = None
+    if path is False:
+        return None
+    if path is None:
+        path = os.path.join(data_folder_path, "http_cache.sqlite")
+    from .http_cache import ResponseCache
+    response_cache = ResponseCache(path, **kwargs)
+    return response_cache
+
+
+### Function to send a GET request, through the cache if it is enabled
+async def get(url: str) -> httpx.Response:
+    """GETs a url with the shared client, going through the response cache if enabled."""
+    if response_cache is not None:
+        return await response_cache.get(get_client(), url)
+    return await get_client().get(url)
 
 
 # THE FUNCTIONS
@@ -67,77 +142,408 @@ async def find_locations(query: str) -> List[str]:
     # Construct the URL for the typeahead API using the tokenized query
     url = f"https://www.rightmove.co.uk/typeAhead/uknostreet/{tokenize_query.strip('/')}/"
     # Make an asynchronous GET request to the API
-    response = await client.get(url)
+    response = await get(url)
     # Parse the JSON response from the API
-    data = json.loads(response.text)
+    data = response.json()
     # Extract and return the list of location identifiers from the response
     return [prediction["locationIdentifier"] for prediction in data["typeAheadLocations"]]
 
 
-### Function to scrape results for a given location for multiple pages
-async def scrape_search(location_id: str, total_results = 250) -> str:
+### Crawl settings shared by the scraping functions
+RESULTS_PER_PAGE = 24
+# rightmove sets the API limit to 1000 properties per search
+MAX_API_RESULTS = 1000
+# statuses worth retrying (rate limited or a temporary server-side failure)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+### A rate limiter that caps both concurrency and the request rate
+class RateLimiter:
     """
-    Scrapes rental property listings from Rightmove for a given location identifier, handling pagination and returning all results.
+    Token-bucket rate limiter combined with a semaphore.
+
+    The semaphore caps how many requests are in flight at once, while the token
+    bucket caps how many requests start per second (with bursts of up to `burst`).
+    Use it as an async context manager around each request.
     """
-    RESULTS_PER_PAGE = 24
-
-    def make_url(offset: int) -> str:
-        url = "https://www.rightmove.co.uk/api/_search?"
-        params = {
-            "areaSizeUnit": "sqm", # the units for the size of each property
-            "channel": "RENT",  # BUY or RENT - for my puyrposes, rent is the most relevant
-            "currencyCode": "GBP", # chosen currency
-            "includeSSTC": "false", # an empty search parameter
-            "index": offset, # the number of the search result/property displayed at the start of the page 
-            "isFetching": "false", 
-            "locationIdentifier": location_id, # the location we wish to search for (London)
-            "numberOfPropertiesPerPage": RESULTS_PER_PAGE,
-            "radius": "0.0", # how far away we are allowed to be from the geographgical boundaries of the region
-            "sortType": "6", # the sorting mechanism for search results
-            "viewType": "LIST", # how results appear
+
+    def __init__(self, rate: float = 5.0, burst: int = 5, max_concurrency: int = 8):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.lock = asyncio.Lock()
+
+    async def acquire_token(self):
+        # Refill the bucket based on the time elapsed, and wait until a token is free
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            await self.acquire_token()
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+
+### Counters for tuning the crawler
+class CrawlStats:
+    """
+    Keeps per-request latency, status and throughput counters for a crawl.
+    Call `summary()` to get a dict of the headline numbers.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.pages = 0
+        self.properties = 0
+        self.duplicates = 0
+        self.bytes = 0
+        self.status_counts = {}
+        self.latencies = []
+
+    def record(self, status_code: int, latency: float, n_bytes: int = 0):
+        self.requests += 1
+        self.bytes += n_bytes
+        self.latencies.append(latency)
+        self.status_counts[status_code] = self.status_counts.get(status_code, 0) + 1
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "pages": self.pages,
+            "properties": self.properties,
+            "duplicates": self.duplicates,
+            "bytes": self.bytes,
+            "status_counts": dict(self.status_counts),
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": latencies[-1] if latencies else None,
+            "elapsed": elapsed,
+            "requests_per_sec": self.requests / elapsed if elapsed > 0 else 0.0,
+            "properties_per_sec": self.properties / elapsed if elapsed > 0 else 0.0,
         }
-        return url + urlencode(params)
 
-    # Build the URL for the first page of results
-    url = make_url(0)
-    # print(f"Requesting URL: {url}")
+
+### Function to build the search url for a given location and offset
+def make_search_url(location_id: str, offset: int) -> str:
+    """Builds the Rightmove search API url for one page of rental results."""
+    url = "https://www.rightmove.co.uk/api/_search?"
+    params = {
+        "areaSizeUnit": "sqm", # the units for the size of each property
+        "channel": "RENT",  # BUY or RENT - for my puyrposes, rent is the most relevant
+        "currencyCode": "GBP", # chosen currency
+        "includeSSTC": "false", # an empty search parameter
+        "index": offset, # the number of the search result/property displayed at the start of the page 
+        "isFetching": "false", 
+        "locationIdentifier": location_id, # the location we wish to search for (London)
+        "numberOfPropertiesPerPage": RESULTS_PER_PAGE,
+        "radius": "0.0", # how far away we are allowed to be from the geographgical boundaries of the region
+        "sortType": "6", # the sorting mechanism for search results
+        "viewType": "LIST", # how results appear
+    }
+    return url + urlencode(params)
+
+
+### Function to fetch and decode one json page, with retries
+async def fetch_json(url: str, limiter: RateLimiter = None, stats: CrawlStats = None,
+                     max_retries: int = 4, backoff: float = 0.5) -> dict:
+    """
+    GETs a url through the shared client and returns the decoded json body.
+
+    Requests go through the rate limiter (if given), and responses with a status in
+    RETRY_STATUSES (or transport errors) are retried with jittered exponential backoff.
+    A Retry-After header from the server takes priority over the backoff.
+    """
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            if limiter is not None:
+                async with limiter:
+                    response = await get(url)
+            else:
+                response = await get(url)
+        except httpx.TransportError:
+            instr.record_http(0, time.perf_counter() - start, host="rightmove")
+            if stats is not None:
+                stats.record(0, time.perf_counter() - start)
+            if attempt == max_retries:
+                if stats is not None:
+                    stats.failures += 1
+                raise
+            delay = None
+        else:
+            instr.record_http(response.status_code, time.perf_counter() - start, len(response.content), host="rightmove")
+            if stats is not None:
+                stats.record(response.status_code, time.perf_counter() - start, len(response.content))
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                # Decode the body only once
+                with instr.span("scrape.json_decode", nbytes=len(response.content)):
+                    return response.json()
+            if attempt == max_retries:
+                if stats is not None:
+                    stats.failures += 1
+                response.raise_for_status()
+            retry_after = response.headers.get("Retry-After")
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else None
+        # Wait before trying again (full jitter on the exponential backoff)
+        if stats is not None:
+            stats.retries += 1
+        if delay is None:
+            delay = random.uniform(0, backoff * 2 ** attempt)
+        await asyncio.sleep(delay)
+
+
+### Function to stream results for a given location, one page at a time
+async def stream_search(location_id: str, total_results = 250, limiter: RateLimiter = None,
+                        stats: CrawlStats = None, seen_ids: set = None):
+    """
+    Async generator version of scrape_search: yields each page's list of (new) properties
+    as soon as it arrives, rather than collecting every property in memory first.
+
+    Pages are fetched concurrently through `limiter` (a RateLimiter, created with default
+    settings if not given), failed pages are retried, and properties whose id is already in
+    `seen_ids` are dropped so overlapping pages or locations are only returned once.
+    """
+    if limiter is None:
+        limiter = RateLimiter()
+    if stats is None:
+        stats = CrawlStats()
+    if seen_ids is None:
+        seen_ids = set()
+
+    def keep_new(properties: List[dict]) -> List[dict]:
+        # Only keep properties that have not been seen on an earlier page
+        new = []
+        for prop in properties:
+            if prop.get("id") in seen_ids:
+                stats.duplicates += 1
+                continue
+            seen_ids.add(prop.get("id"))
+            new.append(prop)
+        stats.pages += 1
+        stats.properties += len(new)
+        return new
+
     # Send the request to the Rightmove API for the first page
-    first_page = await client.get(url)
-    # print(f"First page status: {first_page.status_code}")
-    # Parse the JSON response from the first page
-    first_page_data = first_page.json()
-    results = first_page_data["properties"]
-
-    # Prepare to fetch additional pages if there are more results
-    other_pages = []
-    # rightmove sets the API limit to 1000 properties, but here max_api_results is set to 20 for demonstration/testing
-    max_api_results = 1000    
+    first_page_data = await fetch_json(make_search_url(location_id, 0), limiter, stats)
+    yield keep_new(first_page_data["properties"])
+
+    # Don't request pages beyond the number of results rightmove says there are,
+    # nor beyond the API limit
+    result_count = str(first_page_data.get("resultCount", total_results)).replace(",", "")
+    last_offset = min(total_results, MAX_API_RESULTS, int(result_count) if result_count.isdigit() else total_results)
+
     # The 'index' parameter in the URL specifies the starting property for each page
-    for offset in range(RESULTS_PER_PAGE, total_results, RESULTS_PER_PAGE):
-        # Stop scraping more pages when the scraper reaches the API limit
-        if offset >= max_api_results: 
-            break
-        print(f"Scheduling request for offset: {offset}")
-        # Schedule the request for the next page
-        other_pages.append(client.get(make_url(offset)))
-    # Asynchronously (using async) gather and process all additional page responses
-    for response in asyncio.as_completed(other_pages):
-        response = await response
-        # print(f"Received response for additional page: {response.status_code}")
-        data = json.loads(response.text)
-        results.extend(data['properties'])
-    
+    other_pages = [
+        asyncio.ensure_future(fetch_json(make_search_url(location_id, offset), limiter, stats))
+        for offset in range(RESULTS_PER_PAGE, last_offset, RESULTS_PER_PAGE)
+    ]
+    # Asynchronously (using async) yield each additional page as it completes
+    try:
+        for page in asyncio.as_completed(other_pages):
+            data = await page
+            yield keep_new(data["properties"])
+    finally:
+        # stop fetching if the consumer stops early (or a page failed)
+        for task in other_pages:
+            task.cancel()
+
+
+### Function to scrape results for a given location for multiple pages
+@instr.timed("scrape.search", rows=len)
+async def scrape_search(location_id: str, total_results = 250, limiter: RateLimiter = None,
+                        stats: CrawlStats = None, seen_ids: set = None) -> List[dict]:
+    """
+    Scrapes rental property listings from Rightmove for a given location identifier, handling pagination and returning all results.
+    See stream_search for the rate limiting, retry and de-duplication behaviour.
+    """
+    results = []
+    async for page in stream_search(location_id, total_results, limiter, stats, seen_ids):
+        results.extend(page)
+
     # display the number of results that we managed to parse across multiple pages
-    total_results = len(results)
-    print(f"Found {total_results} properties")
+    print(f"Found {len(results)} properties")
     return results
 
 
+### Function to scrape several locations at once
+@instr.timed("scrape.many", rows=len)
+async def scrape_many(location_ids: List[str], total_results = 250, max_concurrency: int = 8,
+                      rate: float = 5.0, stats: CrawlStats = None) -> List[dict]:
+    """
+    Scrapes several location identifiers concurrently, sharing a single rate limiter
+    so the combined crawl never exceeds `max_concurrency` in-flight requests or `rate`
+    requests per second. Properties are de-duplicated across locations.
+
+    Pass in a CrawlStats object to read the latency and throughput counters afterwards.
+    """
+    limiter = RateLimiter(rate=rate, burst=max(1, int(rate)), max_concurrency=max_concurrency)
+    if stats is None:
+        stats = CrawlStats()
+    seen_ids = set()
+    # Skip location ids that were passed in more than once
+    unique_ids = list(dict.fromkeys(location_ids))
+    searches = [scrape_search(location_id, total_results, limiter, stats, seen_ids) for location_id in unique_ids]
+    results = []
+    for search in asyncio.as_completed(searches):
+        results.extend(await search)
+    return results
+
+
+### Function to stream several locations at once
+async def stream_many(location_ids: List[str], total_results = 250, max_concurrency: int = 8,
+                      rate: float = 5.0, stats: CrawlStats = None):
+    """
+    Async generator version of scrape_many: yields pages of de-duplicated properties from
+    all of the locations, in the order they arrive. Only pages that have arrived but not yet
+    been consumed are held in memory.
+    """
+    limiter = RateLimiter(rate=rate, burst=max(1, int(rate)), max_concurrency=max_concurrency)
+    if stats is None:
+        stats = CrawlStats()
+    seen_ids = set()
+    # a limited number of slots for waiting pages stops the crawlers running far ahead of a
+    # slow consumer (the end-of-crawl markers don't need one, so a crawler never blocks on
+    # finishing, even when it is cancelled)
+    queue = asyncio.Queue()
+    slots = asyncio.Semaphore(max_concurrency * 2)
+    done = object()
+
+    async def crawl(location_id):
+        try:
+            async with contextlib.aclosing(stream_search(location_id, total_results, limiter, stats, seen_ids)) as pages:
+                async for page in pages:
+                    await slots.acquire()
+                    queue.put_nowait(page)
+        finally:
+            queue.put_nowait(done)
+
+    unique_ids = list(dict.fromkeys(location_ids))
+    tasks = [asyncio.create_task(crawl(location_id)) for location_id in unique_ids]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            page = await queue.get()
+            if page is done:
+                remaining -= 1
+                continue
+            slots.release()
+            yield page
+        # surface any exceptions raised by the crawlers
+        for task in tasks:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 
 
 ## CLEANING
 
+### The columns of the scraped listings that are kept for analysis
+BASE_COLS = [
+    'id',
+    'bedrooms',
+    'bathrooms',
+    'numberOfImages',
+    'displayAddress',
+    'location.latitude',
+    'location.longitude',
+    'propertySubType',
+    'listingUpdate.listingUpdateReason',
+    'listingUpdate.listingUpdateDate',
+    'price.amount',
+    'price.frequency',
+    'premiumListing',
+    'featuredProperty',
+    'transactionType',
+    'students',
+    'displaySize',
+    'propertyUrl',
+    'firstVisibleDate',
+    'addedOrReduced',
+    'propertyTypeFullDescription',
+]
+
+
+### Compact dtypes for the base columns, applied once when the listings are normalised
+# Arrow-backed strings need pyarrow; fall back to pandas' own string dtype without it
+STRING_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") is not None else "string"
+
+PROPERTY_SCHEMA = {
+    'id': "Int64",
+    'bedrooms': "Int8",
+    'bathrooms': "Int8",
+    'numberOfImages': "Int16",
+    'displayAddress': STRING_DTYPE,
+    'location.latitude': "float32",
+    'location.longitude': "float32",
+    'propertySubType': "category",
+    'listingUpdate.listingUpdateReason': "category",
+    'listingUpdate.listingUpdateDate': STRING_DTYPE,
+    'price.amount': "float32",
+    'price.frequency': "category",
+    'premiumListing': "boolean",
+    'featuredProperty': "boolean",
+    'transactionType': "category",
+    'students': "boolean",
+    'displaySize': "category",
+    'propertyUrl': STRING_DTYPE,
+    'firstVisibleDate': STRING_DTYPE,
+    'addedOrReduced': "category",
+    'propertyTypeFullDescription': STRING_DTYPE,
+}
+
+
+### A function that converts the base columns to their compact dtypes
+def apply_property_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts the columns of `df` that appear in PROPERTY_SCHEMA to their compact dtypes
+    (categoricals, nullable small ints, float32 coordinates and prices, and Arrow strings).
+    Numeric columns are coerced first, so unparseable values become null rather than raising.
+    """
+    converted = {}
+    for col, dtype in PROPERTY_SCHEMA.items():
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if dtype in ("Int8", "Int16", "Int64", "float32"):
+            values = pd.to_numeric(values, errors="coerce")
+        converted[col] = values.astype(dtype)
+    return df.assign(**converted)
+
+
 ### A function that filters out only the desired columns
+@instr.timed("clean.filter_df", rows=len)
 def filter_df(df: pd.DataFrame) -> pd.DataFrame:
     """
     Filters the input DataFrame to retain only the columns relevant for property analysis.
@@ -148,37 +554,13 @@ def filter_df(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A DataFrame containing only the selected columns of interest.
     """
-    # Define the list of columns to keep in the filtered DataFrame
-    base_cols = [
-        'id',
-        'bedrooms',
-        'bathrooms',
-        'numberOfImages',
-        'displayAddress',
-        'location.latitude',
-        'location.longitude',
-        'propertySubType',
-        'listingUpdate.listingUpdateReason',
-        'listingUpdate.listingUpdateDate',
-        'price.amount',
-        'price.frequency',
-        'premiumListing',
-        'featuredProperty',
-        'transactionType',
-        'students',
-        'displaySize',
-        'propertyUrl',
-        'firstVisibleDate',
-        'addedOrReduced',
-        'propertyTypeFullDescription'
-    ]
     # Assign the columns of interest (can be extended or modified if needed)
-    columns_of_interest = base_cols
-    # Filter the DataFrame to include only the columns of interest
-    filtered_df = df[columns_of_interest]
+    columns_of_interest = BASE_COLS
+    # Filter the DataFrame to include only the columns of interest,
+    # converting them to their compact dtypes (this builds a new frame, so no copy is needed)
+    filtered_df = apply_property_schema(df[columns_of_interest])
     # Create a price per bedroom column
-    filtered_df = filtered_df.copy()
-    filtered_df.loc[:, "price_per_bed"] = filtered_df["price.amount"] / filtered_df["bedrooms"]
+    filtered_df["price_per_bed"] = (filtered_df["price.amount"] / filtered_df["bedrooms"]).astype("Float32")
     # remove rows with a duplicated id
     filtered_df = filtered_df.drop_duplicates(subset="id")
     # Return the filtered DataFrame
@@ -204,7 +586,70 @@ def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
     return df.rename(columns=rename_map)
 
 
+### A function that flattens a batch of raw listings into the filtered, renamed format
+@instr.timed("clean.normalise_listings", rows=len)
+def normalise_listings(properties: List[dict]) -> pd.DataFrame:
+    """
+    Builds the filter_df/clean_column_names output straight from a list of raw property
+    dicts, only extracting the BASE_COLS fields rather than flattening every nested field
+    with pd.json_normalize first. Fields missing from a listing become null.
+    """
+    def extract(prop: dict, path: List[str]):
+        # walk down the nested dicts following the dotted column name
+        for key in path:
+            if not isinstance(prop, dict):
+                return None
+            prop = prop.get(key)
+        return prop
+
+    # build each column directly from its dotted path
+    columns = {col: [extract(prop, col.split(".")) for prop in properties] for col in BASE_COLS}
+    df = pd.DataFrame(columns, columns=BASE_COLS)
+    return clean_column_names(filter_df(df))
+
+
+### A function that writes streamed pages to the database in batches
+async def write_listings(pages, engine, table_name: str = "properties_data", batch_size: int = 500) -> int:
+    """
+    Consumes an async iterable of property pages (e.g. from stream_search or stream_many),
+    normalises them in batches of roughly `batch_size` listings and inserts each batch into
+    `table_name` (creating it from the first batch if needed), skipping the listings whose id
+    is already stored. Each batch is written in a worker thread while the next one is
+    collected, so at most two batches are held in memory and the crawl doesn't wait on
+    the database.
+
+    Returns the number of rows written.
+    """
+    def write(batch):
+        # normalise the batch and insert the new listings (runs in a worker thread)
+        df = normalise_listings(batch)
+        if not sqlq.inspect(engine).has_table(table_name):
+            return sqlq.make_table(df, table_name, engine)["rows"]
+        return sqlq.insert_new_rows(df, table_name, engine)
+
+    batch = []
+    written = 0
+    writing = None
+    try:
+        async for page in pages:
+            batch.extend(page)
+            if len(batch) >= batch_size:
+                # wait for the previous batch before starting on this one
+                if writing is not None:
+                    written += await writing
+                writing = asyncio.ensure_future(asyncio.to_thread(write, batch))
+                batch = []
+    finally:
+        # the batch being written is finished even if the pages raised
+        if writing is not None:
+            written += await writing
+    if batch:
+        written += await asyncio.to_thread(write, batch)
+    return written
+
+
 # Define a function that cleans a dataframe for regression analysis
+@instr.timed("clean.clean_for_reg", rows=len)
 def clean_for_reg(df: pd.DataFrame) -> pd.DataFrame:
     """
     Cleans the input DataFrame for regression analysis.
@@ -214,25 +659,31 @@ def clean_for_reg(df: pd.DataFrame) -> pd.DataFrame:
     Output:
         pd.DataFrame: The cleaned DataFrame suitable for regression.
     """
+    # Convert the columns we filter on to numbers once (non-numeric values become NaN)
+    travel_time = pd.to_numeric(df["travel_time"], errors="coerce")
+    bathrooms = pd.to_numeric(df["bathrooms"], errors="coerce")
+    price_per_bed = pd.to_numeric(df["price_per_bed"], errors="coerce")
+
     # Adjust price_per_bed to monthly if priceFrequency is 'weekly', else keep as is
-    df = df.copy()
-    df["price_per_bed"] = df.apply(
-        lambda row: row["price_per_bed"] * 52 / 12 if row["priceFrequency"] == "weekly" else row["price_per_bed"],
-        axis=1
+    weekly = df["priceFrequency"] == "weekly"
+    price_per_bed = price_per_bed.where(~weekly, price_per_bed * 52 / 12)
+
+    # Build a single mask combining all of the filters:
+    # - priceFrequency is 'monthly' or 'weekly'
+    # - travel_time is between 60 and 5400 seconds
+    # - bathrooms is between 1 and 6
+    # - price_per_bed (after adjustment) is between 100 and 10,000
+    mask = (
+        df["priceFrequency"].isin(["monthly", "weekly"])
+        & travel_time.between(60, 5400)
+        & bathrooms.between(1, 6)
+        & price_per_bed.between(100, 10000)
     )
 
-    # Filter for rows where priceFrequency is 'monthly' or 'weekly' (after adjustment)
-    reg_data = df[df["priceFrequency"].isin(["monthly", "weekly"])]
-
-    # Eliminate all rows where travel_time is non-numeric or not between 60 and 5400 seconds
-    reg_data = reg_data[pd.to_numeric(reg_data["travel_time"], errors="coerce").between(60, 5400)]
+    # Take the rows that pass in one go, with the adjusted price_per_bed
+    reg_data = df.loc[mask].copy()
+    reg_data["price_per_bed"] = price_per_bed[mask]
 
-    # Eliminate all rows where bathrooms is non-numeric or not between 1 and 6
-    reg_data = reg_data[pd.to_numeric(reg_data["bathrooms"], errors="coerce").between(1, 6)]
-
-    # Filter for rows where price_per_bed is a valid number between 100 and 10,000
-    reg_data = reg_data[pd.to_numeric(reg_data["price_per_bed"], errors="coerce").between(100, 10000)]
-    
     # return the clean data
     return reg_data
 
@@ -240,73 +691,183 @@ def clean_for_reg(df: pd.DataFrame) -> pd.DataFrame:
 
 # TRAVEL TIME DATA
 
-## Define a function that generates a payload to pass into the API
-
-def create_payload(df: pd.DataFrame, search_id: str="1", transportation_type: str = "public_transport") -> dict:
+## Settings for the TravelTime API
+TRAVELTIME_URL = "https://api.traveltimeapp.com/v4/time-filter"
+# the API accepts at most 2000 arrival locations per search
+MAX_LOCATIONS_PER_SEARCH = 2000
+# Origin (Bank Station - a key commuting hub)
+ORIGIN = {
+    "id": "Origin",
+    "coords": {"lat": 51.513, "lng": -0.088}
+}
+# Commute time window
+ARRIVAL_TIME_PERIOD = "weekday_morning"
+
+
+## Define a function that generates a payload for a set of locations
+def build_payload(ids: List[str], lats: List[float], lngs: List[float], search_id: str = "1",
+                  transportation_type: str = "public_transport") -> dict:
     """
-    Creates a payload dictionary for the TravelTime API using property locations from a DataFrame.
-    The payload includes an origin (Bank Station) and destination locations (properties), 
-    and sets up the search parameters for a one-to-many public transport commute time query.
+    Builds one TravelTime one_to_many payload from plain lists of ids and coordinates,
+    with the origin (Bank Station) as the departure location.
     """
-    # Define origin (Bank Station - a key commuting hub)
-    origin = {
-        "id": "Origin",
-        "coords": {"lat": 51.513, "lng": -0.088}
-    }
-    # Ensure the 'id' column is of string type for API compatibility
-    df["id"] = df["id"].astype(str)
-
-    # Select and rename latitude/longitude columns for API format
-    locations = df[["id", "latitude", "longitude"]].rename(
-        columns={"latitude": "lat", "longitude": "lng"}
-    )
-
-    # Convert DataFrame rows to a list of dicts for each destination
-    destinations = locations.to_dict(orient="records")
+    # Zip the columns together into the API's location format
     destination_locations = [
-        {
-            "id": d["id"],
-            "coords": {"lat": d["lat"], "lng": d["lng"]}
-        } for d in destinations
+        {"id": i, "coords": {"lat": lat, "lng": lng}} for i, lat, lng in zip(ids, lats, lngs)
     ]
 
     # Build the final payload structure for the API request
-    payload = {
+    return {
         "arrival_searches": {
             "one_to_many": [
                 {
                     "id": search_id,  # Unique search identifier
                     "departure_location_id": "Origin",  # Start from Bank Station
-                    "arrival_location_ids": df["id"].tolist(),  # List of property IDs as destinations
+                    "arrival_location_ids": ids,  # List of property IDs as destinations
                     "transportation": {"type": transportation_type},  # Mode of transport
                     "travel_time": 10800,  # Max travel time in seconds (3 hours)
-                    "arrival_time_period": "weekday_morning",  # Commute time window
+                    "arrival_time_period": ARRIVAL_TIME_PERIOD,  # Commute time window
                     "properties": ["travel_time", "distance"]  # Data to return
                 }
             ]
         },
-        "locations": [origin] + destination_locations  # All locations (origin + destinations)
+        "locations": [ORIGIN] + destination_locations  # All locations (origin + destinations)
     }
 
-    return payload
+
+## Define a function that generates a payload to pass into the API
+def create_payload(df: pd.DataFrame, search_id: str="1", transportation_type: str = "public_transport") -> dict:
+    """
+    Creates a payload dictionary for the TravelTime API using property locations from a DataFrame.
+    The payload includes an origin (Bank Station) and destination locations (properties), 
+    and sets up the search parameters for a one-to-many public transport commute time query.
+    For more than MAX_LOCATIONS_PER_SEARCH properties use iter_payloads instead.
+    """
+    # Extract the columns as plain lists (ids as strings for API compatibility),
+    # leaving the caller's DataFrame untouched
+    ids = df["id"].astype(str).tolist()
+    return build_payload(ids, df["latitude"].tolist(), df["longitude"].tolist(), search_id, transportation_type)
+
+
+## Define a generator that splits the properties into payloads within the API limits
+def iter_payloads(df: pd.DataFrame, chunk_size: int = MAX_LOCATIONS_PER_SEARCH,
+                  transportation_type: str = "public_transport"):
+    """
+    Yields one payload per chunk of at most `chunk_size` properties, with the chunk number
+    as the search id. The id and coordinate columns are pulled out once as arrays and
+    sliced per chunk, rather than converting the frame to a list of row dicts.
+    """
+    chunk_size = min(chunk_size, MAX_LOCATIONS_PER_SEARCH)
+    ids = df["id"].astype(str).to_numpy()
+    lats = df["latitude"].to_numpy(dtype="float64")
+    lngs = df["longitude"].to_numpy(dtype="float64")
+    for n, start in enumerate(range(0, len(ids), chunk_size)):
+        end = start + chunk_size
+        yield build_payload(ids[start:end].tolist(), lats[start:end].tolist(), lngs[start:end].tolist(),
+                            str(n), transportation_type)
+
+
+## Define a function that sends the payloads and merges the results back in
+@instr.timed("travel_time.fetch", rows=len)
+async def fetch_travel_times(df: pd.DataFrame, app_id: str, api_key: str,
+                             chunk_size: int = MAX_LOCATIONS_PER_SEARCH, max_concurrency: int = 4,
+                             transportation_type: str = "public_transport",
+                             cache: CommuteCache = None) -> pd.DataFrame:
+    """
+    Queries the TravelTime API for every property in `df`, sending the chunked payloads from
+    iter_payloads concurrently over one pooled client, and returns a copy of `df` with the
+    travel_time and distance columns filled in (left null for unreachable properties).
+
+    If a CommuteCache is given, properties in an already cached grid cell are filled from the
+    cache, only one property per uncached cell is sent to the API, and its result is stored
+    and shared with the rest of that cell. The cache must be for the same origin, transport
+    mode and arrival period as the query (ValueError otherwise), so it never hands out
+    commute times for a different journey.
+    """
+    if cache is not None:
+        cache.check((ORIGIN["coords"]["lat"], ORIGIN["coords"]["lng"]), transportation_type, ARRIVAL_TIME_PERIOD)
+        # Look up the cached cells first
+        df = df.assign(_position=np.arange(len(df)))
+        hits, misses = cache.lookup(df)
+        if len(misses):
+            # Only query one representative property per uncached cell
+            cell_lat, cell_lng = cache.cells(misses)
+            first_in_cell = ~pd.DataFrame({"lat": cell_lat, "lng": cell_lng}).duplicated().to_numpy()
+            queried = await query_travel_times(misses[first_in_cell], app_id, api_key, chunk_size,
+                                               max_concurrency, transportation_type)
+            cache.store(queried)
+            misses, _ = cache.lookup(misses, record=False)
+        # Put the rows back into their original order
+        resolved = pd.concat([hits, misses]).sort_values("_position")
+        return resolved.drop(columns="_position").set_axis(df.index)
+    return await query_travel_times(df, app_id, api_key, chunk_size, max_concurrency, transportation_type)
+
+
+## Send the payloads for every property and merge the results back in (no cache)
+async def query_travel_times(df: pd.DataFrame, app_id: str, api_key: str,
+                             chunk_size: int = MAX_LOCATIONS_PER_SEARCH, max_concurrency: int = 4,
+                             transportation_type: str = "public_transport") -> pd.DataFrame:
+    headers = {
+        "Content-Type": "application/json",
+        "X-Application-Id": app_id,
+        "X-Api-Key": api_key,
+    }
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def send(tt_client, payload):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await tt_client.post(TRAVELTIME_URL, json=payload)
+            instr.record_http(response.status_code, time.perf_counter() - start, len(response.content), host="traveltime")
+            response.raise_for_status()
+            with instr.span("travel_time.json_decode", nbytes=len(response.content)):
+                return response.json()
+
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=60) as tt_client:
+        replies = await asyncio.gather(*(send(tt_client, payload)
+                                         for payload in iter_payloads(df, chunk_size, transportation_type)))
+
+    # Collect the reachable locations of every reply into flat columns
+    ids, travel_times, distances = [], [], []
+    for reply in replies:
+        for result in reply.get("results", []):
+            for location in result.get("locations", []):
+                props = location["properties"][0]
+                ids.append(location["id"])
+                travel_times.append(props.get("travel_time"))
+                distances.append(props.get("distance"))
+    found = pd.DataFrame({"travel_time": travel_times, "distance": distances}, index=ids)
+
+    # Merge the results back onto the properties by id
+    df = df.copy()
+    matched = found.reindex(df["id"].astype(str).to_numpy())
+    df["travel_time"] = matched["travel_time"].to_numpy()
+    df["distance"] = matched["distance"].to_numpy()
+    return df
 
 
 # Find underpriced flats relative to others with the same travel time
-def find_underpriced(df, user_budget=1200):
+def find_underpriced(df, user_budget=1200, k=None):
     """Finds underpriced flats relative to others with the same travel time.
     Takes as input a dataframe with the information, and the user's budget, and outputs a sorted 
     dataframe with the most underpriced rental properties at the top, and
     a recommendation with a link to the most ideal such property.
+    If k is given, only the top k properties are returned, which avoids sorting every flat in budget.
+    For many queries over the same data, build a ranking.UnderpricedIndex once instead.
     """
-    # Make a copy and calculate savings
-    df = df.copy()
-    df['savings'] = df['predicted_price_per_bed'] - df['price_per_bed']
-
-    # Filter by budget
-    budget_data = df[df['price_per_bed'] <= user_budget]
-
-    # Sort descending by savings
-    sorted_data = budget_data.sort_values(by='savings', ascending=False)
+    # Filter by budget first, so only the affordable rows are copied
+    price = df['price_per_bed'].to_numpy(dtype="float64", na_value=np.nan)
+    savings = df['predicted_price_per_bed'].to_numpy(dtype="float64", na_value=np.nan) - price
+    rows = np.flatnonzero(price <= user_budget)
+
+    # Sort descending by savings (after picking out the top k, if asked for)
+    if k is not None and len(rows) > k:
+        rows = rows[np.argpartition(-np.nan_to_num(savings[rows], nan=-np.inf), k - 1)[:k]]
+    # (argsort puts NaN savings last, as sort_values does)
+    order = np.argsort(-savings[rows], kind="stable")
+    sorted_data = df.iloc[rows[order]].copy()
+    sorted_data['savings'] = savings[rows[order]]
 
     # Print the top property
     if not sorted_data.empty:
@@ -0,0 +1,280 @@
+# This module does growth accounting and Solow projections for every country at
+# once, holding each PWT/OECD variable as a NumPy array over a country x year grid
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import Dict, List
+import warnings
+
+
+# DEFAULT PARAMETERS
+ALPHA = 0.3  # output elasticity of capital
+
+
+# PANELS
+
+class Panel:
+    """
+    A balanced country x year grid of variables.
+
+    Attributes:
+        countries: array of the country codes (rows).
+        years: array of the years (columns), consecutive.
+        data: dict mapping each variable name to a (countries x years) float array,
+              with NaN where a country has no observation.
+    """
+
+    def __init__(self, countries: np.ndarray, years: np.ndarray, data: Dict[str, np.ndarray]):
+        self.countries = countries
+        self.years = years
+        self.data = data
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.data[name]
+
+    def __setitem__(self, name: str, values: np.ndarray):
+        self.data[name] = values
+
+    def to_frame(self, names: List[str] = None, country_col: str = "countrycode", year_col: str = "year") -> pd.DataFrame:
+        """Flattens the grid back into a long DataFrame with one row per country and year."""
+        names = list(self.data) if names is None else names
+        frame = {
+            country_col: np.repeat(self.countries, len(self.years)),
+            year_col: np.tile(self.years, len(self.countries)),
+        }
+        for name in names:
+            frame[name] = self.data[name].ravel()
+        return pd.DataFrame(frame)
+
+
+## Build a panel from a long DataFrame (e.g. the PWT data)
+def to_panel(df: pd.DataFrame, value_cols: List[str], country_col: str = "countrycode",
+             year_col: str = "year") -> Panel:
+    """
+    Scatters the rows of a long DataFrame into (countries x years) arrays, one per value
+    column. Years missing in between are included as NaN so every row shares one time axis.
+    """
+    country_codes, countries = pd.factorize(df[country_col], sort=True)
+    years_observed = df[year_col].to_numpy()
+    first, last = int(years_observed.min()), int(years_observed.max())
+    years = np.arange(first, last + 1)
+    year_codes = years_observed.astype("int64") - first
+
+    data = {}
+    for col in value_cols:
+        grid = np.full((len(countries), len(years)), np.nan)
+        grid[country_codes, year_codes] = df[col].to_numpy(dtype="float64")
+        data[col] = grid
+    return Panel(np.asarray(countries), years, data)
+
+
+## Build the PWT panel with labour input L = emp * avh
+def pwt_panel(pwt: pd.DataFrame) -> Panel:
+    """Builds a Panel from the PWT columns, adding labour input (hours) as `L`."""
+    panel = to_panel(pwt, ["rgdpna", "rnna", "emp", "avh", "rtfpna", "delta", "pop"])
+    panel["L"] = panel["emp"] * panel["avh"]
+    return panel
+
+
+## Build the OECD panel from the long (one row per measure) csv
+def oecd_panel(oecd: pd.DataFrame) -> Panel:
+    """
+    Builds a Panel of gdp_ppp and labour_force from the raw OECD data
+    (REF_AREA, TIME_PERIOD, Measure, OBS_VALUE), without a pandas pivot.
+    """
+    measures = {
+        "Gross domestic product, volume in USD, at constant purchasing power parities": "gdp_ppp",
+        "Labour force": "labour_force",
+    }
+    names = oecd["Measure"].map(measures)
+    countries_codes, countries = pd.factorize(oecd["REF_AREA"], sort=True)
+    years_observed = oecd["TIME_PERIOD"].to_numpy().astype("int64")
+    first = years_observed.min()
+    years = np.arange(first, years_observed.max() + 1)
+
+    data = {}
+    for name in measures.values():
+        rows = (names == name).to_numpy()
+        grid = np.full((len(countries), len(years)), np.nan)
+        grid[countries_codes[rows], years_observed[rows] - first] = oecd["OBS_VALUE"].to_numpy(dtype="float64")[rows]
+        data[name] = grid
+    return Panel(np.asarray(countries), years, data)
+
+
+# GROWTH ACCOUNTING
+
+## Log growth rates along the year axis (NaN for the first year)
+def log_growth(x: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log(x)
+    growth = np.full_like(logs, np.nan)
+    growth[..., 1:] = np.diff(logs, axis=-1)
+    return growth
+
+
+## Decompose output growth into capital, labour and TFP contributions
+def growth_accounting(panel: Panel, alpha: float = ALPHA, output: str = "rgdpna",
+                      capital: str = "rnna", labour: str = "L") -> Dict[str, np.ndarray]:
+    """
+    Decomposes output growth for every country and year at once, assuming
+    Y = A K^alpha L^(1 - alpha):
+
+        g_Y = alpha g_K + (1 - alpha) g_L + g_A
+
+    and per hour worked (y = Y / L):
+
+        g_y = alpha (g_K - g_L) + g_A
+
+    Returns a dict of (countries x years) arrays: output_growth, capital_contribution,
+    labour_contribution, tfp_contribution, output_per_hour_growth and capital_deepening.
+    """
+    g_Y = log_growth(panel[output])
+    g_K = log_growth(panel[capital])
+    g_L = log_growth(panel[labour])
+
+    capital_contribution = alpha * g_K
+    labour_contribution = (1 - alpha) * g_L
+    tfp_contribution = g_Y - capital_contribution - labour_contribution
+    return {
+        "output_growth": g_Y,
+        "capital_contribution": capital_contribution,
+        "labour_contribution": labour_contribution,
+        "tfp_contribution": tfp_contribution,
+        "output_per_hour_growth": g_Y - g_L,
+        "capital_deepening": alpha * (g_K - g_L),
+    }
+
+
+## Average each component over a window of years
+def average_contributions(components: Dict[str, np.ndarray], years: np.ndarray, start: int, end: int) -> Dict[str, np.ndarray]:
+    """Averages every component over the years start..end (inclusive), ignoring NaNs."""
+    window = (years >= start) & (years <= end)
+    with warnings.catch_warnings():
+        # countries without any data in the window give all-NaN rows (and a NaN average)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {name: np.nanmean(values[:, window], axis=1) for name, values in components.items()}
+
+
+# SOLOW MODEL
+
+## Estimate each country's parameters from the recent past
+def estimate_parameters(panel: Panel, window: int = 20, output: str = "rgdpna", capital: str = "rnna",
+                        labour: str = "L", tfp: str = "rtfpna") -> Dict[str, np.ndarray]:
+    """
+    Estimates per-country Solow parameters over the last `window` years of the panel:
+    the savings rate s from the capital accumulation identity K' = s Y + (1 - delta) K,
+    labour growth n, TFP growth g, and the average depreciation rate delta.
+    """
+    Y, K, L, A, delta = panel[output], panel[capital], panel[labour], panel[tfp], panel["delta"]
+    recent = slice(-window, None)
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        # countries without any data in the window give all-NaN rows (and NaN parameters)
+        warnings.simplefilter("ignore", RuntimeWarning)
+        s = (K[:, 1:] - (1 - delta[:, :-1]) * K[:, :-1]) / Y[:, :-1]
+        return {
+            "s": np.nanmean(s[:, recent], axis=1),
+            "n": np.nanmean(log_growth(L)[:, recent], axis=1),
+            "g": np.nanmean(log_growth(A)[:, recent], axis=1),
+            "delta": np.nanmean(delta[:, recent], axis=1),
+        }
+
+
+## Steady-state capital per effective worker
+def solow_steady_state(s, n, g, delta, alpha: float = ALPHA):
+    """
+    Steady-state capital per effective unit of labour, k* = (s / (n + g + delta))^(1 / (1 - alpha)),
+    and output per effective unit of labour, y* = k*^alpha. Works elementwise on arrays.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k_star = (np.asarray(s) / (np.asarray(n) + np.asarray(g) + np.asarray(delta))) ** (1 / (1 - alpha))
+    return k_star, k_star ** alpha
+
+
+## Project output and capital forward for every country (and scenario) at once
+def project_solow(K0, A0, L0, s, n, g, delta, horizon: int = 10, alpha: float = ALPHA, level=1.0,
+                  level_trend=0.0) -> Dict[str, np.ndarray]:
+    """
+    Simulates Y_t = level_t * A_t K_t^alpha L_t^(1 - alpha) and K_{t+1} = s Y_t + (1 - delta) K_t,
+    with A and L growing at rates g and n, for `horizon` years after the starting values.
+    The level constant follows the linear trend level_t = level + level_trend * t.
+
+    All arguments broadcast against each other, so passing country vectors projects every
+    country at once, and adding a leading scenario axis to s, n, g or delta (e.g. shape
+    (scenarios, 1)) projects every scenario for every country in the same loop.
+    The only loop is over time, which is inherently sequential.
+
+    Returns a dict of arrays Y, K, A, L with a trailing time axis of length horizon + 1.
+    """
+    K0, A0, L0, s, n, g, delta, level, level_trend = np.broadcast_arrays(
+        *(np.asarray(x, dtype="float64") for x in (K0, A0, L0, s, n, g, delta, level, level_trend))
+    )
+    shape = K0.shape + (horizon + 1,)
+    steps = np.arange(horizon + 1)
+    A = A0[..., None] * np.exp(g[..., None] * steps)
+    L = L0[..., None] * np.exp(n[..., None] * steps)
+    level = level[..., None] + level_trend[..., None] * steps
+    K = np.empty(shape)
+    Y = np.empty(shape)
+    K[..., 0] = K0
+    for t in range(horizon + 1):
+        Y[..., t] = level[..., t] * A[..., t] * K[..., t] ** alpha * L[..., t] ** (1 - alpha)
+        if t < horizon:
+            K[..., t + 1] = s * Y[..., t] + (1 - delta) * K[..., t]
+    return {"Y": Y, "K": K, "A": A, "L": L}
+
+
+## Latest non-missing value of each row
+def last_valid(x: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(x)
+    last = x.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    values = x[np.arange(x.shape[0]), last]
+    values[~valid.any(axis=1)] = np.nan
+    return values
+
+
+## Position of the latest column in which every one of the arrays is observed (-1 if none)
+def last_complete(*arrays: np.ndarray) -> np.ndarray:
+    valid = np.logical_and.reduce([~np.isnan(x) for x in arrays])
+    last = valid.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    last[~valid.any(axis=1)] = -1
+    return last
+
+
+## Project every country forward from its latest observation
+def project_panel(panel: Panel, horizon: int = 10, alpha: float = ALPHA, window: int = 20,
+                  scenarios: Dict[str, Dict[str, float]] = None) -> Dict[str, np.ndarray]:
+    """
+    Projects output for every country from the last year in which its output, capital, TFP
+    and labour are all observed, with parameters from estimate_parameters and a level
+    constant calibrated so the model matches output in that year. Countries without such a
+    year are projected as NaN.
+
+    `scenarios` maps a scenario name to shocks added to the estimated parameters, e.g.
+    {"tariffs": {"g": -0.005, "s": -0.01}}; the returned arrays then have a leading
+    scenario axis in the order of the dict (the baseline is always first), and "base" holds
+    each country's starting column in the panel (-1 if it has none).
+    """
+    params = estimate_parameters(panel, window, labour="L")
+    # every starting value comes from the same year, so the calibration doesn't mix years
+    names = ("rnna", "rtfpna", "L", "rgdpna")
+    base = last_complete(*(panel[name] for name in names))
+    found = base >= 0
+    at_base = np.where(found, base, 0)
+    K0, A0, L0, Y0 = (np.where(found, panel[name][np.arange(len(base)), at_base], np.nan) for name in names)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        level = Y0 / (A0 * K0 ** alpha * L0 ** (1 - alpha))
+
+    scenarios = {"baseline": {}, **(scenarios or {})}
+    # Stack each parameter into a (scenarios x countries) array
+    stacked = {
+        name: np.stack([values + shocks.get(name, 0.0) for shocks in scenarios.values()])
+        for name, values in params.items()
+    }
+    projection = project_solow(K0, A0, L0, stacked["s"], stacked["n"], stacked["g"], stacked["delta"],
+                               horizon, alpha, level)
+    projection["scenarios"] = np.array(list(scenarios))
+    projection["base"] = base
+    return projection
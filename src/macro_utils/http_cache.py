@@ -0,0 +1,222 @@
+# This module stores an on-disk cache of HTTP responses, so that re-running
+# a notebook or script does not re-download identical pages from the APIs
+
+
+# IMPORT PACKAGES
+# Web - Scraping and API Requests
+import httpx
+from urllib.parse import urlencode
+
+# Storage
+import sqlite3
+import json
+import hashlib
+
+# Data structures
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Timing
+import time
+
+
+# DEFAULT SETTINGS
+
+## How long (in seconds) a cached response stays fresh, by a substring of the url
+DEFAULT_TTLS = {
+    "/typeAhead/": 7 * 24 * 3600,  # location tokens hardly ever change
+    "/api/_search": 3600,  # search pages change as listings come and go
+}
+
+## Fallback freshness for any other url
+DEFAULT_TTL = 3600
+
+
+# THE CACHE
+
+class ResponseCache:
+    """
+    SQLite-backed cache of GET responses, keyed by url and query parameters.
+
+    - Fresh entries (younger than the TTL for their endpoint) are served without any network call,
+      from an in-memory LRU layer if they were used recently, else from the SQLite file.
+    - Stale entries are revalidated with If-None-Match / If-Modified-Since when the server sent an
+      ETag or Last-Modified header; a 304 reply refreshes the entry instead of re-downloading it.
+    - Once the stored bodies exceed `max_bytes`, the least recently used entries are evicted.
+
+    Only 200 responses are stored.
+    """
+
+    def __init__(self, path: str = ":memory:", ttls: Optional[Dict[str, float]] = None,
+                 default_ttl: float = DEFAULT_TTL, max_bytes: int = 256 * 1024 ** 2,
+                 memory_entries: int = 256):
+        self.path = path
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        # access times of cache hits, written to disk in one batch rather than on every hit
+        self.pending_access = {}
+        # Open the database and make sure the table exists
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                stored_at REAL,
+                last_access REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(url: str, params: Optional[dict] = None) -> str:
+        """Hashes the url and (sorted) query parameters into a cache key."""
+        if params:
+            url = url + ("&" if "?" in url else "?") + urlencode(sorted(params.items()))
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def ttl_for(self, url: str) -> float:
+        # Use the TTL of the first endpoint pattern contained in the url
+        for pattern, ttl in self.ttls.items():
+            if pattern in url:
+                return ttl
+        return self.default_ttl
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """Returns the stored entry for a key (or None), checking memory before disk."""
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+            return entry
+        row = self.conn.execute(
+            "SELECT url, status, headers, body, stored_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        entry = {"url": row[0], "status": row[1], "headers": json.loads(row[2]), "body": row[3], "stored_at": row[4]}
+        self.remember(key, entry)
+        return entry
+
+    def remember(self, key: str, entry: dict):
+        # Keep the entry in the in-memory LRU layer
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def store(self, key: str, response: httpx.Response):
+        """Writes a response to the cache and evicts old entries if it has grown too large."""
+        now = time.time()
+        headers = {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "etag", "last-modified")}
+        body = response.content
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, str(response.request.url), response.status_code, json.dumps(headers), body, len(body), now, now),
+        )
+        self.conn.commit()
+        self.remember(key, {"url": str(response.request.url), "status": response.status_code,
+                            "headers": headers, "body": body, "stored_at": now})
+        self.evict()
+
+    def touch(self, key: str, refreshed: bool = False):
+        # Record the access time (and the new storage time after a 304)
+        now = time.time()
+        if refreshed:
+            self.conn.execute("UPDATE responses SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, key))
+            self.conn.commit()
+            # the entry is only in memory if the LRU layer kept it (never with memory_entries=0)
+            if key in self.memory:
+                self.memory[key]["stored_at"] = now
+        else:
+            self.pending_access[key] = now
+
+    def flush_access(self):
+        # Write the batched access times of cache hits to disk
+        if self.pending_access:
+            self.conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                  [(t, key) for key, t in self.pending_access.items()])
+            self.conn.commit()
+            self.pending_access = {}
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits within max_bytes."""
+        self.flush_access()
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+            self.memory.pop(key, None)
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.conn.commit()
+
+    @staticmethod
+    def to_response(url: str, entry: dict) -> httpx.Response:
+        # Rebuild an httpx Response so callers can't tell a cached reply from a live one
+        return httpx.Response(entry["status"], headers=entry["headers"], content=entry["body"],
+                              request=httpx.Request("GET", url))
+
+    async def get(self, client: httpx.AsyncClient, url: str, params: Optional[dict] = None) -> httpx.Response:
+        """
+        GETs `url` through the cache: fresh entries are returned straight away, stale ones are
+        revalidated (conditionally where possible), and misses go to the network via `client`.
+        """
+        key = self.make_key(url, params)
+        entry = self.lookup(key)
+
+        # Serve fresh entries without touching the network
+        if entry is not None and time.time() - entry["stored_at"] < self.ttl_for(url):
+            self.hits += 1
+            self.touch(key)
+            return self.to_response(url, entry)
+
+        # Revalidate stale entries with a conditional request
+        headers = {}
+        if entry is not None:
+            stored_headers = {k.lower(): v for k, v in entry["headers"].items()}
+            if "etag" in stored_headers:
+                headers["If-None-Match"] = stored_headers["etag"]
+            if "last-modified" in stored_headers:
+                headers["If-Modified-Since"] = stored_headers["last-modified"]
+
+        self.misses += 1
+        response = await client.get(url, params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            self.touch(key, refreshed=True)
+            return self.to_response(url, entry)
+        if response.status_code == 200:
+            self.store(key, response)
+        return response
+
+    def clear(self):
+        """Deletes every cached response."""
+        self.conn.execute("DELETE FROM responses")
+        self.conn.commit()
+        self.memory.clear()
+        self.pending_access = {}
+
+    def close(self):
+        self.flush_access()
+        self.conn.close()
+
+    def stats(self) -> dict:
+        self.flush_access()
+        n, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": n, "bytes": size, "hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
@@ -0,0 +1,432 @@
+# This module collects timings and counters from the hot paths (scraping, cleaning,
+# modelling and writing to the databases), so a slow run can be broken down into HTTP,
+# JSON decoding, pandas transforms and database round-trips. It is off by default, and
+# while off every hook is a single flag check
+#
+# Usage:
+#   from macro_utils import instrumentation as instr
+#   instr.enable(profile=True)            # optionally with cProfile / tracemalloc per span
+#   ... run the pipeline ...
+#   instr.write("metrics.json")           # or "metrics.prom" for Prometheus text
+
+
+# IMPORT PACKAGES
+# Timing (standard library only, so importing this module is cheap; the profilers
+# are only imported when profiling or memory tracing is switched on)
+import functools
+import inspect
+import json
+import threading
+import time
+
+# File and System Operations
+import os
+
+
+# SETTINGS
+ENABLED = False
+PROFILE = False  # cProfile each outermost span
+TRACE_MEMORY = False  # record each span's peak traced memory
+PROFILE_DIR = None  # also dump the .prof files here (for snakeviz etc.)
+PROFILE_TOP = 25  # functions kept in each span's text profile
+METRIC_PREFIX = "macro_utils"
+
+
+class Metrics:
+    """
+    Thread-safe store of everything recorded while instrumentation is enabled:
+    - spans: name -> calls, errors, wall and CPU seconds (total and max), rows, bytes, peak memory
+    - counters: (name, labels) -> value, e.g. HTTP responses by status
+    - timings: (name, labels) -> count, total, max seconds, e.g. DB statements by verb
+    - profiles: span name -> text summary of the last cProfile capture
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+            self.timings = {}
+            self.profiles = {}
+            self.started = time.time()
+
+    def add_span(self, name, wall, cpu, rows, nbytes, error, peak_memory=None):
+        with self.lock:
+            span = self.spans.get(name)
+            if span is None:
+                span = self.spans[name] = {"calls": 0, "errors": 0, "wall_seconds": 0.0, "max_wall_seconds": 0.0,
+                                           "cpu_seconds": 0.0, "rows": 0, "bytes": 0, "peak_memory_bytes": 0}
+            span["calls"] += 1
+            span["errors"] += int(error)
+            span["wall_seconds"] += wall
+            span["max_wall_seconds"] = max(span["max_wall_seconds"], wall)
+            span["cpu_seconds"] += cpu
+            span["rows"] += rows
+            span["bytes"] += nbytes
+            if peak_memory is not None:
+                span["peak_memory_bytes"] = max(span["peak_memory_bytes"], peak_memory)
+
+    def add_count(self, name, value=1, labels=()):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_timing(self, name, seconds, labels=()):
+        key = (name, labels)
+        with self.lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = {"count": 0, "seconds": 0.0, "max_seconds": 0.0}
+            timing["count"] += 1
+            timing["seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+    # Exporting
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "started": self.started,
+                "exported": time.time(),
+                "spans": {name: dict(span) for name, span in self.spans.items()},
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self.counters.items()],
+                "timings": [{"name": name, "labels": dict(labels), **timing}
+                            for (name, labels), timing in self.timings.items()],
+                "profiles": dict(self.profiles),
+            }
+
+    def to_json(self, indent=2) -> str:
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix: str = None) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        prefix = METRIC_PREFIX if prefix is None else prefix
+        data = self.to_dict()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            # samples: (labels dict, value)
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}")
+
+        spans = data["spans"]
+        for field, kind, help_text in [
+            ("calls", "counter", "Times each span ran."),
+            ("errors", "counter", "Times each span raised."),
+            ("wall_seconds", "counter", "Wall-clock seconds spent in each span."),
+            ("max_wall_seconds", "gauge", "Longest single run of each span."),
+            ("cpu_seconds", "counter", "CPU seconds of the calling thread in each span."),
+            ("rows", "counter", "Rows processed in each span."),
+            ("bytes", "counter", "Bytes transferred in each span."),
+            ("peak_memory_bytes", "gauge", "Peak traced memory in each span (with tracemalloc on)."),
+        ]:
+            name = f"span_{field}" + ("_total" if kind == "counter" else "")
+            family(name, kind, help_text, [({"span": span}, values[field]) for span, values in spans.items()])
+
+        counters = {}
+        for counter in data["counters"]:
+            counters.setdefault(counter["name"], []).append((counter["labels"], counter["value"]))
+        for name, samples in counters.items():
+            family(f"{name}_total", "counter", f"Count of {name.replace('_', ' ')}.", samples)
+
+        timings = {}
+        for timing in data["timings"]:
+            timings.setdefault(timing["name"], []).append(timing)
+        for name, entries in timings.items():
+            family(f"{name}_seconds_total", "counter", f"Seconds spent in {name.replace('_', ' ')}.",
+                   [(entry["labels"], entry["seconds"]) for entry in entries])
+            family(f"{name}_count_total", "counter", f"Number of {name.replace('_', ' ')} timed.",
+                   [(entry["labels"], entry["count"]) for entry in entries])
+            family(f"{name}_max_seconds", "gauge", f"Longest of the {name.replace('_', ' ')}.",
+                   [(entry["labels"], entry["max_seconds"]) for entry in entries])
+        return "\n".join(lines) + "\n"
+
+
+## Escape a Prometheus label value
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# THE SHARED STORE
+metrics = Metrics()
+# held while a span is being profiled: only one profiler can run at a time, so spans
+# nested in (or running alongside) a profiled span are timed but not profiled
+profiler_lock = threading.Lock()
+
+
+# TURNING IT ON AND OFF
+
+def enable(profile: bool = False, trace_memory: bool = False, profile_dir: str = None, reset: bool = True):
+    """Turns instrumentation on (optionally with per-span cProfile and tracemalloc capture)."""
+    global ENABLED, PROFILE, TRACE_MEMORY, PROFILE_DIR
+    if reset:
+        metrics.reset()
+    PROFILE, TRACE_MEMORY, PROFILE_DIR = profile, trace_memory, profile_dir
+    if trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED, PROFILE, TRACE_MEMORY
+    ENABLED = PROFILE = False
+    if TRACE_MEMORY:
+        import tracemalloc
+        tracemalloc.stop()
+    TRACE_MEMORY = False
+
+
+# RECORDING
+
+class Span:
+    """
+    Times a block (wall and calling-thread CPU time) and accumulates rows and bytes.
+    Created by span(); add to `rows`/`bytes` (or call add()) inside the block.
+    """
+
+    __slots__ = ("name", "rows", "bytes", "start", "cpu_start", "profiler", "cancelled")
+
+    def __init__(self, name: str, rows: int = 0, nbytes: int = 0):
+        self.name = name
+        self.rows = rows
+        self.bytes = nbytes
+        self.profiler = None
+        self.cancelled = False
+
+    def add(self, rows: int = 0, nbytes: int = 0):
+        self.rows += rows
+        self.bytes += nbytes
+
+    def cancel(self):
+        """Don't record this span (e.g. because the work it covers happens later)."""
+        self.cancelled = True
+
+    def __enter__(self):
+        if PROFILE and profiler_lock.acquire(blocking=False):
+            import cProfile
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # another profiler (outside this module) is already running
+                self.profiler = None
+                profiler_lock.release()
+        if TRACE_MEMORY:
+            import tracemalloc
+            # note: this resets the peak seen by any enclosing span too
+            tracemalloc.reset_peak()
+        self.cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu_start
+        peak = None
+        if TRACE_MEMORY:
+            import tracemalloc
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        if self.profiler is not None:
+            self.profiler.disable()
+            profiler_lock.release()
+            if not self.cancelled:
+                save_profile(self.name, self.profiler)
+        if not self.cancelled:
+            metrics.add_span(self.name, wall, cpu, int(self.rows), int(self.bytes), exc_type is not None, peak)
+        return False
+
+
+class NullSpan:
+    """What span() hands out while instrumentation is off: accepts the same calls and does nothing."""
+
+    __slots__ = ()
+    rows = 0
+    bytes = 0
+
+    def add(self, rows: int = 0, nbytes: int = 0):
+        pass
+
+    def cancel(self):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+## Time a block: with span("clean.filter_df", rows=len(df)) as s: ...
+def span(name: str, rows: int = 0, nbytes: int = 0):
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, rows, nbytes)
+
+
+## Time the iteration of a generator as one span
+def timed_iteration(name: str, iterator, rows=None):
+    """
+    Yields the items of `iterator`, recording the time spent producing them (but not the
+    time the consumer spends on each item) as one span once the iterator is used up or
+    closed. `rows` is an optional function of each item giving the rows in it.
+    Spans recorded this way aren't profiled.
+    """
+    wall = cpu = 0.0
+    n_rows = 0
+    error = False
+    try:
+        while True:
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            except BaseException:
+                error = True
+                raise
+            finally:
+                wall += time.perf_counter() - start
+                cpu += time.thread_time() - cpu_start
+            if rows is not None:
+                n_rows += rows(item)
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        metrics.add_span(name, wall, cpu, int(n_rows), 0, error)
+
+
+## Time every call of a function (sync or async)
+def timed(name: str = None, rows=None):
+    """
+    Decorator recording each call of the function as a span (named after the function by
+    default). `rows` is an optional function of the return value giving the rows processed,
+    e.g. rows=len. While instrumentation is off the wrapper only checks the flag.
+
+    If the function is a generator function, or returns a generator (e.g. read_table with a
+    chunksize), the span covers iterating over it rather than just creating it, and `rows`
+    is applied to each item.
+    """
+    def decorate(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return func(*args, **kwargs)
+                return timed_iteration(span_name, func(*args, **kwargs), rows)
+        elif inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await func(*args, **kwargs)
+                with Span(span_name) as s:
+                    result = await func(*args, **kwargs)
+                    if rows is not None:
+                        s.rows += rows(result)
+                return result
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return func(*args, **kwargs)
+                with Span(span_name) as s:
+                    result = func(*args, **kwargs)
+                    if inspect.isgenerator(result):
+                        # the work happens while the generator is iterated, so time that instead
+                        s.cancel()
+                        return timed_iteration(span_name, result, rows)
+                    if rows is not None:
+                        s.rows += rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+## Increment a counter, e.g. count("http_responses", status=200)
+def count(name: str, value: int = 1, **labels):
+    if ENABLED:
+        metrics.add_count(name, value, tuple(sorted(labels.items())))
+
+
+## Record one timing, e.g. observe("db_statement", 0.012, statement="INSERT")
+def observe(name: str, seconds: float, **labels):
+    if ENABLED:
+        metrics.add_timing(name, seconds, tuple(sorted(labels.items())))
+
+
+## Record one HTTP response (status 0 for a transport error)
+def record_http(status: int, seconds: float, nbytes: int = 0, host: str = ""):
+    if ENABLED:
+        labels = (("host", host), ("status", str(status)))
+        metrics.add_count("http_responses", 1, labels)
+        metrics.add_count("http_bytes", nbytes, (("host", host),))
+        metrics.add_timing("http_request", seconds, (("host", host),))
+
+
+# DATABASE STATEMENTS
+
+## Time every statement an engine sends (the listeners only check the flag while off)
+def instrument_engine(engine):
+    """Attaches SQLAlchemy cursor-execute listeners recording each statement's time by verb."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if ENABLED:
+            conn.info.setdefault("instrumentation_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("instrumentation_start")
+        if not (ENABLED and starts):
+            return
+        seconds = time.perf_counter() - starts.pop()
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        labels = (("dialect", engine.dialect.name), ("statement", verb))
+        metrics.add_timing("db_statement", seconds, labels)
+        if executemany and isinstance(parameters, (list, tuple)):
+            metrics.add_count("db_rows", len(parameters), labels)
+
+    return engine
+
+
+# PROFILES AND EXPORT
+
+def save_profile(name: str, profiler):
+    import io
+    import pstats
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    with metrics.lock:
+        metrics.profiles[name] = out.getvalue()
+    if PROFILE_DIR:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+
+
+## Write the metrics to a file: Prometheus text for .prom/.txt, JSON otherwise
+def write(path: str) -> str:
+    text = metrics.to_prometheus() if path.endswith((".prom", ".txt")) else metrics.to_json()
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+    return path
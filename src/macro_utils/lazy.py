@@ -0,0 +1,40 @@
+# This module lets the rest of the package refer to heavy dependencies (pandas,
+# httpx, sqlalchemy, ...) at module level without importing them until first use
+
+
+# IMPORT PACKAGES
+import importlib
+
+
+class LazyModule:
+    """
+    Stands in for a module and imports it on first attribute access.
+
+    After the import, the module's attributes are copied onto the stand-in, so later
+    lookups (e.g. `pd.DataFrame` inside a hot loop) cost the same as on the real module.
+    """
+
+    def __init__(self, name: str):
+        self._lazy_name = name
+
+    def _lazy_load(self):
+        module = importlib.import_module(self._lazy_name)
+        # don't overwrite attributes already set on the stand-in (e.g. by a test patching it)
+        for name, value in vars(module).items():
+            self.__dict__.setdefault(name, value)
+        return module
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found yet, i.e. before the import
+        if attr.startswith("_lazy"):
+            raise AttributeError(attr)
+        return getattr(self._lazy_load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._lazy_name}'>"
+
+
+## Refer to a module without importing it yet
+def lazy_import(name: str) -> LazyModule:
+    """Returns a LazyModule for `name` (an absolute module name)."""
+    return LazyModule(name)
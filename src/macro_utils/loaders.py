@@ -0,0 +1,142 @@
+# This module loads the raw Excel/CSV source files (PWT, OECD, CPI), parsing each
+# file only once and serving later loads from a binary columnar snapshot
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+
+# Fingerprinting
+import hashlib
+import json
+
+# File and System Operations
+import os
+
+
+# DIRECTORY SETUP
+current_dir = os.path.dirname(os.path.abspath(__file__))
+data_folder_path = os.path.join(current_dir, '..', '..', "data")
+snapshot_folder_path = os.path.join(data_folder_path, "snapshots")
+
+## The columns used from each source
+PWT_COLUMNS = ["countrycode", "country", "year", "rgdpo", "pop", "emp", "avh", "rgdpna", "rnna", "rtfpna", "delta"]
+OECD_COLUMNS = ["REF_AREA", "Reference area", "TIME_PERIOD", "Measure", "OBS_VALUE"]
+
+
+# FINGERPRINTS
+
+## Hash the contents of a file
+def file_hash(path: str, block_size: int = 1024 ** 2) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+## Name the snapshot after the source and the options it was parsed with
+def snapshot_name(path: str, reader: str, columns, read_kwargs: dict) -> str:
+    options = json.dumps({"reader": reader, "columns": columns, "kwargs": read_kwargs}, sort_keys=True, default=str)
+    tag = hashlib.sha256(options.encode()).hexdigest()[:12]
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{tag}"
+
+
+# LOADING
+
+## Load a source file, from its snapshot when the file has not changed
+def load_source(path: str, reader: str = "excel", columns=None, snapshot_dir: str = None,
+                refresh: bool = False, **read_kwargs) -> pd.DataFrame:
+    """
+    Loads an Excel or CSV file, keeping only `columns`, and caches the parsed result as a
+    Parquet snapshot (pickle if the columns can't be stored as Parquet).
+
+    A snapshot is reused when the source file's size and modification time are unchanged,
+    or, if those differ (e.g. the file was copied), when its SHA-256 hash is unchanged.
+    Otherwise the file is re-parsed and the snapshot replaced.
+
+    Args:
+        path: The source file.
+        reader: "excel" or "csv".
+        columns: Columns to keep (all if None).
+        snapshot_dir: Where snapshots are kept (defaults to data/snapshots).
+        refresh: Re-parse the file even if the snapshot is current.
+        **read_kwargs: Passed to pd.read_excel / pd.read_csv (e.g. sheet_name, header).
+    """
+    snapshot_dir = snapshot_folder_path if snapshot_dir is None else snapshot_dir
+    os.makedirs(snapshot_dir, exist_ok=True)
+    base = os.path.join(snapshot_dir, snapshot_name(path, reader, columns, read_kwargs))
+    meta_path = base + ".json"
+
+    # Compare the source file with the one the snapshot was made from
+    stat = os.stat(path)
+    meta = None
+    if os.path.exists(meta_path) and not refresh:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is not None and os.path.exists(meta["snapshot"]):
+        unchanged = meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns
+        if not unchanged and meta["size"] == stat.st_size:
+            # Only hash the file if the cheap check fails
+            unchanged = meta["sha256"] == file_hash(path)
+            if unchanged:
+                meta["mtime_ns"] = stat.st_mtime_ns
+                with open(meta_path, "w") as f:
+                    json.dump(meta, f)
+        if unchanged:
+            if meta["snapshot"].endswith(".parquet"):
+                return pd.read_parquet(meta["snapshot"])
+            return pd.read_pickle(meta["snapshot"])
+
+    # Parse the source file, reading only the wanted columns
+    if reader == "excel":
+        df = pd.read_excel(path, usecols=columns, **read_kwargs)
+    elif reader == "csv":
+        df = pd.read_csv(path, usecols=columns, **read_kwargs)
+    else:
+        raise ValueError(f"Unknown reader: {reader}")
+    if columns is not None:
+        df = df[list(columns)]
+
+    # Save the snapshot (falling back to pickle for mixed-type columns Parquet can't hold)
+    snapshot = base + ".parquet"
+    try:
+        df.to_parquet(snapshot, index=False)
+    except (ImportError, ValueError, TypeError, NotImplementedError):
+        # (pyarrow's conversion errors subclass these)
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+        snapshot = base + ".pkl"
+        df.to_pickle(snapshot)
+    with open(meta_path, "w") as f:
+        json.dump({"source": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                   "sha256": file_hash(path), "snapshot": snapshot}, f)
+    return df
+
+
+## Penn World Table
+def load_pwt(path: str = None, columns=PWT_COLUMNS, **kwargs) -> pd.DataFrame:
+    """Loads the PWT 10.01 'Data' sheet (only the growth-accounting columns by default)."""
+    path = os.path.join(data_folder_path, "pwt1001.xlsx") if path is None else path
+    return load_source(path, "excel", columns, sheet_name="Data", **kwargs)
+
+
+## OECD GDP (PPP) and labour force
+def load_oecd(path: str = None, columns=OECD_COLUMNS, **kwargs) -> pd.DataFrame:
+    """Loads the OECD annual GDP (PPP) and labour force csv."""
+    path = os.path.join(data_folder_path, "oecd_gdp_ppp_lf_annual.csv") if path is None else path
+    return load_source(path, "csv", columns, **kwargs)
+
+
+## CPI by item
+def load_cpi(path: str = None, columns=None, **kwargs) -> pd.DataFrame:
+    """Loads the CPI by item spreadsheet."""
+    path = os.path.join(data_folder_path, "cpi_by_item.xlsx") if path is None else path
+    return load_source(path, "excel", columns, **kwargs)
+
+
+## CPI relative importance weights
+def load_cpi_weights(path: str = None, columns=None, header: int = 7, **kwargs) -> pd.DataFrame:
+    """Loads the CPI weights spreadsheet (the table starts on row 8)."""
+    path = os.path.join(data_folder_path, "cpi_weights.xlsx") if path is None else path
+    return load_source(path, "excel", columns, header=header, **kwargs)
@@ -0,0 +1,187 @@
+# This module keeps columnar (Parquet) copies of the analysis tables next to the
+# SQL databases, so analysis can start by memory-mapping only the columns and
+# partitions it needs instead of materialising every row from SQL or Excel
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+
+# Columnar storage
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+# SQL tables
+from . import sql_queries as sqlq
+
+# File and System Operations
+import os
+import shutil
+import json
+
+
+# DIRECTORY SETUP
+current_dir = os.path.dirname(os.path.abspath(__file__))
+store_folder_path = os.path.join(current_dir, '..', '..', "data", "parquet")
+
+## The file, next to the data, holding each dataset's full schema (with the pandas dtypes)
+SCHEMA_FILE = "_common_metadata"
+
+## How each table is partitioned on disk (None for a single, unpartitioned dataset)
+DEFAULT_PARTITIONS = {
+    "properties_data": None,
+    "growth_data": ["country_id"],
+    "pwt": ["countrycode"],
+    "ts_data": None,
+    "cpi": ["series_id"],
+    "cpi_weights": None,
+}
+
+
+# WRITING
+
+## Write a DataFrame as a (partitioned) Parquet dataset
+def write_dataset(df: pd.DataFrame, name: str, partition_cols=None, root: str = None) -> str:
+    """
+    Writes a DataFrame to `root/name` as a Parquet dataset, replacing what was there.
+    The full schema (column order, types and pandas dtypes, including the partition
+    columns, which aren't stored in the data files) is saved alongside, so read_dataset
+    gives back the same columns and dtypes.
+
+    Args:
+        df: The data to write.
+        name: The dataset (table) name.
+        partition_cols: Columns to partition by as hive-style `col=value` folders
+            (defaults to DEFAULT_PARTITIONS for the name).
+        root: Folder holding the datasets (defaults to data/parquet).
+
+    Returns:
+        str: The path of the dataset folder.
+    """
+    root = store_folder_path if root is None else root
+    path = os.path.join(root, name)
+    if partition_cols is None:
+        partition_cols = DEFAULT_PARTITIONS.get(name)
+
+    # Replace the old dataset entirely, so removed rows and partitions disappear too
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    schema = arrow_table.schema.with_metadata({
+        **(arrow_table.schema.metadata or {}),
+        b"partition_cols": json.dumps(list(partition_cols or [])).encode(),
+    })
+    pq.write_metadata(schema, os.path.join(path, SCHEMA_FILE))
+    ds.write_dataset(
+        arrow_table,
+        path,
+        format="parquet",
+        partitioning=partition_cols,
+        partitioning_flavor="hive" if partition_cols else None,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return path
+
+
+# READING
+
+## Turn a where dict (same format as sql_queries.build_select) into an Arrow filter
+def build_filter(where: dict):
+    expression = None
+    for col, condition in (where or {}).items():
+        field = ds.field(col)
+        if isinstance(condition, tuple):
+            low, high = condition
+            parts = []
+            if low is not None:
+                parts.append(field >= low)
+            if high is not None:
+                parts.append(field <= high)
+        elif isinstance(condition, (list, set, frozenset)):
+            parts = [field.isin(list(condition))]
+        elif condition is None:
+            parts = [field.is_null()]
+        else:
+            parts = [field == condition]
+        for part in parts:
+            expression = part if expression is None else expression & part
+    return expression
+
+
+## The full schema saved by write_dataset (None for a dataset written without one)
+def saved_schema(name: str, root: str = None):
+    root = store_folder_path if root is None else root
+    schema_path = os.path.join(root, name, SCHEMA_FILE)
+    return pq.read_schema(schema_path) if os.path.exists(schema_path) else None
+
+
+## Open a dataset lazily, memory-mapping its files
+def open_dataset(name: str, root: str = None) -> ds.Dataset:
+    """
+    Opens a dataset with the schema saved by write_dataset, so the partition columns keep
+    their places and types (datasets written without one fall back to inferring the
+    partition columns, which then come last). Categorical partition columns are read as
+    their plain values; read_dataset turns them back into categoricals.
+    """
+    root = store_folder_path if root is None else root
+    path = os.path.join(root, name)
+    filesystem = pafs.LocalFileSystem(use_mmap=True)
+    schema = saved_schema(name, root)
+    if schema is None:
+        return ds.dataset(path, format="parquet", partitioning="hive", filesystem=filesystem)
+
+    partition_cols = json.loads(schema.metadata.get(b"partition_cols", b"[]"))
+    for col in partition_cols:
+        field = schema.field(col)
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(schema.get_field_index(col), field.with_type(field.type.value_type))
+    partitioning = None
+    if partition_cols:
+        partitioning = ds.partitioning(pa.schema([schema.field(col) for col in partition_cols]), flavor="hive")
+    return ds.dataset(path, schema=schema, format="parquet", partitioning=partitioning, filesystem=filesystem)
+
+
+## Read only the wanted columns and rows of a dataset
+def read_dataset(name: str, columns=None, where: dict = None, root: str = None) -> pd.DataFrame:
+    """
+    Reads a Parquet dataset into a DataFrame. Only the requested columns are decoded, and
+    the `where` filters (see sql_queries.build_select for the format) are pushed down to skip
+    whole partitions and row groups before any data is read.
+
+    The columns come back in the order and with the dtypes they were written with; the rows
+    of a partitioned dataset come back grouped by partition.
+    """
+    dataset = open_dataset(name, root)
+    arrow_table = dataset.to_table(columns=columns, filter=build_filter(where))
+    schema = saved_schema(name, root)
+    if schema is not None:
+        # back to the types as written (e.g. categorical partition columns)
+        arrow_table = arrow_table.cast(pa.schema([schema.field(col) for col in arrow_table.column_names],
+                                                 metadata=schema.metadata))
+    return arrow_table.to_pandas()
+
+
+## Check whether a dataset has been written yet
+def has_dataset(name: str, root: str = None) -> bool:
+    root = store_folder_path if root is None else root
+    return os.path.isdir(os.path.join(root, name))
+
+
+# SYNCING WITH THE SQL TABLES
+
+## Copy a SQL table into the Parquet store
+def sync_from_sql(name: str, engine, partition_cols=None, root: str = None) -> str:
+    """Reads a SQL table and (re)writes it as a Parquet dataset. Returns the dataset path."""
+    df = sqlq.read_table(name, engine)
+    return write_dataset(df, name, partition_cols, root)
+
+
+## Copy a Parquet dataset back into a SQL table
+def sync_to_sql(name: str, engine, if_exists: str = "replace", root: str = None) -> dict:
+    """Writes a Parquet dataset to the SQL table of the same name with the bulk loader."""
+    df = read_dataset(name, root=root)
+    return sqlq.make_table(df, name, engine, if_exists=if_exists, bulk=True)
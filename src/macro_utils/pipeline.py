@@ -0,0 +1,235 @@
+# This module runs a pipeline of named stages (e.g. scrape -> normalise -> travel time ->
+# model -> publish), checkpointing each stage's output under a content hash of its code,
+# parameters and inputs, so stages whose inputs haven't changed are skipped on the next
+# run, and stages that don't depend on each other run at the same time
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+from typing import Callable, Dict, List
+
+# Fingerprinting and saving out the checkpoints
+import hashlib
+import inspect
+import json
+import pickle
+import time
+
+# Running independent stages concurrently
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import threading
+
+# File and System Operations
+import os
+
+# Stage timings (off unless instrumentation.enable() is called)
+from . import instrumentation as instr
+
+# Tracking
+import logging
+
+
+# DIRECTORY SETUP
+current_dir = os.path.dirname(os.path.abspath(__file__))
+checkpoint_folder_path = os.path.join(current_dir, '..', '..', "data", "checkpoints")
+
+
+# FINGERPRINTS
+
+## Hash any stage output: DataFrames by their values, everything else by its pickle
+def data_hash(value) -> str:
+    digest = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        digest.update(json.dumps([list(map(str, value.columns)), list(map(str, value.dtypes))]).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+## Hash a stage function's source, so editing a stage invalidates its checkpoint
+def code_hash(func: Callable) -> str:
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = getattr(func, "__qualname__", repr(func))
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+class Stage:
+    """
+    One step of a pipeline.
+
+    Attributes:
+        name: Unique stage name.
+        func: Called as func(*outputs of the input stages, **params).
+        inputs: Names of the stages whose outputs are passed in, in order.
+        params: Keyword arguments for func; part of the checkpoint key.
+        fingerprint: Optional callable returning (JSON-able) state of the outside world the
+            stage reads, e.g. a row count of a table, also part of the checkpoint key.
+        checkpoint: If False, the stage runs every time (its output is still hashed).
+    """
+
+    def __init__(self, name: str, func: Callable, inputs: List[str] = (), params: dict = None,
+                 fingerprint: Callable = None, checkpoint: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.fingerprint = fingerprint
+        self.checkpoint = checkpoint
+
+    def key(self, input_hashes: List[str]) -> str:
+        """The content hash the stage's checkpoint is stored under."""
+        parts = {
+            "stage": self.name,
+            "code": code_hash(self.func),
+            "params": self.params,
+            "inputs": input_hashes,
+            "fingerprint": self.fingerprint() if self.fingerprint else None,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Pipeline:
+    """
+    Runs stages in dependency order, up to `max_workers` at a time, skipping those whose
+    checkpoint key is unchanged. A skipped stage's output is only read back from disk if a
+    later stage actually has to run.
+
+    Checkpoints are kept in `checkpoint_dir` as <stage>.json (key, output hash, timings)
+    next to the output itself (<stage>.parquet for DataFrames, <stage>.pkl otherwise).
+    """
+
+    def __init__(self, stages: List[Stage], checkpoint_dir: str = None, max_workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.checkpoint_dir = checkpoint_folder_path if checkpoint_dir is None else checkpoint_dir
+        self.max_workers = max_workers
+        for stage in stages:
+            missing = [name for name in stage.inputs if name not in self.stages]
+            if missing:
+                raise ValueError(f"Stage {stage.name!r} depends on unknown stages {missing}")
+
+    # Checkpoint files
+
+    def manifest_path(self, name: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{name}.json")
+
+    def read_manifest(self, name: str) -> dict:
+        try:
+            with open(self.manifest_path(name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_checkpoint(self, name: str, key: str, value, seconds: float) -> str:
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        output_hash = data_hash(value)
+        fmt = "pickle"
+        if isinstance(value, pd.DataFrame):
+            try:
+                value.to_parquet(os.path.join(self.checkpoint_dir, f"{name}.parquet"), index=False)
+                fmt = "parquet"
+            except (ImportError, ValueError, TypeError):
+                pass
+        if fmt == "pickle":
+            with open(os.path.join(self.checkpoint_dir, f"{name}.pkl"), "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # write the manifest last, so a half-written checkpoint is never trusted
+        with open(self.manifest_path(name), "w") as f:
+            json.dump({"key": key, "output_hash": output_hash, "format": fmt,
+                       "seconds": seconds, "saved_at": time.time()}, f)
+        return output_hash
+
+    def load_checkpoint(self, name: str):
+        manifest = self.read_manifest(name)
+        if manifest.get("format") == "parquet":
+            return pd.read_parquet(os.path.join(self.checkpoint_dir, f"{name}.parquet"))
+        with open(os.path.join(self.checkpoint_dir, f"{name}.pkl"), "rb") as f:
+            return pickle.load(f)
+
+    # Planning
+
+    def upstream(self, names: List[str]) -> List[str]:
+        """The named stages and everything they depend on, in dependency order."""
+        order, seen = [], set()
+
+        def visit(name, path=()):
+            if name in path:
+                raise ValueError(f"Stage dependency cycle: {' -> '.join(path + (name,))}")
+            if name in seen:
+                return
+            for dependency in self.stages[name].inputs:
+                visit(dependency, path + (name,))
+            seen.add(name)
+            order.append(name)
+
+        for name in names:
+            visit(name)
+        return order
+
+    # Running
+
+    def run(self, targets: List[str] = None, force: List[str] = ()) -> Dict[str, dict]:
+        """
+        Runs the `targets` stages (all by default) and the stages they depend on.
+
+        Args:
+            targets: Stage names to bring up to date.
+            force: Stage names to re-run even if their checkpoint is current ("all" for every stage).
+
+        Returns:
+            dict of stage name -> {"status": "ran" or "skipped", "seconds", "output_hash"}.
+        """
+        names = self.upstream(list(targets) if targets else list(self.stages))
+        force = set(names) if "all" in force else set(force)
+        report, values = {}, {}
+        lock = threading.Lock()
+
+        def value_of(name):
+            # outputs of skipped stages are only read from disk when needed
+            with lock:
+                if name not in values:
+                    values[name] = self.load_checkpoint(name)
+                return values[name]
+
+        def run_stage(name):
+            stage = self.stages[name]
+            start = time.perf_counter()
+            input_hashes = [report[dependency]["output_hash"] for dependency in stage.inputs]
+            key = stage.key(input_hashes)
+            manifest = self.read_manifest(name)
+            if stage.checkpoint and name not in force and manifest.get("key") == key:
+                logging.info(f"Stage {name}: unchanged, skipped")
+                instr.count("stages_skipped", stage=name)
+                return {"status": "skipped", "seconds": time.perf_counter() - start,
+                        "output_hash": manifest["output_hash"]}
+
+            logging.info(f"Stage {name}: running")
+            inputs = [value_of(dependency) for dependency in stage.inputs]
+            with instr.span(f"stage.{name}") as timing:
+                value = stage.func(*inputs, **stage.params)
+                timing.rows += len(value) if hasattr(value, "__len__") else 0
+            seconds = time.perf_counter() - start
+            if stage.checkpoint:
+                output_hash = self.save_checkpoint(name, key, value, seconds)
+            else:
+                output_hash = data_hash(value)
+            with lock:
+                values[name] = value
+            logging.info(f"Stage {name}: done in {seconds:.2f}s")
+            return {"status": "ran", "seconds": seconds, "output_hash": output_hash}
+
+        # Start every stage whose inputs are done, as soon as they are done
+        pending = list(names)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while pending or running:
+                for name in [n for n in pending if all(d in report for d in self.stages[n].inputs)]:
+                    pending.remove(name)
+                    running[pool.submit(run_stage, name)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report[running.pop(future)] = future.result()
+        return report
@@ -0,0 +1,171 @@
+# This module keeps a precomputed ranking of the properties by savings (predicted minus
+# actual rent per bedroom), split into segments (bedrooms, property subtype, travel-time
+# band, ...), so each user's "most underpriced flats within my budget" query only
+# touches the handful of rows it returns instead of copying and sorting the whole table
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import Dict, List
+
+
+# DEFAULT SEGMENTS
+SEGMENTS = ["bedrooms", "propertySubType"]
+# travel-time bands in seconds (0-20, 20-40, 40-60 and 60-90 minutes)
+TRAVEL_TIME_BANDS = {"travel_time": [0, 1200, 2400, 3600, 5400]}
+# how many rows to check first when scanning down a segment for affordable flats
+SCAN_CHUNK = 64
+
+
+## Scan rows ordered by savings for the first k that are within budget
+def scan_affordable(price: np.ndarray, start: int, end: int, k: int, budget: float) -> np.ndarray:
+    """
+    Returns the positions in [start, end) of the first `k` rows with price <= budget. The
+    rows are ordered by savings, so these are the top k; chunks grow geometrically, so a
+    query only reads about k / (share of the segment within budget) prices.
+    """
+    found, n_found, pos, chunk = [], 0, start, SCAN_CHUNK
+    while pos < end and n_found < k:
+        stop = min(end, pos + chunk)
+        hits = np.flatnonzero(price[pos:stop] <= budget)[:k - n_found] + pos
+        found.append(hits)
+        n_found += len(hits)
+        pos, chunk = stop, chunk * 4
+    return np.concatenate(found) if found else np.empty(0, dtype="int64")
+
+
+class UnderpricedIndex:
+    """
+    Ranking of the properties by savings, per segment.
+
+    For every segment (one combination of the segment columns' values) two orderings of the
+    same rows are kept as contiguous slices of flat arrays. A missing value, or a value outside
+    every band, makes a segment of its own: those rows are still ranked in queries that don't
+    pick that column, but never match a value asked for in it. Only rows without savings
+    (a missing price or prediction) are left out.
+    - by savings, descending: the top k within a budget are the first k affordable rows,
+    - by price, ascending: a binary search on the budget gives the affordable rows directly.
+    A query picks whichever reads fewer rows, so it costs O(k) memory and time in the usual
+    case, and never more than the number of affordable rows.
+
+    Attributes:
+        df: the indexed frame (not copied).
+        keys: DataFrame of the segment values, one row per segment.
+        savings: predicted_price_per_bed - price_per_bed for each row of df.
+    """
+
+    def __init__(self, df: pd.DataFrame, segments: List[str] = SEGMENTS, bands: Dict[str, list] = TRAVEL_TIME_BANDS,
+                 price_col: str = "price_per_bed", predicted_col: str = "predicted_price_per_bed"):
+        self.df = df
+        self.price_col = price_col
+        price = df[price_col].to_numpy(dtype="float64", na_value=np.nan)
+        self.savings = df[predicted_col].to_numpy(dtype="float64", na_value=np.nan) - price
+
+        # The segment of each row (banded columns are cut into their bands first)
+        key_frame = pd.DataFrame(index=df.index)
+        for col in segments:
+            key_frame[col] = df[col].to_numpy()
+        for col, edges in (bands or {}).items():
+            key_frame[f"{col}_band"] = pd.cut(df[col], edges)
+        self.segment_cols = list(key_frame.columns)
+        if self.segment_cols:
+            group = key_frame.groupby(self.segment_cols, sort=True, observed=True, dropna=False).ngroup().to_numpy()
+        else:
+            group = np.zeros(len(df), dtype="int64")
+
+        # The first row of each segment, for its key (segments are numbered 0, 1, ... in order)
+        n_groups = int(group.max()) + 1 if len(group) else 0
+        first = np.unique(group, return_index=True)[1]
+
+        # Rows without savings can't be ranked
+        rows = np.flatnonzero(~np.isnan(self.savings))
+        group, savings, price = group[rows], self.savings[rows], price[rows]
+
+        # Order rows by segment, then savings (descending) / price (ascending)
+        by_savings = np.lexsort((-savings, group))
+        by_price = np.lexsort((price, group))
+        self.rows_by_savings = rows[by_savings]
+        self.price_by_savings = price[by_savings]
+        self.rows_by_price = rows[by_price]
+        self.price_by_price = price[by_price]
+
+        # Where each segment starts and ends in the ordered arrays (empty if none of its rows
+        # can be ranked)
+        self.bounds = np.searchsorted(group[by_savings], np.arange(n_groups + 1))
+        self.keys = key_frame.iloc[first].reset_index(drop=True) if self.segment_cols else pd.DataFrame(index=[0])
+        # plain arrays of the segment values (and band edges, NaN for the unbanded segment)
+        # for matching segments quickly
+        self.key_values = {col: self.keys[col].to_numpy() for col in segments}
+        self.band_edges = {
+            col: (self.keys[f"{col}_band"].map(lambda b: b.left, na_action="ignore").to_numpy(dtype="float64"),
+                  self.keys[f"{col}_band"].map(lambda b: b.right, na_action="ignore").to_numpy(dtype="float64"))
+            for col in (bands or {})
+        }
+
+        # The same two orderings over all rows, for queries that don't pick a segment
+        order = np.argsort(-savings, kind="stable")
+        self.all_rows_by_savings, self.all_price_by_savings = rows[order], price[order]
+        order = np.argsort(price, kind="stable")
+        self.all_rows_by_price, self.all_price_by_price = rows[order], price[order]
+
+    def __len__(self):
+        return len(self.all_rows_by_savings)
+
+    def segment_ids(self, segment: dict) -> np.ndarray:
+        """The segments matching `segment`, a dict of column -> value (or list of values)."""
+        mask = np.ones(len(self.keys), dtype=bool)
+        for col, value in segment.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if col in self.band_edges:
+                # a travel time matches the band it falls in
+                left, right = self.band_edges[col]
+                values = np.asarray(values, dtype="float64")[:, None]
+                mask &= ((values > left) & (values <= right)).any(axis=0)
+            else:
+                mask &= np.isin(self.key_values[col], values)
+        return np.flatnonzero(mask)
+
+    def top_in_slice(self, start: int, end: int, k: int, budget: float, rows_by_savings, price_by_savings,
+                     rows_by_price, price_by_price) -> np.ndarray:
+        # Binary search for how many rows of the slice are affordable
+        n_affordable = np.searchsorted(price_by_price[start:end], budget, side="right")
+        if n_affordable == 0:
+            return np.empty(0, dtype="int64")
+        # Scanning the savings order reads about k * n / n_affordable rows;
+        # taking the affordable rows from the price order reads n_affordable of them
+        if k * (end - start) < n_affordable ** 2:
+            return rows_by_savings[scan_affordable(price_by_savings, start, end, k, budget)]
+        candidates = rows_by_price[start:start + n_affordable]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-self.savings[candidates], k - 1)[:k]]
+        return candidates
+
+    def top(self, k: int = 10, budget: float = np.inf, segment: dict = None) -> np.ndarray:
+        """
+        Positions (into df) of the k rows with the largest savings and price <= budget,
+        best first, optionally within the segments matching `segment`
+        (e.g. {"bedrooms": [1, 2], "travel_time": 1800}).
+        """
+        if segment:
+            candidates = [
+                self.top_in_slice(self.bounds[g], self.bounds[g + 1], k, budget, self.rows_by_savings,
+                                  self.price_by_savings, self.rows_by_price, self.price_by_price)
+                for g in self.segment_ids(segment)
+            ]
+            candidates = np.concatenate(candidates) if candidates else np.empty(0, dtype="int64")
+        else:
+            candidates = self.top_in_slice(0, len(self), k, budget, self.all_rows_by_savings,
+                                           self.all_price_by_savings, self.all_rows_by_price, self.all_price_by_price)
+        # Merge the segments' candidates and put the best first
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-self.savings[candidates], k - 1)[:k]]
+        return candidates[np.argsort(-self.savings[candidates], kind="stable")]
+
+    def recommend(self, k: int = 10, budget: float = np.inf, segment: dict = None) -> pd.DataFrame:
+        """The top k rows of df as a DataFrame with their savings, best first."""
+        rows = self.top(k, budget, segment)
+        result = self.df.iloc[rows].copy()
+        result["savings"] = self.savings[rows]
+        return result
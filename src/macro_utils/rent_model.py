@@ -0,0 +1,142 @@
+# This module holds the rent-per-bedroom regression as running sufficient statistics
+# (X'X, X'y), so each run only has to fold in the newly scraped rows rather than
+# refitting on the whole properties table
+
+
+# IMPORT PACKAGES
+# Data Manipulation and Analysis
+import pandas as pd
+import numpy as np
+from typing import List
+
+# Saving out the model state
+import json
+import time
+from sqlalchemy import inspect, text
+
+# The custom package
+from . import sql_queries as sqlq
+from . import instrumentation as instr
+
+
+# DEFAULT SPECIFICATION
+FEATURES = ["travel_time", "bathrooms"]
+TARGET = "price_per_bed"
+MODEL_TABLE = "rent_model_state"
+
+
+class RentModel:
+    """
+    Linear regression of `target` on `features` (plus an intercept), kept as the sufficient
+    statistics X'X, X'y, y'y and n. Updating with new rows is O(new rows), and the fitted
+    coefficients are identical to an OLS fit (e.g. sklearn's LinearRegression) on all of
+    the rows seen so far.
+    """
+
+    def __init__(self, features: List[str] = FEATURES, target: str = TARGET, version: int = 0):
+        self.features = list(features)
+        self.target = target
+        self.version = version
+        k = len(self.features) + 1
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+        self.n = 0
+
+    def design(self, df: pd.DataFrame) -> np.ndarray:
+        # The feature matrix with a leading column of ones for the intercept
+        X = df[self.features].to_numpy(dtype="float64")
+        return np.column_stack([np.ones(len(X)), X])
+
+    def update(self, df: pd.DataFrame) -> "RentModel":
+        """Folds the rows of `df` (already cleaned, e.g. by clean_for_reg) into the statistics."""
+        if len(df) == 0:
+            return self
+        with instr.span("model.update", rows=len(df)):
+            X = self.design(df)
+            y = df[self.target].to_numpy(dtype="float64")
+            self.xtx += X.T @ X
+            self.xty += X.T @ y
+            self.yty += float(y @ y)
+            self.n += len(y)
+        self.version += 1
+        return self
+
+    @property
+    def coefficients(self) -> np.ndarray:
+        """The intercept followed by one coefficient per feature."""
+        return np.linalg.lstsq(self.xtx, self.xty, rcond=None)[0]
+
+    @property
+    def intercept_(self) -> float:
+        return float(self.coefficients[0])
+
+    @property
+    def coef_(self) -> np.ndarray:
+        return self.coefficients[1:]
+
+    @instr.timed("model.predict", rows=len)
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        return self.design(df) @ self.coefficients
+
+    def r_squared(self) -> float:
+        """R^2 on all of the rows seen so far, from the statistics alone."""
+        beta = self.coefficients
+        y_mean = self.xty[0] / self.n
+        residual = self.yty - 2 * beta @ self.xty + beta @ self.xtx @ beta
+        total = self.yty - self.n * y_mean ** 2
+        return 1 - residual / total
+
+    # Saving and loading
+
+    def save(self, engine, table: str = MODEL_TABLE):
+        """
+        Appends the statistics to `table` as a new version. The version continues from the
+        latest one saved for this specification, so a model refitted from scratch (which
+        starts again at version 0) still becomes the latest.
+        """
+        latest = self.latest_version(engine, self.features, self.target, table)
+        if latest is not None:
+            self.version = max(self.version, latest + 1)
+        state = pd.DataFrame([{
+            "version": self.version,
+            "features": json.dumps(self.features),
+            "target": self.target,
+            "xtx": json.dumps(self.xtx.tolist()),
+            "xty": json.dumps(self.xty.tolist()),
+            "yty": self.yty,
+            "n": self.n,
+            "saved_at": time.time(),
+        }])
+        sqlq.make_table(state, table, engine)
+
+    @staticmethod
+    def latest_version(engine, features: List[str] = FEATURES, target: str = TARGET,
+                       table: str = MODEL_TABLE):
+        """The highest version saved for this specification (None if there is none)."""
+        if not inspect(engine).has_table(table):
+            return None
+        with engine.connect() as conn:
+            return conn.execute(text(
+                f"SELECT MAX(version) FROM {table} WHERE features = :features AND target = :target"
+            ), {"features": json.dumps(list(features)), "target": target}).scalar()
+
+    @classmethod
+    def load(cls, engine, features: List[str] = FEATURES, target: str = TARGET,
+             table: str = MODEL_TABLE) -> "RentModel":
+        """Loads the latest saved version for this specification (or a new, empty model)."""
+        model = cls(features, target)
+        if not inspect(engine).has_table(table):
+            return model
+        with engine.connect() as conn:
+            row = conn.execute(text(
+                f"SELECT version, xtx, xty, yty, n FROM {table} "
+                "WHERE features = :features AND target = :target ORDER BY version DESC, saved_at DESC LIMIT 1"
+            ), {"features": json.dumps(model.features), "target": target}).fetchone()
+        if row is not None:
+            model.version = row[0]
+            model.xtx = np.array(json.loads(row[1]))
+            model.xty = np.array(json.loads(row[2]))
+            model.yty = row[3]
+            model.n = row[4]
+        return model
@@ -1,9 +1,23 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
 from sqlalchemy import inspect, text
+from sqlalchemy import MetaData, Table, Column, func
+from sqlalchemy import select, table, column
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 import logging
 import os
 import sys
+import asyncio
+import hashlib
+import io
+import csv
+import time
 import pandas as pd
+import numpy as np
+
+# Statement timings (off unless instrumentation.enable() is called)
+from . import instrumentation as instr
 
 #Getting the engine
 
@@ -13,45 +27,538 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0,os.path.join(current_dir, '..'))
 
 
+# Engine registry: one engine (and connection pool) per connection string and settings,
+# shared by every notebook cell or script that asks for the same database
+ENGINES = {}
+ASYNC_ENGINES = {}
+
+## Default pragmas for SQLite connections: WAL lets readers run alongside a writer
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -64000,  # 64MB page cache
+    "busy_timeout": 5000,  # ms to wait on a locked database
+}
+
+
+## Get (or create) a pooled engine for a connection string
+def get_engine(dsn, pool_size=5, max_overflow=10, pool_pre_ping=True, statement_timeout=None,
+               sqlite_pragmas=None, **kwargs):
+    """
+    Returns a shared SQLAlchemy engine for a connection string, creating it on first use.
+
+    Engines are cached by the connection string and settings, so later calls reuse the same
+    warm connection pool rather than reconnecting (and redoing TLS and auth) each time.
+
+    Args:
+        dsn: str or sqlalchemy.engine.URL
+            The connection string, e.g. 'sqlite:///path/to/db' or 'postgresql://...'.
+        pool_size, max_overflow: int
+            Size of the connection pool (ignored for SQLite).
+        pool_pre_ping: bool
+            Check connections are alive before handing them out.
+        statement_timeout: int
+            Postgres statement timeout in milliseconds (None for no limit).
+        sqlite_pragmas: dict
+            PRAGMAs run on every new SQLite connection (defaults to SQLITE_PRAGMAS).
+        **kwargs:
+            Passed on to create_engine.
+
+    Returns:
+        sqlalchemy.engine.Engine: The shared engine.
+    """
+    url = make_url(dsn)
+    key = (registry_key(url), pool_size, max_overflow, pool_pre_ping,
+           statement_timeout, repr(sqlite_pragmas), repr(sorted(kwargs.items())))
+    if key in ENGINES:
+        return ENGINES[key]
+
+    if url.get_backend_name() == "sqlite":
+        engine = create_engine(url, pool_pre_ping=pool_pre_ping, **kwargs)
+        pragmas = SQLITE_PRAGMAS if sqlite_pragmas is None else sqlite_pragmas
+
+        # Run the pragmas on every new connection
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+            cursor.close()
+    else:
+        connect_args = dict(kwargs.pop("connect_args", {}))
+        if statement_timeout is not None and url.get_backend_name() == "postgresql":
+            connect_args["options"] = f"{connect_args.get('options', '')} -c statement_timeout={int(statement_timeout)}".strip()
+        engine = create_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                               pool_pre_ping=pool_pre_ping, connect_args=connect_args, **kwargs)
+
+    ENGINES[key] = instr.instrument_engine(engine)
+    return ENGINES[key]
+
+
+## Get (or create) a pooled async engine for concurrent reads
+def get_async_engine(dsn, pool_size=5, max_overflow=10, pool_pre_ping=True, **kwargs):
+    """
+    Returns a shared SQLAlchemy AsyncEngine for a connection string, creating it on first use.
+    Plain 'postgresql://' and 'sqlite://' urls are switched to the asyncpg and aiosqlite
+    drivers, which need to be installed.
+    """
+    url = make_url(dsn)
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    key = (registry_key(url), pool_size, max_overflow, pool_pre_ping, repr(sorted(kwargs.items())))
+    if key not in ASYNC_ENGINES:
+        # Only import the async extension when it is actually needed
+        from sqlalchemy.ext.asyncio import create_async_engine
+        if url.get_backend_name() == "sqlite":
+            ASYNC_ENGINES[key] = create_async_engine(url, pool_pre_ping=pool_pre_ping, **kwargs)
+        else:
+            ASYNC_ENGINES[key] = create_async_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                                                     pool_pre_ping=pool_pre_ping, **kwargs)
+    return ASYNC_ENGINES[key]
+
+
+## The registry key of a connection url: the url with the password hidden, plus a hash of
+## the password, so engines for different passwords stay apart without keeping it in plain text
+def registry_key(url):
+    password = url.password if url.password is not None else ""
+    return url.render_as_string(hide_password=True), hashlib.sha256(str(password).encode()).hexdigest()
+
+
+## Close every pooled connection (e.g. before forking worker processes)
+def dispose_engines():
+    """
+    Disposes of every registered engine and empties the registries. The async engines'
+    connections are closed on a fresh event loop; when called from inside a running loop
+    (where that isn't possible), their pools are dropped without closing the connections,
+    so use `await dispose_async_engines()` there instead.
+    """
+    for engine in ENGINES.values():
+        engine.dispose()
+    ENGINES.clear()
+    if not ASYNC_ENGINES:
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(dispose_async_engines())
+    else:
+        for engine in ASYNC_ENGINES.values():
+            engine.sync_engine.dispose(close=False)
+        ASYNC_ENGINES.clear()
+
+
+## Close every pooled async connection (from inside an event loop)
+async def dispose_async_engines():
+    for engine in ASYNC_ENGINES.values():
+        await engine.dispose()
+    ASYNC_ENGINES.clear()
+
+
 # Connect to local database
-def get_sql_engine(data_path):
+def get_sql_engine(data_path, **kwargs):
     """
     Returns a SQLAlchemy engine object for connecting to a SQLite database.
 
-    If the engine object has not been created yet, it will be created and stored
-    as a static attribute of the `get_sql_engine` function.
+    The engine comes from the engine registry, so each database file gets its own
+    engine, and asking for the same file again returns the same engine.
 
     Returns:
         sqlalchemy.engine.Engine: The SQLAlchemy engine object.
     """
-    if not hasattr(get_sql_engine, 'engine'):
-        get_sql_engine.engine = create_engine('sqlite:///' + data_path)
-    return get_sql_engine.engine
+    return get_engine('sqlite:///' + data_path, **kwargs)
 
 # Connect to cloud engine in supabase
-def get_supabase_engine(user, password, host, port, database):
-    connection_string = f"postgresql://{user}:{password}@{host}:{port}/{database}"
-    engine = create_engine(connection_string)
-    return engine
+def get_supabase_engine(user, password, host, port, database, **kwargs):
+    """
+    Returns a shared, pooled SQLAlchemy engine for the Supabase Postgres database.
+    Keyword arguments (pool_size, statement_timeout, ...) are passed on to get_engine.
+    """
+    connection_string = URL.create("postgresql", username=user, password=password,
+                                   host=host, port=port, database=database)
+    return get_engine(connection_string, **kwargs)
 
 
 
 # Create a table with Pandas
-def make_table(df, name, engine, if_exists='append'):
-    with engine.connect() as conn:
-        pass
-    df.to_sql(name, engine, if_exists=if_exists, index=False)
+@instr.timed("db.make_table", rows=lambda result: result["rows"])
+def make_table(df, name, engine, if_exists='append', bulk=False, chunksize=50000):
+    """
+    Writes a DataFrame to a table with pandas' to_sql.
+
+    With bulk=True the rows are streamed in chunks of `chunksize`: on Postgres each chunk is
+    written to an in-memory CSV buffer and loaded with COPY ... FROM STDIN, and on SQLite each
+    chunk is passed straight to the driver's executemany (pandas' method="multi" compiles one
+    huge statement per chunk and is many times slower than the default on SQLite).
+
+    Returns:
+        dict: The number of rows written, the seconds taken and the rows per second.
+    """
+    start = time.perf_counter()
+    if not bulk:
+        df.to_sql(name, engine, if_exists=if_exists, index=False)
+    elif engine.dialect.name == "postgresql":
+        df.to_sql(name, engine, if_exists=if_exists, index=False, method=copy_from_stdin, chunksize=chunksize)
+    elif engine.dialect.name == "sqlite":
+        df.to_sql(name, engine, if_exists=if_exists, index=False, method=sqlite_executemany, chunksize=chunksize)
+    else:
+        df.to_sql(name, engine, if_exists=if_exists, index=False, chunksize=chunksize)
+    seconds = time.perf_counter() - start
+    rows_per_sec = len(df) / seconds if seconds > 0 else float("inf")
+    logging.info(f"Wrote {len(df)} rows to {name} in {seconds:.2f}s ({rows_per_sec:,.0f} rows/s)")
+    return {"rows": len(df), "seconds": seconds, "rows_per_sec": rows_per_sec}
+
+
+## to_sql insertion method that loads each chunk with Postgres COPY
+def copy_from_stdin(table, conn, keys, data_iter):
+    """
+    pandas to_sql `method` that writes a chunk of rows to an in-memory CSV buffer
+    and loads it with COPY ... FROM STDIN (psycopg2 or psycopg 3).
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(data_iter)
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{k}"' for k in keys)
+    table_name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+    sql = f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+    with conn.connection.cursor() as cur:
+        if hasattr(cur, "copy_expert"):
+            cur.copy_expert(sql, buffer)
+        else:
+            with cur.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+## to_sql insertion method that hands each chunk to sqlite3's executemany
+def sqlite_executemany(table, conn, keys, data_iter):
+    """
+    pandas to_sql `method` that inserts a chunk of rows with the sqlite3 driver's own
+    executemany, skipping SQLAlchemy's per-statement overhead.
+    """
+    columns = ", ".join(f'"{k}"' for k in keys)
+    placeholders = ", ".join("?" for _ in keys)
+    sql = f'INSERT INTO "{table.name}" ({columns}) VALUES ({placeholders})'
+    cur = conn.connection.cursor()
+    try:
+        cur.executemany(sql, data_iter)
+    finally:
+        cur.close()
+
+
+# Reading tables
+
+## Marks a where filter that keeps the rows where a column IS NOT NULL (see build_select)
+class NotNull:
+    def __repr__(self):
+        return "NOT_NULL"
+
+
+NOT_NULL = NotNull()
+
+
+## Build a SELECT for only the wanted columns and rows
+def build_select(name, columns=None, where=None, order_by=None):
+    """
+    Builds a SQLAlchemy SELECT on a table with bound parameters.
+
+    Args:
+        name: str
+            The name of the table.
+        columns: list of str
+            The columns to return (all columns if None).
+        where: dict
+            Maps a column to a filter on it:
+            - a scalar keeps rows equal to it, e.g. {"country": "Germany"}
+            - None keeps rows where the column IS NULL, e.g. {"predicted_price_per_bed": None}
+            - NOT_NULL keeps rows where it IS NOT NULL, e.g. {"predicted_price_per_bed": NOT_NULL}
+            - a list or set keeps rows in it, e.g. {"country_id": ["USA", "DEU"]}
+            - a (low, high) tuple keeps rows between the two, inclusive, with None for an
+              open end, e.g. {"date": ("2000-01-01", None)}
+        order_by: str or list of str
+            Column(s) to sort by.
+    """
+    where = where or {}
+    names = list(columns) if columns is not None else []
+    # Mention every column we filter or sort on, so the lightweight table knows about it
+    order_cols = [order_by] if isinstance(order_by, str) else list(order_by or [])
+    tbl = table(name, *[column(c) for c in dict.fromkeys(names + list(where) + order_cols)])
+
+    stmt = select(*[tbl.c[c] for c in names]) if names else select(text("*"))
+    stmt = stmt.select_from(tbl)
+    for col, condition in where.items():
+        if isinstance(condition, tuple):
+            low, high = condition
+            if low is not None:
+                stmt = stmt.where(tbl.c[col] >= low)
+            if high is not None:
+                stmt = stmt.where(tbl.c[col] <= high)
+        elif isinstance(condition, (list, set, frozenset)):
+            stmt = stmt.where(tbl.c[col].in_(list(condition)))
+        elif condition is None:
+            stmt = stmt.where(tbl.c[col].is_(None))
+        elif condition is NOT_NULL:
+            stmt = stmt.where(tbl.c[col].is_not(None))
+        else:
+            stmt = stmt.where(tbl.c[col] == condition)
+    for col in order_cols:
+        stmt = stmt.order_by(tbl.c[col])
+    return stmt
+
+
+## Read a table into a DataFrame (or an iterator of DataFrames)
+@instr.timed("db.read_table", rows=len)
+def read_table(name, engine, columns=None, where=None, dtypes=None, parse_dates=None,
+               order_by=None, chunksize=None):
+    """
+    Reads only the requested columns and rows of a table, with the filtering done by
+    the database (see build_select for the format of `where`).
+
+    Args:
+        dtypes: dict
+            Column dtypes to convert to as the rows are read (e.g. {"country": "category"}).
+        parse_dates: list of str
+            Columns to parse as datetimes.
+        chunksize: int
+            If given, returns an iterator of DataFrames with at most this many rows each,
+            streaming the rows from the database instead of loading them all at once.
+
+    Returns:
+        pd.DataFrame, or an iterator of pd.DataFrame if chunksize is set.
+    """
+    stmt = build_select(name, columns, where, order_by)
+    if chunksize is None:
+        with engine.connect() as conn:
+            return pd.read_sql(stmt, conn, dtype=dtypes, parse_dates=parse_dates)
+    return iter_read(stmt, engine, chunksize, dtypes, parse_dates)
+
+
+## Stream a query's results in chunks, keeping the connection open until they are used up
+def iter_read(stmt, engine, chunksize, dtypes=None, parse_dates=None):
+    with engine.connect().execution_options(stream_results=True) as conn:
+        for chunk in pd.read_sql(stmt, conn, dtype=dtypes, parse_dates=parse_dates, chunksize=chunksize):
+            yield chunk
+
+
+## Add the columns a table is missing (as nullable columns), e.g. ones filled in by later steps
+def add_missing_columns(engine, name, columns):
+    """
+    Adds each column of `columns` (a dict of column name -> SQL type) that the table doesn't
+    have yet, as a nullable column. Returns the names of the columns added.
+    """
+    existing = {col["name"] for col in inspect(engine).get_columns(name)}
+    missing = [col for col in columns if col not in existing]
+    with engine.begin() as conn:
+        for col in missing:
+            conn.execute(text(f'ALTER TABLE {name} ADD COLUMN "{col}" {columns[col]}'))
+    return missing
+
+
+## Create a table in another database with the columns and types of an existing one
+def create_table_like(engine, name, target_engine, primary_key=None, exclude=()):
+    """
+    Creates the table `name` in target_engine's database, if it doesn't exist yet, with the
+    columns and types of the table `name` in engine's database (leaving out `exclude`), so
+    its schema doesn't depend on whichever rows happen to be written to it first.
+    `primary_key` (a column name or list of them) becomes the new table's primary key.
+    """
+    keys = [primary_key] if isinstance(primary_key, str) else list(primary_key or [])
+    source = Table(name, MetaData(), autoload_with=engine)
+    columns = [Column(col.name, col.type, primary_key=col.name in keys, autoincrement=False)
+               for col in source.columns if col.name not in exclude]
+    Table(name, MetaData(), *columns).create(target_engine, checkfirst=True)
+
+
+# Bulk upserts
+
+## Whether the key column(s) are already unique: a primary key, unique constraint or unique index
+def has_unique_key(engine, name, keys):
+    keys = set(keys)
+    insp = inspect(engine)
+    if set(insp.get_pk_constraint(name)["constrained_columns"]) == keys:
+        return True
+    if any(set(constraint["column_names"]) == keys for constraint in insp.get_unique_constraints(name)):
+        return True
+    return any(index["unique"] and set(index["column_names"]) == keys for index in insp.get_indexes(name))
+
+
+## Make sure the key column(s) are unique, which ON CONFLICT needs
+def ensure_unique_index(engine, name, key="id", dedupe=False):
+    """
+    Creates a unique index on the key column(s), unless the table's primary key, a unique
+    constraint or a unique index already covers them.
+
+    Tables filled by plain appends can hold repeated keys, which makes the index fail. That
+    raises a ValueError, unless dedupe=True, in which case the repeats are deleted first (see
+    drop_duplicate_keys). Rows are never deleted without being asked to.
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    if has_unique_key(engine, name, keys):
+        return
+    index_name = f"{name}_{'_'.join(keys)}_key"
+    create_index = text(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {name} ({', '.join(keys)})")
+    try:
+        with engine.begin() as conn:
+            conn.execute(create_index)
+    except IntegrityError as err:
+        if not dedupe:
+            raise ValueError(
+                f"{name} holds rows with a repeated {', '.join(keys)}, so it can't be given the unique index "
+                f"ON CONFLICT needs. Remove the repeats first (drop_duplicate_keys), or pass dedupe=True"
+            ) from err
+        removed = drop_duplicate_keys(engine, name, keys)
+        logging.warning(f"Removed {removed} rows of {name} with a repeated {', '.join(keys)} before indexing it")
+        with engine.begin() as conn:
+            conn.execute(create_index)
+
+
+## Delete the rows whose key also appears in another row, keeping one of each
+def drop_duplicate_keys(engine, name, key="id"):
+    """
+    Deletes all but one row of each repeated key: on SQLite the most recently inserted one
+    (the highest rowid), on Postgres the one stored last (the highest ctid). A Postgres row's
+    ctid changes when it is updated or the table is vacuumed, so there the row kept is not
+    necessarily the newest. Returns the number of rows deleted.
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    if engine.dialect.name == "sqlite":
+        sql = f"DELETE FROM {name} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {name} GROUP BY {', '.join(keys)})"
+    elif engine.dialect.name == "postgresql":
+        matches = " AND ".join(f"older.{k} = newer.{k}" for k in keys)
+        sql = f"DELETE FROM {name} older USING {name} newer WHERE {matches} AND older.ctid < newer.ctid"
+    else:
+        raise NotImplementedError(f"De-duplicating is not supported for the {engine.dialect.name} dialect")
+    with engine.begin() as conn:
+        return conn.execute(text(sql)).rowcount
+
+
+## Insert new rows and update existing ones in batches
+@instr.timed("db.bulk_upsert", rows=int)
+def bulk_upsert(df, name, engine, key="id", only_null=False, batch_size=10000, dedupe=False):
+    """
+    Upserts the rows of a DataFrame into an existing table with INSERT ... ON CONFLICT DO UPDATE
+    (SQLite and Postgres), sending the rows as executemany batches of `batch_size`.
+
+    Args:
+        df: pd.DataFrame
+            The rows to write; its columns must exist in the table.
+        name: str
+            The name of the table.
+        engine: sqlalchemy.engine.Engine
+            The engine to write with.
+        key: str or list of str
+            The column(s) identifying a row. A unique index is created on them if needed
+            (see ensure_unique_index).
+        only_null: bool
+            If True, only fill in columns that are currently NULL in the table
+            (the behaviour of UPDATE_PREDICTED_PRICE and UPDATE_DIST_AND_TRAVEL_TIME).
+        dedupe: bool
+            If True, delete the rows of a repeated key the table already holds when indexing
+            it (see ensure_unique_index); otherwise such a table raises a ValueError.
+
+    Returns:
+        int: The number of rows sent.
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    ensure_unique_index(engine, name, keys, dedupe)
+    table = Table(name, MetaData(), autoload_with=engine)
+
+    # Build the statement once; every batch re-uses it
+    stmt = dialect_insert(engine)(table)
+    update_cols = [col for col in df.columns if col not in keys]
+    if only_null:
+        set_ = {col: func.coalesce(table.c[col], stmt.excluded[col]) for col in update_cols}
+    else:
+        set_ = {col: stmt.excluded[col] for col in update_cols}
+    stmt = stmt.on_conflict_do_update(index_elements=keys, set_=set_) if set_ else stmt.on_conflict_do_nothing(index_elements=keys)
+
+    execute_batches(engine, stmt, df, batch_size)
+    return len(df)
+
+
+## Insert only the rows whose key is not in the table yet
+@instr.timed("db.insert_new_rows", rows=int)
+def insert_new_rows(df, name, engine, key="id", batch_size=10000, dedupe=False):
+    """
+    Inserts the rows of a DataFrame into an existing table with INSERT ... ON CONFLICT DO NOTHING,
+    so the database skips rows whose key already exists. Nothing about the existing rows is
+    downloaded; only the new data crosses the wire.
+
+    A unique index is created on the key column(s) if needed; a table that already holds a
+    key more than once raises a ValueError, unless dedupe=True (see ensure_unique_index).
+
+    Returns:
+        int: The number of rows actually inserted (where the driver reports it).
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    ensure_unique_index(engine, name, keys, dedupe)
+    table = Table(name, MetaData(), autoload_with=engine)
+    stmt = dialect_insert(engine)(table).on_conflict_do_nothing(index_elements=keys)
+    return execute_batches(engine, stmt, df, batch_size)
+
+
+## Pick the dialect's insert construct so ON CONFLICT is available
+def dialect_insert(engine):
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert
+    elif engine.dialect.name == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"ON CONFLICT writes are not supported for the {engine.dialect.name} dialect")
+
+
+## Send a DataFrame through a statement in executemany batches, in one transaction
+def execute_batches(engine, stmt, df, batch_size=10000):
+    # Convert to plain python values (NaN/NA to None)
+    records = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    affected = 0
+    with engine.begin() as conn:
+        for start in range(0, len(records), batch_size):
+            result = conn.execute(stmt, records[start:start + batch_size])
+            affected += max(result.rowcount, 0)
+    return affected
 
 
 # Dynamically create SQL Queries
 
-def infer_sql_type(series) -> str:
+## Inferred CREATE TABLE column types per source (table name or file), columns and dtypes.
+## A repeat load of the same source reuses them without measuring the columns again; only an
+## evenly spaced sample of CACHE_CHECK_ROWS rows of each VARCHAR(n) column is checked, and a
+## column whose sampled values outgrow the cached width becomes TEXT from then on
+SCHEMA_CACHE = {}
+CACHE_CHECK_ROWS = 1000
+
+## Length of the longest string in a column, computed in C rather than per Python object
+def max_str_len(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # only the (few) categories need measuring
+        series = pd.Series(series.cat.categories)
+    if not pd.api.types.is_string_dtype(series) or series.dtype == object:
+        # object columns: convert to Arrow strings in one go (falls back for non-str values)
+        try:
+            series = series.astype("string[pyarrow]")
+        except (ImportError, TypeError, ValueError):
+            series = series.dropna().astype(str).astype("string")
+    return series.str.len().max()
+
+
+def infer_sql_type(series, sample_size=None, margin=1.25, varchar=True) -> str:
     """
     Infers the appropriate SQL data type for a pandas Series.
 
     Args:
         series: pd.Series
             The pandas Series for which to infer the SQL type.
+        sample_size: int, optional
+            If given, the VARCHAR length of a text column is taken from an evenly spaced
+            sample of this many rows (times `margin`) instead of every row. Only use this
+            where a longer value in the unsampled rows may be rejected or truncated.
+        margin: float
+            Safety factor applied to the sampled maximum length.
+        varchar: bool
+            If False, text columns are always TEXT, so later rows can't be too long for them.
 
     Returns:
         str: The inferred SQL data type as a string.
@@ -68,12 +575,27 @@ def infer_sql_type(series) -> str:
     # Check if the series is of datetime type
     elif pd.api.types.is_datetime64_any_dtype(series):
         return "TIMESTAMP"
+    elif not varchar:
+        return "TEXT"
     else:
-        # For object types, infer VARCHAR length or fallback to TEXT
-        max_len = series.dropna().astype(str).map(len).max()
-        return f"VARCHAR({max_len})" if max_len else "TEXT"
+        # For text types, infer VARCHAR length (from a sample if asked) or fallback to TEXT
+        if sample_size is not None and len(series) > sample_size:
+            positions = np.linspace(0, len(series) - 1, sample_size).astype("int64")
+            max_len = max_str_len(series.iloc[positions])
+            max_len = int(np.ceil(max_len * margin)) if pd.notna(max_len) else max_len
+        else:
+            max_len = max_str_len(series)
+        return f"VARCHAR({int(max_len)})" if pd.notna(max_len) and max_len else "TEXT"
+
+## Whether an evenly spaced sample of a text column holds values longer than a VARCHAR(n) allows
+def outgrows(series, sql_type: str, sample_size=CACHE_CHECK_ROWS) -> bool:
+    if len(series) > sample_size:
+        series = series.iloc[np.linspace(0, len(series) - 1, sample_size).astype("int64")]
+    max_len = max_str_len(series)
+    return pd.notna(max_len) and max_len > int(sql_type[len("VARCHAR("):-1])
 
-def df_to_create_table_sql(df: pd.DataFrame, table_name: str) -> str:
+def df_to_create_table_sql(df: pd.DataFrame, table_name: str, sample_size=None, source=None,
+                           cache=SCHEMA_CACHE, primary_key=None, varchar=True) -> str:
     """
     Generates a SQL CREATE TABLE statement based on the columns and types of a pandas DataFrame.
 
@@ -82,15 +604,45 @@ def df_to_create_table_sql(df: pd.DataFrame, table_name: str) -> str:
             The DataFrame to analyze.
         table_name: str
             The name of the SQL table to create.
+        sample_size: int, optional
+            Infer VARCHAR lengths from a sample of this many rows (see infer_sql_type).
+        source: str, optional
+            What the data was loaded from (defaults to the table name). The inferred column
+            types are cached per source, columns and dtypes (see SCHEMA_CACHE), and a repeat
+            load reuses them, only checking a sample of each VARCHAR(n) column (one that has
+            grown becomes TEXT). Longer values outside that sample are not seen, so pass
+            cache=None (or varchar=False) where every value of this frame must fit.
+        primary_key: str or list of str, optional
+            Column(s) to declare as the PRIMARY KEY (which ON CONFLICT writes need).
+        varchar: bool
+            If False, text columns are TEXT rather than VARCHAR(n) (see infer_sql_type); use
+            this for tables that keep receiving new rows.
 
     Returns:
         str: The SQL CREATE TABLE statement as a string.
     """
-    cols = []
-    # Iterate through each column to infer its SQL type and build column definitions
-    for col in df.columns:
-        sql_type = infer_sql_type(df[col])
-        cols.append(f"{col} {sql_type}")
+    key = (source or table_name, tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes), varchar)
+    cached = cache.get(key) if cache is not None else None
+    types = []
+    # Iterate through each column to infer its SQL type
+    for i, col in enumerate(df.columns):
+        if cached is None:
+            sql_type = infer_sql_type(df[col], sample_size, varchar=varchar)
+        elif cached[i].startswith("VARCHAR(") and outgrows(df[col], cached[i]):
+            # the column keeps getting longer values, so stop giving it a fixed width
+            sql_type = "TEXT"
+        else:
+            # the other types only depend on the dtype, which is part of the key
+            sql_type = cached[i]
+        types.append(sql_type)
+    if cache is not None:
+        cache[key] = types
+    # quoted, so Postgres keeps mixed-case names (e.g. numberOfImages) as they are
+    cols = [f'"{col}" {sql_type}' for col, sql_type in zip(df.columns, types)]
+    if primary_key is not None:
+        keys = [primary_key] if isinstance(primary_key, str) else list(primary_key)
+        key_list = ", ".join(f'"{k}"' for k in keys)
+        cols = cols + [f"PRIMARY KEY ({key_list})"]
     # Join all column definitions into a single string
     col_definitions = ",\n    ".join(cols)
     # Format the final CREATE TABLE SQL statement
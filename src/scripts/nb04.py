@@ -1,22 +1,32 @@
-
-
+# Runs the rental pipeline as named, checkpointed stages:
+#   scrape -> normalise -> travel_time -> store -> model -> publish_local -> publish_cloud (and plot)
+# Stages whose code, settings and inputs are unchanged since the last run are skipped,
+# and stages that don't depend on each other run at the same time. Nothing is asked interactively.
+#
+# Examples (from the src directory):
+#   python scripts/nb04.py                                  # predict the unpredicted rows already in the database
+#   python scripts/nb04.py --locations REGION^87490 --total-results 500
+#   python scripts/nb04.py --full-refit --no-cloud --plot plots/price_vs_travel.png
+#   python scripts/nb04.py --force model                    # re-run a stage (and whatever changes downstream)
+#   python scripts/nb04.py --metrics metrics.prom --profile  # record timings (JSON or Prometheus text)
+
+
+# IMPORT PACKAGES
 # Response output
 import json
 import pandas as pd
+import numpy as np
 
 # File and System Operations
 import os
 import sys
-
-# Data Visualisation
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-# Regressions
-from sklearn.linear_model import LinearRegression
+import argparse
+import asyncio
+import datetime
+import time
 
 # Saving out data
-from sqlalchemy import inspect, text
+from sqlalchemy import text
 
 # Tracking
 import logging
@@ -31,8 +41,6 @@ logging.getLogger().setLevel(logging.INFO)
 # DIRECTORY SETUP
 
 ### Find the directory of the current file
-__file__ = "nb04.py"
-
 logging.info('Finding current Path')
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -40,113 +48,280 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 # # (so one can import the custom package)
 logging.info('Importing Custom Package...')
 sys.path.insert(0,os.path.join(current_dir, '..'))
-import rental_utils
 # Import the functions sub-package
-from rental_utils import functions as rent
-# Note that whenever rent.function_name is called, 
-# all the required packages are imported in the background anyway
-
+from macro_utils import functions as rent
 # Import the sql queries sub-package
-from rental_utils import sql_queries as sqlq
+from macro_utils import sql_queries as sqlq
+# Import the incremental regression model and the pipeline runner
+from macro_utils.rent_model import RentModel, FEATURES, TARGET
+from macro_utils.commute_cache import CommuteCache
+from macro_utils.pipeline import Pipeline, Stage
+from macro_utils import instrumentation as instr
 
 logging.info('Imported Custom Package')
 
 
 ## Set Up The Paths of the Key Outside Directories/Files
-logging.info('Setting up other paths...')
 credentials_file_path = os.path.join(current_dir, '..', '..', "supabase_credentials.json")
 data_folder_path = os.path.join(current_dir, '..', '..', "data")
 
-# open the  credentials file and load the data into a variable
-with open(credentials_file_path, "r") as f:
-    credentials = json.load(f)
-
-
-    
-
-
-# PRIMARY RUNNING
-
-
-## Load in the complete data from the corresponding table in the database
-logging.info('Getting Data from the Database')
-engine = sqlq.get_sql_engine(f"{data_folder_path}/properties.db")
-with engine.connect() as connection:
-    properties_data = pd.read_sql(text(sqlq.GET_PROPERTIES_DATA_SQL_QUERY), connection)
-logging.info(f'Data found, with {len(properties_data["id"])} properties')
-
-
-## Clean the data
-reg_data = rent.clean_for_reg(properties_data)
-
-## Make A Scatter Plot of Rent Per Bed Against Travel Time
-# allow the user to choose
-show_plot = input("Do you want to display the plot? (y/n): ").strip().lower()
-
-if show_plot == 'y':
-    sns.regplot(x='travel_time', y='price_per_bed', data=reg_data)
-    plt.xlabel('Travel Time')
-    plt.ylabel('Price per Bed')
-    plt.title('Price per Bed vs Travel Time with Line of Best Fit')
-    plt.show()
-else:
-    print("Plot display skipped.")
-
-
-
-# MAKE PREDICTIONS OF RENT PER BED BASED ON THE RENTAL DATA
-logging.info('Making Predictions')
-## Select features and target
-X = reg_data[['travel_time', 'bathrooms']]
-y = reg_data['price_per_bed']
-
-## Create and fit model
-model = LinearRegression()
-model.fit(X, y)
-
-## To generate predictions 
-predictions = model.predict(X)
-
-## Add predictions to dataframe
-reg_data.loc[:,'predicted_price_per_bed'] = predictions
-
-logging.info('Saving Out Predictions')
-# Save Out The Data With Predictions
-##### create a temporary table
-sqlq.make_table(reg_data[["id", "predicted_price_per_bed"]], "temp_updates", engine, if_exists="replace")
-
-##### run a single SQL statement to update properties_data using temp_updates (fill in missing data)
-with engine.begin() as connection:
-    connection.execute(text(sqlq.UPDATE_PREDICTED_PRICE))
-
-
-logging.info('Predictions Saved Out to Local Database')
-
-
-# Save out to a table in the supbase database
-## Connect to the engine
-supabase_engine = sqlq.get_supabase_engine(
-    user="postgres",
-    password=credentials['password'],
-    host=credentials['host'],
-    port=5432,
-    database="postgres"
-)
-
-## Execute the CREATE TABLE query to create a blank table if it doesn't already exist
-with supabase_engine.begin() as connection:
-    connection.execute(text(sqlq.CREATE_TABLE_SQL_QUERY))
-
-## find the ids that already exist
-with supabase_engine.connect() as conn:
-    existing_ids = conn.execute(text("SELECT id FROM properties_data")).fetchall()
-## filter out only the ids that will be unique to the existing table
-existing_ids = {row[0] for row in existing_ids}
-new_rows = reg_data[~reg_data['id'].isin(existing_ids)]
-
-
-# fill in the data into the table
-sqlq.make_table(new_rows, "properties_data", supabase_engine)
-
-
-logging.info('Predictions Saved Out to Cloud Database')
\ No newline at end of file
+## Columns of properties_data that are filled in after the listings are stored
+## (scored_at is when the model stage first looked at a row, predicted or not)
+FILLED_IN_COLUMNS = {
+    "travel_time": "REAL",
+    "distance": "REAL",
+    "predicted_price_per_bed": "REAL",
+    "scored_at": "REAL",
+}
+
+## Bookkeeping columns of the local table that aren't published to the cloud
+LOCAL_COLUMNS = ["scored_at"]
+
+## Rows read from the local table per cloud write
+CLOUD_CHUNKSIZE = 10000
+
+
+# THE STAGES
+
+## Scrape the listings for the given locations (nothing if no locations are given)
+def scrape(locations, total_results, snapshot):
+    # `snapshot` only labels the checkpoint, so a new day (or label) scrapes again
+    if not locations:
+        return []
+    return asyncio.run(rent.scrape_many(locations, total_results))
+
+
+## Flatten and clean the raw listings
+def normalise(properties):
+    return rent.normalise_listings(properties)
+
+
+## Add the commute to each new listing (left null if no TravelTime credentials are set)
+def travel_time(listings, transportation_type):
+    app_id, api_key = os.environ.get("TRAVELTIME_APP_ID"), os.environ.get("TRAVELTIME_API_KEY")
+    if listings.empty or not (app_id and api_key):
+        if not listings.empty:
+            logging.warning('TRAVELTIME_APP_ID/TRAVELTIME_API_KEY not set, skipping travel times')
+        return listings
+    cache = CommuteCache(os.path.join(data_folder_path, "commute_cache.db"), transportation_type=transportation_type)
+    return asyncio.run(rent.fetch_travel_times(listings, app_id, api_key,
+                                               transportation_type=transportation_type, cache=cache))
+
+
+## Store the new listings in the local database (with dedupe, first deleting the repeated
+## ids an older, append-only properties_data may hold; otherwise such a table is an error)
+def store(listings, db_path, dedupe=False):
+    # The table always gets the columns filled in by later steps (travel times are missing
+    # without TravelTime credentials, and predictions are only added by publish_local), so
+    # the model stage can read and filter on them even on a fresh database
+    listings = listings.assign(**{col: pd.Series(np.nan, index=listings.index, dtype="float64")
+                                  for col in FILLED_IN_COLUMNS if col not in listings.columns})
+    engine = sqlq.get_sql_engine(db_path)
+    if not sqlq.inspect(engine).has_table("properties_data"):
+        added = sqlq.make_table(listings, "properties_data", engine)["rows"]
+    else:
+        sqlq.add_missing_columns(engine, "properties_data", FILLED_IN_COLUMNS)
+        added = sqlq.insert_new_rows(listings, "properties_data", engine, dedupe=dedupe) if not listings.empty else 0
+    logging.info(f'{added} new properties stored')
+    return added
+
+
+## Fit the model on the rows not scored yet, and predict them
+## (the updated model is only saved by publish_local, once the predictions are stored)
+def model(added, db_path, full_refit):
+    engine = sqlq.get_sql_engine(db_path)
+    # By default only the rows no earlier run has looked at are loaded (rows clean_for_reg
+    # drops never get a prediction, but are marked as scored so they aren't read again), and
+    # the model is updated from those alone; with full_refit the model is refitted from
+    # scratch on the complete table
+    if full_refit:
+        properties_data = sqlq.read_table("properties_data", engine)
+    else:
+        properties_data = sqlq.read_table("properties_data", engine,
+                                          where={"predicted_price_per_bed": None, "scored_at": None})
+    logging.info(f'Data found, with {len(properties_data)} properties')
+
+    reg_data = rent.clean_for_reg(properties_data)
+
+    ## Load the saved sufficient statistics (X'X, X'y) unless refitting from scratch
+    rent_model = RentModel(FEATURES, TARGET) if full_refit else RentModel.load(engine, FEATURES, TARGET)
+    rent_model.update(reg_data)
+    logging.info(f'Model fitted on {rent_model.n} properties')
+
+    reg_data = reg_data.copy()
+    reg_data['predicted_price_per_bed'] = rent_model.predict(reg_data)
+    return {"model": rent_model, "predictions": reg_data, "scored_ids": properties_data["id"],
+            "updated": not reg_data.empty}
+
+
+## Save the predictions to the local database and mark every row read as scored, only
+## filling in missing values, and then the model state. Saving the state last means a failed
+## write can't fold the same rows into X'X/X'y twice: they are still unscored, so the next
+## run picks them up again
+def publish_local(fitted, db_path):
+    engine = sqlq.get_sql_engine(db_path)
+    reg_data = fitted["predictions"]
+    scored = pd.DataFrame({"id": fitted["scored_ids"]}).merge(
+        reg_data[["id", "predicted_price_per_bed"]], on="id", how="left").assign(scored_at=time.time())
+    sqlq.bulk_upsert(scored, "properties_data", engine, only_null=True)
+    written = len(reg_data)
+    if fitted["updated"]:
+        rent_model = fitted["model"]
+        rent_model.save(engine)
+        logging.info(f'Model version {rent_model.version} saved, fitted on {rent_model.n} properties')
+    return written
+
+
+## Save every predicted row of the local table to the supabase database, letting it skip the
+## ids that already exist, so rows predicted while the cloud was skipped are published too
+## (`written` is publish_local's output, only taken so the local predictions are stored first)
+def publish_cloud(written, db_path, credentials_path):
+    if not credentials_path or not os.path.exists(credentials_path):
+        logging.warning('No supabase credentials found, skipping the cloud database')
+        return 0
+    with open(credentials_path, "r") as f:
+        credentials = json.load(f)
+    supabase_engine = sqlq.get_supabase_engine(
+        user="postgres",
+        password=credentials['password'],
+        host=credentials['host'],
+        port=5432,
+        database="postgres"
+    )
+    engine = sqlq.get_sql_engine(db_path)
+    with engine.connect() as connection:
+        predicted = connection.execute(text("SELECT COUNT(predicted_price_per_bed) FROM properties_data")).scalar()
+    if not predicted:
+        logging.info('No predicted properties to publish yet')
+        return 0
+    ## Create a blank table if it doesn't already exist, with the local table's columns and
+    ## types (not ones inferred from whichever rows are sent first), and id as the primary
+    ## key that insert_new_rows' ON CONFLICT relies on
+    sqlq.create_table_like(engine, "properties_data", supabase_engine, primary_key="id", exclude=LOCAL_COLUMNS)
+
+    added = 0
+    for chunk in sqlq.read_table("properties_data", engine, where={"predicted_price_per_bed": sqlq.NOT_NULL},
+                                 chunksize=CLOUD_CHUNKSIZE):
+        # the rows as the model saw them (weekly rents converted to monthly)
+        reg_data = rent.clean_for_reg(chunk).drop(columns=LOCAL_COLUMNS)
+        added += sqlq.insert_new_rows(reg_data, "properties_data", supabase_engine)
+    logging.info(f'{added} new properties published to the cloud database')
+    return added
+
+
+## Save a scatter plot of rent per bed against travel time (instead of showing it)
+def plot(fitted, path):
+    reg_data = fitted["predictions"]
+    # Data Visualisation (only imported when a plot is asked for)
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots()
+    sns.regplot(x='travel_time', y='price_per_bed', data=reg_data, ax=ax)
+    ax.set_xlabel('Travel Time')
+    ax.set_ylabel('Price per Bed')
+    ax.set_title('Price per Bed vs Travel Time with Line of Best Fit')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+## What a stage reads from the database, so its checkpoint notices new rows (rows added by
+## earlier stages are counted too, as the fingerprint is taken once they have run)
+def table_fingerprint(db_path, summary="COUNT(*), MAX(id)"):
+    def fingerprint():
+        if not os.path.exists(db_path):
+            return None
+        engine = sqlq.get_sql_engine(db_path)
+        try:
+            with engine.connect() as conn:
+                return list(conn.execute(text(
+                    f"SELECT {summary} FROM properties_data"
+                )).fetchone())
+        except Exception:
+            # no properties table yet
+            return None
+    return fingerprint
+
+
+## What the cloud stage publishes: the predicted rows, and whether there are credentials
+## (so a run without them doesn't leave the stage looking done once they are added)
+def cloud_fingerprint(db_path, credentials_path):
+    predicted = table_fingerprint(db_path, "COUNT(predicted_price_per_bed)")
+
+    def fingerprint():
+        return [predicted(), bool(credentials_path) and os.path.exists(credentials_path)]
+    return fingerprint
+
+
+# THE COMMAND LINE
+
+def build_pipeline(args) -> Pipeline:
+    return Pipeline([
+        Stage("scrape", scrape, params={"locations": args.locations, "total_results": args.total_results,
+                                        "snapshot": args.snapshot}),
+        Stage("normalise", normalise, ["scrape"]),
+        Stage("travel_time", travel_time, ["normalise"], params={"transportation_type": args.transportation_type}),
+        Stage("store", store, ["travel_time"], params={"db_path": args.db, "dedupe": args.dedupe}),
+        Stage("model", model, ["store"], params={"db_path": args.db, "full_refit": args.full_refit},
+              fingerprint=table_fingerprint(args.db)),
+        Stage("publish_local", publish_local, ["model"], params={"db_path": args.db}),
+        Stage("publish_cloud", publish_cloud, ["publish_local"],
+              params={"db_path": args.db, "credentials_path": args.credentials},
+              fingerprint=cloud_fingerprint(args.db, args.credentials)),
+        Stage("plot", plot, ["model"], params={"path": args.plot}),
+    ], checkpoint_dir=args.checkpoint_dir)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape, model and publish the rental listings.")
+    parser.add_argument("--locations", nargs="*", default=[], help="rightmove location identifiers to scrape")
+    parser.add_argument("--total-results", type=int, default=250, help="listings to scrape per location")
+    parser.add_argument("--snapshot", default=datetime.date.today().isoformat(),
+                        help="label of the scrape; a new label scrapes again (default: today's date)")
+    parser.add_argument("--transportation-type", default="public_transport")
+    parser.add_argument("--db", default=os.path.join(data_folder_path, "properties.db"), help="local SQLite database")
+    parser.add_argument("--credentials", default=credentials_file_path, help="supabase credentials JSON")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="delete repeated ids left in the local table by older, append-only runs")
+    parser.add_argument("--full-refit", action="store_true", help="refit the model on the whole table")
+    parser.add_argument("--no-cloud", action="store_true", help="don't write to the supabase database")
+    parser.add_argument("--plot", default=None, help="save the price vs travel time plot to this file")
+    parser.add_argument("--force", nargs="*", default=[], help="stages to re-run regardless of checkpoints ('all' for every stage)")
+    parser.add_argument("--metrics", default=None,
+                        help="write timings and counters to this file (.prom/.txt for Prometheus text, else JSON)")
+    parser.add_argument("--profile", action="store_true", help="with --metrics, also cProfile each stage")
+    parser.add_argument("--trace-memory", action="store_true", help="with --metrics, also record peak memory per stage")
+    parser.add_argument("--checkpoint-dir", default=os.path.join(data_folder_path, "checkpoints", "nb04"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # a full refit always refits, even if the table hasn't changed
+    force = list(args.force) + (["model"] if args.full_refit else [])
+
+    targets = ["publish_local"]
+    if not args.no_cloud:
+        targets.append("publish_cloud")
+    if args.plot:
+        targets.append("plot")
+
+    if args.metrics:
+        instr.enable(profile=args.profile, trace_memory=args.trace_memory)
+    try:
+        report = build_pipeline(args).run(targets, force=force)
+    finally:
+        if args.metrics:
+            logging.info(f"Metrics saved to {instr.write(args.metrics)}")
+            instr.disable()
+    for name, result in report.items():
+        logging.info(f"{name:<14} {result['status']:<8} {result['seconds']:7.2f}s")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# Shared test setup: run from the src directory with `python -m pytest`
+
+
+# IMPORT PACKAGES
+# File and System Operations
+import os
+import sys
+import importlib.util
+
+import pytest
+
+
+# DIRECTORY SETUP
+# Put the src directory first, so the tests import the macro_utils package in this tree
+src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, src_dir)
+
+
+## Import scripts/nb04.py as a module (it isn't part of a package)
+@pytest.fixture(scope="session")
+def nb04():
+    spec = importlib.util.spec_from_file_location("nb04", os.path.join(src_dir, "scripts", "nb04.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+## Start every test with an empty engine registry, so engines for deleted temp files aren't reused
+@pytest.fixture(autouse=True)
+def fresh_engines():
+    from macro_utils import sql_queries as sqlq
+    sqlq.dispose_engines()
+    yield
+    sqlq.dispose_engines()
@@ -0,0 +1,101 @@
+# The comparables index, checked against an exhaustive haversine scan of the same listings
+
+
+# IMPORT PACKAGES
+import numpy as np
+import pandas as pd
+import pytest
+
+from macro_utils.comparables import EARTH_RADIUS_KM, ComparablesIndex
+
+
+def make_listings(n=600, seed=0, first_id=0):
+    rng = np.random.default_rng(seed)
+    travel_time = rng.uniform(600, 4800, n)
+    travel_time[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        "id": np.arange(first_id, first_id + n),
+        "latitude": rng.uniform(51.3, 51.7, n),
+        "longitude": rng.uniform(-0.5, 0.3, n),
+        "bedrooms": rng.integers(1, 4, n),
+        "travel_time": travel_time,
+        "price_per_bed": rng.uniform(500, 1500, n),
+    })
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def brute_force(indexed, queries, k, travel_tolerance, candidates=None):
+    """The comparables of each query listing from a scan of every indexed listing. With
+    `candidates`, only that many of the nearest same-bedroom listings (the listing itself
+    included) are considered."""
+    results = []
+    for _, listing in queries.iterrows():
+        pool = indexed[indexed["bedrooms"] == listing["bedrooms"]]
+        distance = haversine_km(listing["latitude"], listing["longitude"], pool["latitude"], pool["longitude"])
+        order = np.argsort(distance.to_numpy(), kind="stable")[:candidates]
+        pool, distance = pool.iloc[order], distance.to_numpy()[order]
+        other = (pool["id"] != listing["id"]).to_numpy()
+        pool, distance = pool[other], distance[other]
+        if travel_tolerance is not None:
+            similar = ~(np.abs(pool["travel_time"].to_numpy() - listing["travel_time"]) > travel_tolerance)
+            pool, distance = pool[similar], distance[similar]
+        pool, distance = pool.iloc[:k], distance[:k]
+        results.append((pool["price_per_bed"].median() if len(pool) else np.nan, len(pool),
+                        distance.max() if len(pool) else np.nan))
+    return pd.DataFrame(results, columns=["comparable_price_per_bed", "n_comparables", "comparable_distance_km"],
+                        index=queries.index)
+
+
+def assert_matches(result, expected):
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, rtol=1e-9)
+
+
+def test_query_matches_a_brute_force_scan():
+    listings = make_listings()
+    index = ComparablesIndex(listings, k=8, travel_tolerance=None)
+    queries = listings.sample(80, random_state=1)
+    assert_matches(index.query(queries), brute_force(listings, queries, 8, None))
+
+
+def test_query_with_a_travel_time_filter():
+    listings = make_listings()
+    index = ComparablesIndex(listings, k=8, oversample=4, travel_tolerance=900)
+    queries = listings.sample(80, random_state=2)
+    result = index.query(queries)
+    # the filter is applied to the nearest k * oversample (+ the listing itself) listings
+    assert_matches(result, brute_force(listings, queries, 8, 900, candidates=8 * 4 + 1))
+    assert (result["n_comparables"] <= 8).all()
+
+
+def test_a_strict_travel_time_filter_can_give_fewer_than_k():
+    listings = make_listings()
+    index = ComparablesIndex(listings, k=8, oversample=2, travel_tolerance=60)
+    queries = listings.sample(80, random_state=3)
+    result = index.query(queries)
+    exhaustive = brute_force(listings, queries, 8, 60)
+    assert (result["n_comparables"] < exhaustive["n_comparables"]).any()
+    assert (result["n_comparables"] <= exhaustive["n_comparables"]).all()
+    # looking further finds them
+    wider = ComparablesIndex(listings, k=8, oversample=1000, travel_tolerance=60).query(queries)
+    assert_matches(wider, exhaustive)
+
+
+@pytest.mark.parametrize("rebuild_fraction", [0.0, 10.0])  # fold into the main tree / keep a separate one
+def test_replaced_listings_are_matched_by_their_latest_entry(rebuild_fraction):
+    listings = make_listings()
+    index = ComparablesIndex(listings, k=6, travel_tolerance=None, rebuild_fraction=rebuild_fraction)
+
+    # a third of the listings come back moved and repriced, alongside some new ones
+    moved = make_listings(200, seed=5, first_id=0).assign(id=listings["id"].iloc[::3].to_numpy())
+    new = make_listings(100, seed=6, first_id=10_000)
+    index.add(pd.concat([moved, new]))
+    latest = pd.concat([listings[~listings["id"].isin(moved["id"])], moved, new], ignore_index=True)
+
+    assert len(index) == len(latest)
+    queries = latest.sample(80, random_state=4)
+    assert_matches(index.query(queries), brute_force(latest, queries, 6, None))
@@ -0,0 +1,123 @@
+# The CPI engine, checked against the pandas pct_change and weighted-sum calculation it replaced
+
+
+# IMPORT PACKAGES
+import numpy as np
+import pandas as pd
+import pytest
+
+from macro_utils import cpi
+
+
+def make_cpi(n_series=8, n_months=40, seed=0):
+    """A long CPI frame with a few missing observations, in no particular order."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-31", periods=n_months, freq="ME")
+    series = [f"S{i}" for i in range(n_series)]
+    levels = 100 * np.exp(rng.normal(0.002, 0.01, (n_series, n_months)).cumsum(axis=1))
+    frame = pd.DataFrame({
+        "series_short_name": np.repeat(series, n_months),
+        "date": np.tile(dates, n_series),
+        "value": levels.ravel(),
+    })
+    frame = frame.drop(index=rng.choice(len(frame), 15, replace=False))
+    weights = pd.DataFrame({"series_short_name": series[::-1], "weight": rng.uniform(1, 20, n_series)[::-1]})
+    return frame.sample(frac=1, random_state=seed), weights
+
+
+def pandas_reference(frame, weights, horizon, members=None):
+    """Percentage changes and the weighted aggregate, the way the notebook computed them."""
+    wide = frame.pivot(index="date", columns="series_short_name", values="value").asfreq("ME")
+    changes = 100 * (wide / wide.shift(horizon) - 1)
+    w = weights.set_index("series_short_name")["weight"].reindex(wide.columns)
+    if members is not None:
+        w = w.where(w.index.isin(members), 0.0)
+    contribution = changes * w
+    total = changes.notna().mul(w).sum(axis=1)
+    aggregate = contribution.sum(axis=1) / total.where(total > 0)
+    return changes, contribution, aggregate
+
+
+# Changes, contributions and the aggregate
+
+@pytest.mark.parametrize("horizon", cpi.HORIZONS)
+def test_matches_pct_change_and_weighted_sum(horizon):
+    frame, weights = make_cpi()
+    matrix = cpi.CPIMatrix.from_frame(frame)
+    changes = cpi.pct_changes(matrix.values)
+    result = cpi.contributions(changes, matrix.align_weights(weights))
+    i = cpi.HORIZONS.index(horizon)
+
+    expected_changes, expected_contribution, expected_aggregate = pandas_reference(frame, weights, horizon)
+    # pct_change(horizon) gives the same changes (without filling the gaps)
+    wide = frame.pivot(index="date", columns="series_short_name", values="value").asfreq("ME")
+    pd.testing.assert_frame_equal(expected_changes, 100 * wide.pct_change(horizon, fill_method=None))
+
+    np.testing.assert_allclose(changes[i], expected_changes.T.to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(result["contribution"][i], expected_contribution.T.to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(result["aggregate"][i], expected_aggregate.to_numpy(), rtol=1e-12)
+
+
+def test_members_and_batched_weight_sets():
+    frame, weights = make_cpi()
+    matrix = cpi.CPIMatrix.from_frame(frame)
+    changes = cpi.pct_changes(matrix.values)
+    core = ["S1", "S2", "S5"]
+    members = np.isin(matrix.series, core)
+
+    single = cpi.contributions(changes, matrix.align_weights(weights), members)
+    _, _, expected = pandas_reference(frame, weights, 12, members=core)
+    np.testing.assert_allclose(single["aggregate"][cpi.HORIZONS.index(12)], expected.to_numpy(), rtol=1e-12)
+
+    # several weight sets at once give the same as one at a time
+    rng = np.random.default_rng(1)
+    weight_sets = rng.uniform(0, 10, (5, len(matrix.series)))
+    batched = cpi.contributions(changes, weight_sets)
+    assert batched["aggregate"].shape == (5, len(cpi.HORIZONS), len(matrix.dates))
+    for k, w in enumerate(weight_sets):
+        one = cpi.contributions(changes, w)
+        np.testing.assert_allclose(batched["aggregate"][k], one["aggregate"], rtol=1e-12)
+        np.testing.assert_allclose(batched["contribution"][k], one["contribution"], rtol=1e-12)
+
+
+# Building the matrix and reshaping the results
+
+def test_from_frame_keeps_missing_months_as_gaps():
+    frame, _ = make_cpi()
+    frame = frame[frame["date"] != pd.Timestamp("2021-03-31")]  # a month missing for every series
+    matrix = cpi.CPIMatrix.from_frame(frame)
+    assert len(matrix.dates) == 40 and (matrix.dates == pd.date_range("2020-01-31", periods=40, freq="ME")).all()
+    assert np.isnan(matrix.values[:, 14]).all()
+    wide = frame.pivot(index="date", columns="series_short_name", values="value").asfreq("ME")
+    np.testing.assert_array_equal(matrix.values, wide.T.to_numpy())
+
+
+def test_aggregate_index_matches_rebased_weighted_mean():
+    frame, weights = make_cpi()
+    matrix = cpi.CPIMatrix.from_frame(frame.dropna())
+    w = matrix.align_weights(weights)
+    base = 3
+    wide = frame.pivot(index="date", columns="series_short_name", values="value").asfreq("ME")
+    rebased = 100 * wide / wide.iloc[base]
+    expected = rebased.mul(w).sum(axis=1) / rebased.notna().mul(w).sum(axis=1)
+    np.testing.assert_allclose(cpi.aggregate_index(matrix.values, w, base), expected.to_numpy(), rtol=1e-12)
+
+
+def test_to_long_matches_a_melt():
+    frame, weights = make_cpi()
+    matrix = cpi.CPIMatrix.from_frame(frame)
+    changes = cpi.pct_changes(matrix.values)
+    result = cpi.contributions(changes, matrix.align_weights(weights))
+    long = cpi.to_long(matrix, changes, result["contribution"], 12)
+
+    expected_changes, expected_contribution, _ = pandas_reference(frame, weights, 12)
+    name = "12_month_pct_change"
+    expected = pd.concat([
+        expected_changes.melt(ignore_index=False, value_name="level").assign(variable=name),
+        expected_contribution.melt(ignore_index=False, value_name="level").assign(variable=f"{name}_wgt_contrib"),
+    ]).reset_index().dropna(subset=["level"])
+    key = ["variable", "series_short_name", "date"]
+    pd.testing.assert_frame_equal(
+        long.sort_values(key, ignore_index=True)[["date", "series_short_name", "variable", "level"]],
+        expected.sort_values(key, ignore_index=True)[["date", "series_short_name", "variable", "level"]],
+        check_dtype=False, check_index_type=False, rtol=1e-12)
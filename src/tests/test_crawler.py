@@ -0,0 +1,272 @@
+# The crawl engine and streaming writer, offline: requests go to an httpx.MockTransport in
+# place of Rightmove
+
+
+# IMPORT PACKAGES
+import asyncio
+import contextlib
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+from benchmarks.synthetic import make_raw_listings
+from macro_utils import functions as fn
+from macro_utils import sql_queries as sqlq
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Routes the shared client through a handler; returns the list of requested urls."""
+    requested = []
+
+    def install(handler):
+        def record(request):
+            requested.append(str(request.url))
+            return handler(request)
+        monkeypatch.setattr(fn, "client", httpx.AsyncClient(transport=httpx.MockTransport(record)), raising=False)
+        monkeypatch.setattr(fn, "response_cache", None)
+        return requested
+    return install
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the backoff delays instead of waiting them out."""
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, *args):
+        delays.append(delay)
+        await real_sleep(0)
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return delays
+
+
+def search_pages(result_counts, page_ids=None, fail=()):
+    """A handler for the search API: `result_counts` maps a location to its resultCount,
+    and each page holds the ids offset..offset+23 (or page_ids(location, offset))."""
+    def handler(request):
+        query = parse_qs(urlparse(str(request.url)).query)
+        location, offset = query["locationIdentifier"][0], int(query["index"][0])
+        if location in fail:
+            return httpx.Response(404)
+        ids = page_ids(location, offset) if page_ids else range(offset, offset + fn.RESULTS_PER_PAGE)
+        return httpx.Response(200, json={"resultCount": result_counts[location],
+                                         "properties": [{"id": i} for i in ids]})
+    return handler
+
+
+def offsets(urls):
+    return sorted(int(parse_qs(urlparse(url).query)["index"][0]) for url in urls)
+
+
+# The rate limiter
+
+def run_through(limiter, n, hold=0.0):
+    """Sends n requests of `hold` seconds through the limiter; returns (peak in flight, seconds taken)."""
+    in_flight = peak = 0
+
+    async def request():
+        nonlocal in_flight, peak
+        async with limiter:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(hold)
+            in_flight -= 1
+
+    async def crawl():
+        await asyncio.gather(*[request() for _ in range(n)])
+
+    start = time.monotonic()
+    asyncio.run(crawl())
+    return peak, time.monotonic() - start
+
+
+def test_rate_limiter_caps_concurrency():
+    peak, _ = run_through(fn.RateLimiter(rate=1000, burst=100, max_concurrency=3), 12, hold=0.02)
+    assert peak == 3
+
+
+def test_rate_limiter_caps_the_request_rate():
+    # a burst of 2 goes at once, then one request every 1/50s
+    _, seconds = run_through(fn.RateLimiter(rate=50, burst=2, max_concurrency=8), 7)
+    assert seconds >= 5 / 50 * 0.9
+
+
+# Retries
+
+def test_fetch_json_retries_with_retry_after_then_backoff(serve, sleeps):
+    responses = iter([httpx.Response(429, headers={"Retry-After": "3"}), httpx.Response(503),
+                      httpx.Response(200, json={"ok": True})])
+    serve(lambda request: next(responses))
+    stats = fn.CrawlStats()
+
+    assert asyncio.run(fn.fetch_json("https://example.com/a", stats=stats, backoff=0.5)) == {"ok": True}
+    assert sleeps[0] == 3.0  # the server's Retry-After wins
+    assert 0 <= sleeps[1] <= 0.5 * 2  # then full-jitter backoff for the second attempt
+    assert stats.retries == 2 and stats.failures == 0
+    assert stats.status_counts == {429: 1, 503: 1, 200: 1}
+
+
+def test_fetch_json_retries_transport_errors(serve, sleeps):
+    calls = iter([httpx.ConnectError("refused"), None])
+
+    def handler(request):
+        error = next(calls)
+        if error:
+            raise error
+        return httpx.Response(200, json={"ok": True})
+    serve(handler)
+    assert asyncio.run(fn.fetch_json("https://example.com/a")) == {"ok": True}
+    assert len(sleeps) == 1
+
+
+def test_fetch_json_gives_up_after_max_retries(serve, sleeps):
+    requested = serve(lambda request: httpx.Response(503))
+    stats = fn.CrawlStats()
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fn.fetch_json("https://example.com/a", stats=stats, max_retries=2))
+    assert len(requested) == 3
+    assert stats.retries == 2 and stats.failures == 1
+
+
+def test_fetch_json_does_not_retry_client_errors(serve, sleeps):
+    requested = serve(lambda request: httpx.Response(404))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fn.fetch_json("https://example.com/a"))
+    assert len(requested) == 1 and sleeps == []
+
+
+# Paginated searches
+
+@pytest.mark.parametrize("result_count, total_results, expected_pages", [
+    ("50", 250, 3),  # fewer results than asked for: only the pages that exist
+    ("1,200", 250, 11),  # more results than asked for: stop at total_results
+    ("5000", 2000, 42),  # never beyond the API's 1000-result limit
+    ("many", 100, 5),  # an unreadable count falls back to total_results
+])
+def test_scrape_search_only_requests_pages_that_exist(serve, result_count, total_results, expected_pages):
+    requested = serve(search_pages({"L1": result_count}))
+    results = asyncio.run(fn.scrape_search("L1", total_results, limiter=fn.RateLimiter(rate=1000, burst=100)))
+    assert offsets(requested) == [24 * page for page in range(expected_pages)]
+    assert len(results) == 24 * expected_pages
+
+
+def test_scrape_search_drops_properties_repeated_across_pages(serve):
+    # every page repeats the last 4 ids of the page before it
+    serve(search_pages({"L1": "72"}, page_ids=lambda location, offset: range(max(0, offset - 4), offset + 24)))
+    stats = fn.CrawlStats()
+    results = asyncio.run(fn.scrape_search("L1", stats=stats))
+    assert sorted(prop["id"] for prop in results) == list(range(72))
+    assert stats.duplicates == 8 and stats.pages == 3 and stats.properties == 72
+
+
+def test_scrape_many_shares_one_crawl_across_locations(serve):
+    # L1 and L2 overlap on ids 24-47, and L1 is asked for twice
+    requested = serve(search_pages({"L1": "48", "L2": "48"},
+                                   page_ids=lambda location, offset: range(offset + (24 if location == "L2" else 0),
+                                                                           offset + (48 if location == "L2" else 24))))
+    stats = fn.CrawlStats()
+    results = asyncio.run(fn.scrape_many(["L1", "L2", "L1"], stats=stats))
+    assert sorted(prop["id"] for prop in results) == list(range(72))
+    assert len(requested) == 4
+    assert stats.duplicates == 24
+
+
+def test_scrape_many_raises_when_a_location_fails(serve, sleeps):
+    serve(search_pages({"L1": "48"}, fail={"L2"}))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fn.scrape_many(["L1", "L2"]))
+
+
+# Streaming
+
+def test_stream_search_yields_each_page_once(serve):
+    serve(search_pages({"L1": "100"}))
+
+    async def collect():
+        return [page async for page in fn.stream_search("L1", limiter=fn.RateLimiter(rate=1000, burst=100))]
+    pages = asyncio.run(collect())
+    assert len(pages) == 5
+    assert sorted(prop["id"] for page in pages for prop in page) == list(range(120))
+
+
+def test_stream_many_merges_locations_without_repeats(serve):
+    serve(search_pages({"L1": "48", "L2": "48"},
+                       page_ids=lambda location, offset: range(offset + (24 if location == "L2" else 0),
+                                                               offset + (48 if location == "L2" else 24))))
+    stats = fn.CrawlStats()
+
+    async def collect():
+        return [page async for page in fn.stream_many(["L1", "L2"], max_concurrency=2, rate=1000, stats=stats)]
+    pages = asyncio.run(collect())
+    assert sorted(prop["id"] for page in pages for prop in page) == list(range(72))
+    assert stats.pages == 4 and stats.duplicates == 24
+
+
+def test_stream_many_raises_when_a_location_fails(serve, sleeps):
+    serve(search_pages({"L1": "48"}, fail={"L2"}))
+
+    async def collect():
+        return [page async for page in fn.stream_many(["L1", "L2"], rate=1000)]
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(collect())
+
+
+def test_stream_many_stops_its_crawlers_when_the_consumer_stops(serve):
+    serve(search_pages({"L1": "1000", "L2": "1000"}))
+
+    async def first_page():
+        before = asyncio.all_tasks()
+        async with contextlib.aclosing(fn.stream_many(["L1", "L2"], total_results=1000, max_concurrency=1,
+                                                      rate=1000)) as pages:
+            async for page in pages:
+                break
+        # nothing is left fetching or waiting to hand over a page
+        still_running = list(asyncio.all_tasks() - before)
+        return page, still_running
+
+    page, still_running = asyncio.run(asyncio.wait_for(first_page(), timeout=10))
+    assert len(page) == 24
+    assert still_running == []
+
+
+# Writing streamed listings
+
+def pages_of(listings, size=24):
+    async def pages():
+        for start in range(0, len(listings), size):
+            await asyncio.sleep(0)
+            yield listings[start:start + size]
+    return pages()
+
+
+def test_write_listings_stores_each_listing_once(tmp_path):
+    listings = make_raw_listings(300, seed=0)
+    engine = sqlq.get_sql_engine(str(tmp_path / "test.db"))
+    unique = len({prop["id"] for prop in listings})
+
+    first = asyncio.run(fn.write_listings(pages_of(listings[:200]), engine, batch_size=50))
+    # a later crawl that finds the same listings again only adds the new ones
+    second = asyncio.run(fn.write_listings(pages_of(listings), engine, batch_size=50))
+    stored = sqlq.read_table("properties_data", engine, columns=["id"])
+    assert first + second == len(stored) == unique
+    assert stored["id"].is_unique
+
+
+def test_write_listings_writes_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+    normalise_listings = fn.normalise_listings
+
+    def record_thread(batch):
+        threads.append(threading.current_thread())
+        return normalise_listings(batch)
+    monkeypatch.setattr(fn, "normalise_listings", record_thread)
+
+    engine = sqlq.get_sql_engine(str(tmp_path / "test.db"))
+    asyncio.run(fn.write_listings(pages_of(make_raw_listings(200, seed=1)), engine, batch_size=50))
+    assert len(threads) == 3  # two full batches of 72 (pages of 24), then the rest
+    assert threading.main_thread() not in threads
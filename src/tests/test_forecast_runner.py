@@ -0,0 +1,70 @@
+# The forecast runner: projections, horizons and years, in-process and in worker processes
+
+
+# IMPORT PACKAGES
+import numpy as np
+import pandas as pd
+import pytest
+
+from macro_utils import growth
+from macro_utils import forecast_runner as fr
+
+
+def make_panel(n_countries=6, n_years=30, seed=0):
+    rng = np.random.default_rng(seed)
+    data = {name: np.exp(rng.normal(0.02, 0.02, (n_countries, n_years)).cumsum(axis=1)) * rng.uniform(1, 10, (n_countries, 1))
+            for name in fr.PANEL_VARIABLES}
+    data["delta"] = rng.uniform(0.03, 0.05, (n_countries, n_years))
+    return growth.Panel(np.array([f"C{i}" for i in range(n_countries)]), np.arange(1990, 1990 + n_years), data)
+
+
+def test_matches_the_shared_solow_projection():
+    panel = make_panel()
+    rows = np.arange(len(panel.countries))
+    arrays = {name: panel[name] for name in fr.PANEL_VARIABLES}
+    result = fr.fit_and_project(rows, {"baseline": {}}, [1, 3], window=10, arrays=arrays)
+
+    # with p's trend taken as given, the levels are project_solow's from the last year
+    params = growth.estimate_parameters(panel, 10)
+    K0, A0, L0 = (panel[name][:, -1] for name in ("rnna", "rtfpna", "L"))
+    p = (panel["rgdpna"] / (panel["rtfpna"] * panel["rnna"] ** 0.3 * panel["L"] ** 0.7))[:, -10:]
+    slope, intercept = np.polyfit(np.arange(10), p.T, 1)
+    expected = growth.project_solow(K0, A0, L0, params["s"], params["n"], params["g"], params["delta"], 3,
+                                    level=intercept + 9 * slope, level_trend=slope)["Y"]
+    np.testing.assert_allclose(result["levels"][0], expected[:, [1, 3]], rtol=1e-10)
+    assert (result["base"] == 29).all()
+
+
+def test_years_count_from_each_countrys_last_observation():
+    panel = make_panel()
+    panel["rnna"][1, -2:] = np.nan  # C1's capital stops two years early
+    panel["L"][2, :] = np.nan  # C2 has no labour data at all
+    df = fr.run_forecasts(panel, {"slow": {"g": -0.01}}, horizons=[1, 5], workers=0)
+
+    years = df[df["scenario"] == "baseline"].set_index(["country", "horizon"])["year"]
+    assert years[("C0", 1)] == 2020 and years[("C0", 5)] == 2024
+    assert years[("C1", 1)] == 2018 and years[("C1", 5)] == 2022
+    assert pd.isna(years[("C2", 1)])
+    assert df.loc[df["country"] == "C2", "level"].isna().all()
+    assert len(df) == 6 * 2 * 2
+
+
+@pytest.mark.parametrize("horizons", [[0, 1], [-1], []])
+def test_horizons_must_be_at_least_one(horizons):
+    with pytest.raises(ValueError, match="horizons"):
+        fr.run_forecasts(make_panel(), horizons=horizons, workers=0)
+
+
+def test_empty_panel_gives_an_empty_frame():
+    empty = growth.Panel(np.array([], dtype=object), np.arange(1990, 2020),
+                         {name: np.empty((0, 30)) for name in fr.PANEL_VARIABLES})
+    df = fr.run_forecasts(empty, workers=0)
+    assert df.empty
+    assert list(df.columns) == ["country", "scenario", "horizon", "year", "level"]
+
+
+def test_worker_processes_give_the_same_rows():
+    panel = make_panel(n_countries=9)
+    in_process = fr.run_forecasts(panel, {"slow": {"g": -0.01}}, workers=0, batch_size=4)
+    pooled = fr.run_forecasts(panel, {"slow": {"g": -0.01}}, workers=2, batch_size=4)
+    pd.testing.assert_frame_equal(in_process, pooled)
@@ -0,0 +1,113 @@
+# Growth accounting and the Solow projection, on synthetic Cobb-Douglas panels
+
+
+# IMPORT PACKAGES
+import warnings
+
+import numpy as np
+import pytest
+
+from macro_utils import growth
+
+
+def make_panel(n_countries=4, n_years=25, alpha=growth.ALPHA, seed=0):
+    """Output built exactly as Y = A K^alpha L^(1 - alpha) from random capital, labour and TFP paths."""
+    rng = np.random.default_rng(seed)
+
+    def path(drift):
+        return np.exp(rng.normal(drift, 0.02, (n_countries, n_years)).cumsum(axis=1)) * rng.uniform(1, 10, (n_countries, 1))
+    K, L, A = path(0.03), path(0.01), path(0.015)
+    data = {"rnna": K, "L": L, "rtfpna": A, "rgdpna": A * K ** alpha * L ** (1 - alpha),
+            "delta": rng.uniform(0.03, 0.05, (n_countries, n_years))}
+    return growth.Panel(np.array([f"C{i}" for i in range(n_countries)]), np.arange(1990, 1990 + n_years), data)
+
+
+# Growth accounting
+
+def test_growth_accounting_recovers_tfp_growth():
+    panel = make_panel()
+    components = growth.growth_accounting(panel)
+
+    np.testing.assert_allclose(components["tfp_contribution"][:, 1:], growth.log_growth(panel["rtfpna"])[:, 1:], atol=1e-12)
+    total = components["capital_contribution"] + components["labour_contribution"] + components["tfp_contribution"]
+    np.testing.assert_allclose(total, components["output_growth"], atol=1e-12)
+    np.testing.assert_allclose(components["output_per_hour_growth"],
+                               components["capital_deepening"] + components["tfp_contribution"], atol=1e-12)
+    assert np.isnan(components["output_growth"][:, 0]).all()
+
+
+def test_average_contributions_over_a_window():
+    panel = make_panel()
+    components = growth.growth_accounting(panel)
+    panel["rgdpna"][1, :] = np.nan
+    averages = growth.average_contributions(growth.growth_accounting(panel), panel.years, 2000, 2004)
+    window = slice(10, 15)
+    np.testing.assert_allclose(averages["capital_contribution"], components["capital_contribution"][:, window].mean(axis=1))
+    assert np.isnan(averages["output_growth"][1])
+
+
+def test_estimate_parameters_without_data_is_nan_and_silent():
+    panel = make_panel()
+    panel["L"][2, :] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        params = growth.estimate_parameters(panel, window=10)
+    assert np.isnan(params["n"][2]) and not np.isnan(params["n"][[0, 1, 3]]).any()
+    np.testing.assert_allclose(params["g"], growth.log_growth(panel["rtfpna"])[:, -10:].mean(axis=1))
+
+
+# The Solow projection
+
+def project_one(K0, A0, L0, s, n, g, delta, horizon, alpha, level):
+    # the same model, one country and one year at a time
+    K, Y = [K0], []
+    for t in range(horizon + 1):
+        A, L = A0 * np.exp(g * t), L0 * np.exp(n * t)
+        Y.append(level * A * K[t] ** alpha * L ** (1 - alpha))
+        K.append(s * Y[t] + (1 - delta) * K[t])
+    return np.array(Y), np.array(K[:-1])
+
+
+def test_project_solow_matches_a_year_by_year_loop():
+    rng = np.random.default_rng(1)
+    K0, A0, L0 = rng.uniform(1, 10, (3, 5))
+    s, n, g, delta, level = rng.uniform(0.2, 0.3, 5), rng.uniform(0, 0.02, 5), rng.uniform(0, 0.02, 5), 0.04, 1.3
+    projection = growth.project_solow(K0, A0, L0, s, n, g, delta, 8, level=level)
+    for i in range(5):
+        Y, K = project_one(K0[i], A0[i], L0[i], s[i], n[i], g[i], delta, 8, growth.ALPHA, level)
+        np.testing.assert_allclose(projection["Y"][i], Y, rtol=1e-12)
+        np.testing.assert_allclose(projection["K"][i], K, rtol=1e-12)
+
+
+def test_project_solow_broadcasts_scenarios():
+    K0, A0, L0 = np.ones(4), np.ones(4), np.ones(4)
+    s = np.array([[0.2], [0.3]])  # two scenarios
+    projection = growth.project_solow(K0, A0, L0, s, 0.01, 0.01, 0.05, 5)
+    assert projection["Y"].shape == (2, 4, 6)
+    # saving more gives more capital, and so more output, from the second year on
+    assert (projection["Y"][1, :, 1:] > projection["Y"][0, :, 1:]).all()
+    np.testing.assert_allclose(projection["Y"][:, :, 0], 1.0)
+
+
+def test_steady_state_capital_stays_put_without_growth():
+    s, delta, alpha = 0.25, 0.05, growth.ALPHA
+    k_star, y_star = growth.solow_steady_state(s, 0.0, 0.0, delta, alpha)
+    projection = growth.project_solow(k_star, 1.0, 1.0, s, 0.0, 0.0, delta, 20, alpha)
+    np.testing.assert_allclose(projection["K"], k_star)
+    np.testing.assert_allclose(projection["Y"], y_star)
+
+
+def test_project_panel_starts_every_country_from_one_complete_year():
+    panel = make_panel()
+    panel["rnna"][1, -3:] = np.nan  # C1's capital stops three years early
+    panel["L"][2, :] = np.nan  # C2 has no labour data at all
+    projection = growth.project_panel(panel, horizon=5, scenarios={"slow": {"g": -0.01}})
+
+    assert projection["base"].tolist() == [24, 21, -1, 24]
+    assert projection["Y"].shape == (2, 4, 6)
+    assert list(projection["scenarios"]) == ["baseline", "slow"]
+    # the calibrated model reproduces output and capital in each country's starting year
+    for i, base in [(0, 24), (1, 21), (3, 24)]:
+        assert projection["Y"][0, i, 0] == pytest.approx(panel["rgdpna"][i, base])
+        assert projection["K"][0, i, 0] == pytest.approx(panel["rnna"][i, base])
+    assert np.isnan(projection["Y"][:, 2]).all()
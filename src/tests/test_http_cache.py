@@ -0,0 +1,150 @@
+# ResponseCache against a local stub server (no network): fresh hits, 304 revalidation
+# with and without the in-memory layer, and TTL expiry
+
+
+# IMPORT PACKAGES
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from macro_utils import http_cache
+from macro_utils.http_cache import ResponseCache
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/etag/... replies with an ETag (and 304 to a matching If-None-Match); /plain/... without one."""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        etag = '"v1"'
+        if self.path.startswith("/etag") and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = f"body of {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path.startswith("/etag"):
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # a clock the tests move forward by hand
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(http_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def fetch(cache, url, params=None):
+    async def go():
+        async with httpx.AsyncClient() as client:
+            return await cache.get(client, url, params=params)
+    return asyncio.run(go())
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.mark.parametrize("memory_entries", [256, 0])
+def test_fresh_hit_then_revalidation(server, clock, tmp_path, memory_entries):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls={}, default_ttl=60, memory_entries=memory_entries)
+    url = f"{base_url(server)}/etag/{memory_entries}"
+    server.requests.clear()
+
+    first = fetch(cache, url)
+    assert first.status_code == 200 and first.text == f"body of /etag/{memory_entries}"
+
+    # fresh: served without a request
+    clock.now += 30
+    assert fetch(cache, url).text == first.text
+    assert len(server.requests) == 1
+
+    # stale: revalidated with the ETag, and the 304 serves the stored body
+    clock.now += 60
+    revalidated = fetch(cache, url)
+    assert revalidated.status_code == 200 and revalidated.text == first.text
+    assert server.requests[-1][1] == '"v1"'
+    assert cache.stats() == {"entries": 1, "bytes": len(first.content), "hits": 1, "misses": 2, "revalidated": 1}
+
+    # the revalidation made the entry fresh again
+    clock.now += 30
+    fetch(cache, url)
+    assert len(server.requests) == 2
+    cache.close()
+
+
+def test_expired_entries_without_validators_are_downloaded_again(server, clock, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls={"/plain/": 10}, default_ttl=3600)
+    url = f"{base_url(server)}/plain/page"
+    server.requests.clear()
+
+    fetch(cache, url, params={"index": 0})
+    clock.now += 5
+    fetch(cache, url, params={"index": 0})
+    assert len(server.requests) == 1
+
+    clock.now += 10
+    assert fetch(cache, url, params={"index": 0}).text == "body of /plain/page?index=0"
+    assert len(server.requests) == 2 and server.requests[-1][1] is None
+    assert cache.revalidated == 0
+    cache.close()
+
+
+def test_entries_survive_a_new_cache_on_the_same_file(server, clock, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    url = f"{base_url(server)}/plain/persisted"
+    server.requests.clear()
+
+    first = ResponseCache(path, ttls={}, default_ttl=60)
+    fetch(first, url)
+    first.close()
+
+    second = ResponseCache(path, ttls={}, default_ttl=60)
+    assert fetch(second, url).text == "body of /plain/persisted"
+    assert len(server.requests) == 1
+    second.close()
+
+
+def test_least_recently_used_entries_are_evicted(server, clock, tmp_path):
+    # each body ("body of /plain/a") is 16 bytes, so the cache holds four of them
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttls={}, default_ttl=60, max_bytes=64)
+    for page in ["a", "b", "c", "d"]:
+        clock.now += 1
+        fetch(cache, f"{base_url(server)}/plain/{page}")
+    clock.now += 1
+    fetch(cache, f"{base_url(server)}/plain/a")  # a is now the most recently used
+    clock.now += 1
+    fetch(cache, f"{base_url(server)}/plain/e")
+    assert cache.stats()["entries"] == 4
+
+    # b was evicted (and is downloaded again), a was kept
+    server.requests.clear()
+    fetch(cache, f"{base_url(server)}/plain/a")
+    assert server.requests == []
+    fetch(cache, f"{base_url(server)}/plain/b")
+    assert [path for path, _ in server.requests] == ["/plain/b"]
+    cache.close()
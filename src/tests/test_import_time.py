@@ -0,0 +1,28 @@
+# Import-time budget: importing the package must stay cheap (benchmarks.import_time),
+# measured in fresh interpreters so nothing already imported by the tests counts
+
+
+# IMPORT PACKAGES
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import import_time
+
+
+@pytest.mark.parametrize("module, budget_ms", sorted(import_time.BUDGETS_MS.items()))
+def test_import_time_within_budget(module, budget_ms):
+    elapsed = import_time.best_import_time(module)
+    assert elapsed <= budget_ms, f"import {module} took {elapsed:.1f} ms (budget {budget_ms} ms)"
+
+
+def test_heavy_dependencies_are_not_imported_eagerly():
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    heavy = ["pandas", "numpy", "httpx", "sqlalchemy", "sklearn"]
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, macro_utils.functions; print([m for m in {heavy!r} if m in sys.modules])"],
+        capture_output=True, text=True, cwd=src_dir, check=True,
+    )
+    assert result.stdout.strip() == "[]"
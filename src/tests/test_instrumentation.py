@@ -0,0 +1,97 @@
+# The instrumentation hooks: spans for plain, async and generator functions, and export
+
+
+# IMPORT PACKAGES
+import asyncio
+import json
+import time
+
+import pandas as pd
+import pytest
+
+from macro_utils import instrumentation as instr
+from macro_utils import sql_queries as sqlq
+
+
+@pytest.fixture
+def metrics():
+    instr.enable()
+    yield instr.metrics
+    instr.disable()
+
+
+def test_disabled_records_nothing():
+    instr.metrics.reset()
+
+    @instr.timed("test.off")
+    def work():
+        return 1
+    assert work() == 1
+    assert instr.metrics.spans == {}
+
+
+def test_plain_and_async_functions(metrics):
+    @instr.timed("test.plain", rows=len)
+    def plain(n):
+        return list(range(n))
+
+    @instr.timed("test.async", rows=len)
+    async def later(n):
+        await asyncio.sleep(0.01)
+        return list(range(n))
+
+    plain(3)
+    plain(4)
+    asyncio.run(later(5))
+    assert metrics.spans["test.plain"]["calls"] == 2 and metrics.spans["test.plain"]["rows"] == 7
+    assert metrics.spans["test.async"]["rows"] == 5
+    assert metrics.spans["test.async"]["wall_seconds"] >= 0.01
+
+
+def test_generators_are_timed_while_iterated(metrics):
+    @instr.timed("test.chunks", rows=len)
+    def chunks():
+        for _ in range(3):
+            time.sleep(0.01)
+            yield [1, 2]
+
+    iterator = chunks()
+    assert "test.chunks" not in metrics.spans  # nothing has run yet
+    items = list(iterator)
+    span = metrics.spans["test.chunks"]
+    assert len(items) == 3
+    assert span["calls"] == 1 and span["rows"] == 6
+    assert span["wall_seconds"] >= 0.03
+
+
+def test_chunked_read_table_times_the_reads(metrics, tmp_path):
+    engine = sqlq.get_sql_engine(str(tmp_path / "test.db"))
+    sqlq.make_table(pd.DataFrame({"id": range(1000), "value": 1.0}), "data", engine)
+
+    chunks = list(sqlq.read_table("data", engine, chunksize=300))
+    span = metrics.spans["db.read_table"]
+    assert len(chunks) == 4
+    assert span["calls"] == 1 and span["rows"] == 1000
+    assert span["wall_seconds"] > 0
+
+
+def test_errors_are_counted(metrics):
+    @instr.timed("test.fails")
+    def fails():
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        fails()
+    assert metrics.spans["test.fails"]["errors"] == 1
+
+
+def test_export(metrics, tmp_path):
+    with instr.span("test.block", rows=2, nbytes=10):
+        pass
+    instr.count("http_responses", host="example", status="200")
+
+    data = json.loads(open(instr.write(str(tmp_path / "metrics.json"))).read())
+    assert data["spans"]["test.block"]["rows"] == 2
+    prom = open(instr.write(str(tmp_path / "metrics.prom"))).read()
+    assert 'macro_utils_span_calls_total{span="test.block"} 1' in prom
+    assert 'macro_utils_http_responses_total{host="example",status="200"} 1' in prom
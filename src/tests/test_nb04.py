@@ -0,0 +1,165 @@
+# Runs the nb04 pipeline end to end against an empty temporary database, with the
+# scrape replaced by seeded synthetic listings (nothing goes over the network)
+
+
+# IMPORT PACKAGES
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import inspect, text
+
+from benchmarks.synthetic import make_raw_listings
+from macro_utils import sql_queries as sqlq
+from macro_utils.rent_model import RentModel
+
+
+@pytest.fixture
+def run(nb04, tmp_path, monkeypatch):
+    monkeypatch.delenv("TRAVELTIME_APP_ID", raising=False)
+    monkeypatch.delenv("TRAVELTIME_API_KEY", raising=False)
+    db_path = str(tmp_path / "properties.db")
+
+    def run(*extra, credentials=None):
+        # without credentials the cloud is skipped altogether
+        cloud = ["--credentials", credentials] if credentials else ["--no-cloud"]
+        return nb04.main(["--db", db_path, "--checkpoint-dir", str(tmp_path / "checkpoints"), *cloud, *extra])
+    run.db_path = db_path
+    return run
+
+
+@pytest.fixture
+def cloud(tmp_path, monkeypatch):
+    """A SQLite database standing in for supabase; returns its engine."""
+    engine = sqlq.get_sql_engine(str(tmp_path / "cloud.db"))
+    monkeypatch.setattr(sqlq, "get_supabase_engine", lambda **kwargs: engine)
+    return engine
+
+
+def add_travel_times(listings, transportation_type):
+    rng = np.random.default_rng(0)
+    return listings.assign(travel_time=rng.uniform(600, 3600, len(listings)))
+
+
+def count(engine, sql):
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).fetchone()
+
+
+def columns(db_path):
+    return {col["name"] for col in inspect(sqlq.get_sql_engine(db_path)).get_columns("properties_data")}
+
+
+def test_nothing_scraped_on_a_fresh_database(run):
+    report = run()
+    assert {name: result["status"] for name, result in report.items()} == {
+        "scrape": "ran", "normalise": "ran", "travel_time": "ran", "store": "ran", "model": "ran", "publish_local": "ran"}
+    assert {"travel_time", "distance", "predicted_price_per_bed"} <= columns(run.db_path)
+
+
+def test_listings_without_travel_times(nb04, run, monkeypatch):
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(200, seed=1))
+    run("--locations", "REGION^1")
+
+    engine = sqlq.get_sql_engine(run.db_path)
+    with engine.connect() as conn:
+        stored, travel_times = conn.execute(text("SELECT COUNT(*), COUNT(travel_time) FROM properties_data")).fetchone()
+    assert stored > 0
+    assert travel_times == 0
+
+
+def test_listings_with_travel_times_get_predictions(nb04, run, monkeypatch):
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(200, seed=2))
+    monkeypatch.setattr(nb04, "travel_time", add_travel_times)
+    run("--locations", "REGION^1")
+
+    engine = sqlq.get_sql_engine(run.db_path)
+    with engine.connect() as conn:
+        predicted = conn.execute(text("SELECT COUNT(predicted_price_per_bed) FROM properties_data")).scalar()
+    assert predicted > 0
+    # a second run with nothing new skips every stage
+    report = run("--locations", "REGION^1")
+    assert all(result["status"] == "skipped" for result in report.values())
+
+
+def test_failed_publish_does_not_count_rows_twice(nb04, run, monkeypatch):
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(200, seed=3))
+    monkeypatch.setattr(nb04, "travel_time", add_travel_times)
+
+    def failing_upsert(*args, **kwargs):
+        raise RuntimeError("database went away")
+    with monkeypatch.context() as patch:
+        patch.setattr(sqlq, "bulk_upsert", failing_upsert)
+        with pytest.raises(RuntimeError):
+            run("--locations", "REGION^1")
+    # nothing was published, so no model state was saved
+    assert RentModel.latest_version(sqlq.get_sql_engine(run.db_path)) is None
+
+    run("--locations", "REGION^1")
+    engine = sqlq.get_sql_engine(run.db_path)
+    with engine.connect() as conn:
+        predicted = conn.execute(text("SELECT COUNT(predicted_price_per_bed) FROM properties_data")).scalar()
+    assert RentModel.load(engine).n == predicted
+
+
+def test_rows_the_model_cannot_use_are_only_read_once(nb04, run, monkeypatch):
+    # without travel times clean_for_reg drops every row, so none gets a prediction
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(200, seed=4))
+    run("--locations", "REGION^1")
+
+    engine = sqlq.get_sql_engine(run.db_path)
+    stored, scored, predicted = count(engine, "SELECT COUNT(*), COUNT(scored_at), COUNT(predicted_price_per_bed) "
+                                              "FROM properties_data")
+    assert stored > 0 and scored == stored and predicted == 0
+    assert len(nb04.model(0, run.db_path, full_refit=False)["scored_ids"]) == 0
+
+
+def test_rows_predicted_without_the_cloud_are_published_later(nb04, run, cloud, monkeypatch, tmp_path):
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(200, seed=5))
+    monkeypatch.setattr(nb04, "travel_time", add_travel_times)
+    credentials = tmp_path / "credentials.json"
+
+    run("--locations", "REGION^1")  # --no-cloud
+    # no credentials yet: the cloud stage runs, but writes nothing
+    report = run("--locations", "REGION^1", credentials=str(credentials))
+    assert report["publish_cloud"]["status"] == "ran"
+    assert not inspect(cloud).has_table("properties_data")
+
+    credentials.write_text(json.dumps({"password": "secret", "host": "db.example.com"}))
+    report = run("--locations", "REGION^1", credentials=str(credentials))
+    assert report["publish_cloud"]["status"] == "ran"
+    predicted, = count(sqlq.get_sql_engine(run.db_path), "SELECT COUNT(predicted_price_per_bed) FROM properties_data")
+    assert predicted > 0
+    assert count(cloud, "SELECT COUNT(*), COUNT(predicted_price_per_bed) FROM properties_data") == (predicted, predicted)
+    assert "scored_at" not in {col["name"] for col in inspect(cloud).get_columns("properties_data")}
+
+    # a new day's scrape adds more rows, and only the new ones are inserted
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(300, seed=6))
+    run("--locations", "REGION^1", "--snapshot", "tomorrow", credentials=str(credentials))
+    predicted_after, = count(sqlq.get_sql_engine(run.db_path), "SELECT COUNT(predicted_price_per_bed) FROM properties_data")
+    assert predicted_after > predicted
+    assert count(cloud, "SELECT COUNT(*) FROM properties_data") == (predicted_after,)
+
+    # nothing new: the cloud stage is skipped
+    report = run("--locations", "REGION^1", "--snapshot", "tomorrow", credentials=str(credentials))
+    assert report["publish_cloud"]["status"] == "skipped"
+
+
+def test_nothing_predicted_creates_no_cloud_table(nb04, run, cloud, monkeypatch, tmp_path):
+    # without travel times every row is dropped by clean_for_reg, so there is nothing to publish
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(200, seed=7))
+    credentials = tmp_path / "credentials.json"
+    credentials.write_text(json.dumps({"password": "secret", "host": "db.example.com"}))
+
+    run("--locations", "REGION^1", credentials=str(credentials))
+    assert not inspect(cloud).has_table("properties_data")
+
+    # once rows are predicted, the table takes the local table's types, whatever the batch holds
+    monkeypatch.setattr(nb04, "scrape", lambda locations, total_results, snapshot: make_raw_listings(400, seed=8))
+    monkeypatch.setattr(nb04, "travel_time", add_travel_times)
+    run("--locations", "REGION^1", "--snapshot", "tomorrow", credentials=str(credentials))
+    local = {col["name"]: str(col["type"]) for col in inspect(sqlq.get_sql_engine(run.db_path)).get_columns("properties_data")}
+    published = {col["name"]: str(col["type"]) for col in inspect(cloud).get_columns("properties_data")}
+    assert published == {name: kind for name, kind in local.items() if name not in nb04.LOCAL_COLUMNS}
+    assert published["id"] != "TEXT"
+    assert inspect(cloud).get_pk_constraint("properties_data")["constrained_columns"] == ["id"]
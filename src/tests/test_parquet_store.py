@@ -0,0 +1,48 @@
+# The Parquet store: a write followed by a read gives back the same frame
+
+
+# IMPORT PACKAGES
+import pandas as pd
+import pytest
+
+from macro_utils import parquet_store as ps
+from macro_utils import sql_queries as sqlq
+
+
+def make_frame():
+    return pd.DataFrame({
+        "countrycode": ["DEU", "DEU", "USA", "USA"],
+        "year": [2000, 2001, 2000, 2001],
+        "value": [1.0, 2.0, 3.0, 4.0],
+        "sector": pd.Categorical(["food", "energy", "food", "energy"]),
+        "count": pd.array([1, None, 3, 4], dtype="Int64"),
+        "series_id": pd.array([7, 7, 9, 9], dtype="int16"),
+    })
+
+
+@pytest.mark.parametrize("partition_cols", [[], ["countrycode"], ["series_id"], ["countrycode", "year"], ["sector"]])
+def test_round_trip(tmp_path, partition_cols):
+    df = make_frame()
+    ps.write_dataset(df, "data", partition_cols=partition_cols, root=str(tmp_path))
+    out = ps.read_dataset("data", root=str(tmp_path))
+    # partitioned rows come back grouped by partition, so compare in a fixed order
+    pd.testing.assert_frame_equal(out.sort_values(["countrycode", "year"], ignore_index=True), df)
+
+
+def test_projected_and_filtered_reads(tmp_path):
+    ps.write_dataset(make_frame(), "data", partition_cols=["countrycode"], root=str(tmp_path))
+    out = ps.read_dataset("data", columns=["year", "countrycode"], where={"countrycode": "USA", "year": (2001, None)},
+                          root=str(tmp_path))
+    assert out.to_dict(orient="list") == {"year": [2001], "countrycode": ["USA"]}
+
+
+def test_sync_with_sql(tmp_path):
+    engine = sqlq.get_sql_engine(str(tmp_path / "test.db"))
+    df = make_frame().drop(columns=["sector", "count"])
+    sqlq.make_table(df, "pwt", engine)
+
+    ps.sync_from_sql("pwt", engine, root=str(tmp_path))
+    assert ps.has_dataset("pwt", root=str(tmp_path))
+    ps.sync_to_sql("pwt", engine, root=str(tmp_path))
+    back = sqlq.read_table("pwt", engine, order_by=["countrycode", "year"])
+    pd.testing.assert_frame_equal(back, df, check_dtype=False)
@@ -0,0 +1,120 @@
+# The stage pipeline: checkpoints are reused until a stage's code, parameters,
+# inputs or fingerprint change
+
+
+# IMPORT PACKAGES
+import os
+
+import pandas as pd
+import pytest
+
+from macro_utils.pipeline import Pipeline, Stage
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+def make_stages(calls, scale=2, fingerprint=None):
+    def load():
+        calls.append("load")
+        return pd.DataFrame({"x": [1, 2, 3]})
+
+    def transform(df, scale):
+        calls.append("transform")
+        return df.assign(y=df["x"] * scale)
+
+    def summarise(df):
+        calls.append("summarise")
+        return {"total": int(df["y"].sum())}
+
+    return [
+        Stage("load", load, fingerprint=fingerprint),
+        Stage("transform", transform, inputs=["load"], params={"scale": scale}),
+        Stage("summarise", summarise, inputs=["transform"]),
+    ]
+
+
+def test_second_run_skips_every_stage(tmp_path, calls):
+    first = Pipeline(make_stages(calls), str(tmp_path)).run()
+    assert {name: row["status"] for name, row in first.items()} == {"load": "ran", "transform": "ran", "summarise": "ran"}
+
+    second = Pipeline(make_stages(calls), str(tmp_path)).run()
+    assert {row["status"] for row in second.values()} == {"skipped"}
+    assert calls == ["load", "transform", "summarise"]
+    assert {name: row["output_hash"] for name, row in second.items()} == \
+        {name: row["output_hash"] for name, row in first.items()}
+
+
+def test_checkpoint_formats(tmp_path, calls):
+    Pipeline(make_stages(calls), str(tmp_path)).run()
+    files = set(os.listdir(tmp_path))
+    assert {"load.json", "load.parquet", "transform.parquet", "summarise.pkl"} <= files
+    assert "summarise.parquet" not in files
+
+
+def test_changed_params_rerun_the_stage_and_its_dependents(tmp_path, calls):
+    Pipeline(make_stages(calls), str(tmp_path)).run()
+    calls.clear()
+    report = Pipeline(make_stages(calls, scale=3), str(tmp_path)).run()
+    assert report["load"]["status"] == "skipped"
+    assert calls == ["transform", "summarise"]
+
+
+def test_unchanged_output_stops_the_rerun(tmp_path, calls):
+    Pipeline(make_stages(calls), str(tmp_path)).run()
+    calls.clear()
+    # load re-runs, but gives the same frame, so nothing downstream has to
+    report = Pipeline(make_stages(calls), str(tmp_path)).run(force=["load"])
+    assert calls == ["load"]
+    assert report["transform"]["status"] == "skipped"
+
+
+def test_changed_fingerprint_reruns_the_stage(tmp_path, calls):
+    state = {"rows": 3}
+    Pipeline(make_stages(calls, fingerprint=lambda: state), str(tmp_path)).run()
+    calls.clear()
+    Pipeline(make_stages(calls, fingerprint=lambda: state), str(tmp_path)).run()
+    assert calls == []
+    state["rows"] = 4
+    Pipeline(make_stages(calls, fingerprint=lambda: state), str(tmp_path)).run()
+    assert calls == ["load"]
+
+
+def test_force_all_and_targets(tmp_path, calls):
+    report = Pipeline(make_stages(calls), str(tmp_path)).run(targets=["transform"])
+    assert set(report) == {"load", "transform"}
+    calls.clear()
+    Pipeline(make_stages(calls), str(tmp_path)).run(force=["all"])
+    assert calls == ["load", "transform", "summarise"]
+
+
+def test_skipped_outputs_are_read_back_when_needed(tmp_path, calls):
+    Pipeline(make_stages(calls), str(tmp_path)).run()
+    calls.clear()
+    # summarise re-runs on its own, reading transform's output from its checkpoint
+    os.remove(tmp_path / "summarise.json")
+    report = Pipeline(make_stages(calls), str(tmp_path)).run()
+    assert calls == ["summarise"]
+    assert report["summarise"]["status"] == "ran"
+    assert Pipeline(make_stages(calls), str(tmp_path)).load_checkpoint("summarise") == {"total": 12}
+
+
+def test_stages_without_checkpoints_always_run(tmp_path, calls):
+    stages = make_stages(calls)
+    stages[0].checkpoint = False
+    Pipeline(stages, str(tmp_path)).run()
+    calls.clear()
+    report = Pipeline(stages, str(tmp_path)).run()
+    assert calls == ["load"]
+    assert not os.path.exists(tmp_path / "load.json")
+    assert report["transform"]["status"] == "skipped"
+
+
+def test_unknown_dependencies_and_cycles_are_refused(tmp_path):
+    with pytest.raises(ValueError, match="unknown stages"):
+        Pipeline([Stage("a", lambda x: x, inputs=["missing"])], str(tmp_path))
+    pipeline = Pipeline([Stage("a", lambda x: x, inputs=["b"]), Stage("b", lambda x: x, inputs=["a"])], str(tmp_path))
+    with pytest.raises(ValueError, match="cycle"):
+        pipeline.run()
@@ -0,0 +1,94 @@
+# The underpriced ranking index, checked against a brute-force sort of the same frame
+
+
+# IMPORT PACKAGES
+import numpy as np
+import pandas as pd
+import pytest
+
+from macro_utils import functions as fn
+from macro_utils.ranking import TRAVEL_TIME_BANDS, UnderpricedIndex
+
+
+def make_listings(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    price = rng.uniform(300, 2000, n)
+    travel_time = rng.uniform(0, 7200, n)  # a quarter of the rows are beyond the last band
+    travel_time[rng.random(n) < 0.05] = np.nan
+    predicted = price + rng.normal(0, 300, n)
+    predicted[rng.random(n) < 0.02] = np.nan
+    subtype = rng.choice(["Flat", "House", "Studio"], n).astype(object)
+    subtype[rng.random(n) < 0.03] = None
+    return pd.DataFrame({
+        "bedrooms": rng.integers(1, 5, n),
+        "propertySubType": subtype,
+        "travel_time": travel_time,
+        "price_per_bed": price,
+        "predicted_price_per_bed": predicted,
+        "displayAddress": [f"{i} High Street" for i in range(n)],
+        "propertyUrl": [f"/properties/{i}" for i in range(n)],
+    })
+
+
+def band_of(travel_time):
+    # the position of the band a travel time falls in, NaN outside every band
+    edges = TRAVEL_TIME_BANDS["travel_time"]
+    return pd.cut(pd.Series(travel_time, dtype="float64"), edges).cat.codes.replace(-1, np.nan).to_numpy()
+
+
+def brute_force(df, k, budget, segment):
+    keep = (df["price_per_bed"] <= budget).to_numpy() & df["predicted_price_per_bed"].notna().to_numpy()
+    for col, value in (segment or {}).items():
+        values = value if isinstance(value, list) else [value]
+        if col == "travel_time":
+            keep &= np.isin(band_of(df[col]), band_of(values)[~np.isnan(band_of(values))])
+        else:
+            keep &= df[col].isin(values).to_numpy()
+    savings = (df["predicted_price_per_bed"] - df["price_per_bed"]).to_numpy()
+    rows = np.flatnonzero(keep)
+    return rows[np.argsort(-savings[rows], kind="stable")][:k]
+
+
+SEGMENTS = [
+    None,
+    {"bedrooms": [1, 2]},
+    {"propertySubType": "Flat"},
+    {"travel_time": 1800},
+    {"bedrooms": 3, "travel_time": [600, 3000]},
+    {"travel_time": 6000},  # beyond the last band: matches no segment
+]
+
+
+@pytest.mark.parametrize("segment", SEGMENTS)
+def test_top_matches_a_brute_force_sort(segment):
+    df = make_listings()
+    index = UnderpricedIndex(df)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        k, budget = int(rng.integers(1, 60)), float(rng.choice([rng.uniform(300, 2000), np.inf]))
+        np.testing.assert_array_equal(index.top(k, budget, segment), brute_force(df, k, budget, segment))
+
+
+def test_rows_outside_every_band_are_still_ranked():
+    df = make_listings()
+    index = UnderpricedIndex(df)
+    unbanded = np.isnan(band_of(df["travel_time"])) & df["predicted_price_per_bed"].notna().to_numpy()
+    assert len(index) == df["predicted_price_per_bed"].notna().sum()
+    assert unbanded[index.top(len(df))].sum() == unbanded.sum()
+    assert unbanded[index.top(len(df), segment={"propertySubType": ["Flat", "House", "Studio"]})].any()
+
+
+def test_matches_find_underpriced(capsys):
+    df = make_listings()
+    index = UnderpricedIndex(df)
+    for budget in [500, 1000, 1500]:
+        expected = fn.find_underpriced(df, budget, k=25)
+        pd.testing.assert_frame_equal(index.recommend(25, budget), expected)
+
+
+def test_segments_whose_rows_have_no_savings():
+    df = make_listings(200)
+    df.loc[df["bedrooms"] == 4, "predicted_price_per_bed"] = np.nan
+    index = UnderpricedIndex(df)
+    assert len(index.top(10, segment={"bedrooms": 4})) == 0
+    np.testing.assert_array_equal(index.top(10, segment={"bedrooms": 3}), brute_force(df, 10, np.inf, {"bedrooms": 3}))
@@ -0,0 +1,72 @@
+# RentModel: the running statistics match a full OLS fit, and saved states load back
+
+
+# IMPORT PACKAGES
+import numpy as np
+import pandas as pd
+import pytest
+
+from macro_utils import sql_queries as sqlq
+from macro_utils.rent_model import RentModel, FEATURES, TARGET
+
+
+def make_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({"travel_time": rng.uniform(60, 5400, n), "bathrooms": rng.integers(1, 4, n).astype(float)})
+    df[TARGET] = 1500 - 0.1 * df["travel_time"] + 200 * df["bathrooms"] + rng.normal(0, 50, n)
+    return df
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return sqlq.get_sql_engine(str(tmp_path / "model.db"))
+
+
+def test_updates_match_a_full_fit():
+    first, second = make_rows(300, seed=1), make_rows(200, seed=2)
+    model = RentModel().update(first).update(second)
+
+    both = pd.concat([first, second])
+    X = np.column_stack([np.ones(len(both)), both[FEATURES].to_numpy()])
+    expected = np.linalg.lstsq(X, both[TARGET].to_numpy(), rcond=None)[0]
+    np.testing.assert_allclose(model.coefficients, expected, rtol=1e-8)
+    assert model.n == 500
+    assert model.version == 2
+
+
+def test_save_and_load_round_trip(engine):
+    model = RentModel().update(make_rows(100))
+    model.save(engine)
+
+    loaded = RentModel.load(engine)
+    assert loaded.version == model.version
+    assert loaded.n == 100
+    np.testing.assert_allclose(loaded.xtx, model.xtx)
+    np.testing.assert_allclose(loaded.xty, model.xty)
+    np.testing.assert_allclose(loaded.predict(make_rows(5, seed=3)), model.predict(make_rows(5, seed=3)))
+
+
+def test_load_without_saved_state_is_empty(engine):
+    model = RentModel.load(engine)
+    assert model.n == 0 and model.version == 0
+
+
+def test_full_refit_becomes_the_latest_version(engine):
+    # three incremental updates, saved as versions 1-3
+    model = RentModel()
+    for seed in range(3):
+        model.update(make_rows(100, seed=seed)).save(engine)
+    assert RentModel.load(engine).n == 300
+
+    # a refit from scratch starts at version 0, but is saved after them
+    refit = RentModel().update(make_rows(400, seed=9))
+    refit.save(engine)
+    loaded = RentModel.load(engine)
+    assert loaded.version == 4
+    assert loaded.n == 400
+
+
+def test_specifications_are_kept_apart(engine):
+    RentModel(["travel_time"]).update(make_rows(50)).save(engine)
+    assert RentModel.load(engine).n == 0
+    assert RentModel.load(engine, ["travel_time"]).n == 50
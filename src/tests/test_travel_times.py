@@ -0,0 +1,107 @@
+# fetch_travel_times with a CommuteCache, against a local stub of the TravelTime API
+
+
+# IMPORT PACKAGES
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from macro_utils import functions as rent
+from macro_utils import instrumentation as instr
+from macro_utils.commute_cache import CommuteCache
+
+
+class TravelTimeHandler(BaseHTTPRequestHandler):
+    """Replies to every arrival location with a travel time of 1000s plus its id."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.payloads.append(payload)
+        search = payload["arrival_searches"]["one_to_many"][0]
+        locations = [{"id": i, "properties": [{"travel_time": 1000 + int(i), "distance": 5000}]}
+                     for i in search["arrival_location_ids"]]
+        body = json.dumps({"results": [{"search_id": search["id"], "locations": locations}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), TravelTimeHandler)
+    httpd.payloads = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def stub_api(server, monkeypatch):
+    server.payloads.clear()
+    monkeypatch.setattr(rent, "TRAVELTIME_URL", f"http://127.0.0.1:{server.server_address[1]}/v4/time-filter")
+
+
+def properties():
+    # ids 1 and 2 share a grid cell; 3 is in another
+    return pd.DataFrame({"id": [1, 2, 3], "latitude": [51.50001, 51.50002, 51.6],
+                         "longitude": [-0.1, -0.1, -0.2]}, index=[10, 11, 12])
+
+
+def fetch(df, **kwargs):
+    return asyncio.run(rent.fetch_travel_times(df, "app", "key", **kwargs))
+
+
+def test_without_cache_every_property_is_queried(server):
+    result = fetch(properties())
+    assert result["travel_time"].tolist() == [1001, 1002, 1003]
+    assert server.payloads[0]["arrival_searches"]["one_to_many"][0]["arrival_location_ids"] == ["1", "2", "3"]
+
+
+def test_cache_queries_one_property_per_cell(server):
+    cache = CommuteCache()
+    result = fetch(properties(), cache=cache)
+    # the first property of each cell was queried, and shared with its cell
+    assert result.index.tolist() == [10, 11, 12]
+    assert result["travel_time"].tolist() == [1001, 1001, 1003]
+    assert [p["arrival_searches"]["one_to_many"][0]["arrival_location_ids"] for p in server.payloads] == [["1", "3"]]
+
+    # a second lookup is served from the cache alone
+    again = fetch(properties(), cache=cache)
+    assert again["travel_time"].tolist() == [1001, 1001, 1003]
+    assert len(server.payloads) == 1
+
+
+@pytest.mark.parametrize("settings", [{"transportation_type": "cycling"}, {"origin": (51.5, -0.12)},
+                                      {"arrival_time_period": "weekday_evening"}])
+def test_cache_for_another_journey_is_refused(server, settings):
+    with pytest.raises(ValueError, match="CommuteCache holds"):
+        fetch(properties(), cache=CommuteCache(**settings))
+    assert server.payloads == []
+
+
+def test_query_mode_must_match_the_cache(server):
+    with pytest.raises(ValueError):
+        fetch(properties(), transportation_type="driving", cache=CommuteCache(transportation_type="public_transport"))
+    result = fetch(properties(), transportation_type="driving", cache=CommuteCache(transportation_type="driving"))
+    assert result["travel_time"].notna().all()
+    assert server.payloads[0]["arrival_searches"]["one_to_many"][0]["transportation"] == {"type": "driving"}
+
+
+def test_cached_fetch_is_one_span(server):
+    instr.enable()
+    try:
+        fetch(properties(), cache=CommuteCache())
+        span = instr.metrics.spans["travel_time.fetch"]
+    finally:
+        instr.disable()
+    assert span["calls"] == 1 and span["rows"] == 3